@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sms_backend.settings')
 
 application = get_asgi_application()
+
+if settings.ASYNC_READ_VIEWS:
+    from students.async_views import AsyncReadApplication
+
+    application = AsyncReadApplication(application)
@@ -1,6 +1,7 @@
 # StudentManagementSystem/sms_backend/settings.py
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 import dj_database_url # Import for PostgreSQL database configuration
 
@@ -45,7 +46,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     # WhiteNoise must be listed directly after SecurityMiddleware for proper static file serving
-    'whitenoise.middleware.WhiteNoiseMiddleware', # This is where it belongs
+    'students.middleware.StaticFilesMiddleware', # WhiteNoise; this is where it belongs
+    'students.performance.PerformanceMiddleware', # Inactive unless PERF_MONITORING is set
+    'students.middleware.CompressionMiddleware', # gzip/Brotli for large /api/ responses
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +95,69 @@ if 'DATABASE_URL' in os.environ:
         default=os.environ.get('DATABASE_URL')
     )
 
+# Connection profile, tunable through the environment.
+# PostgreSQL: Django's connection pool when psycopg 3 with psycopg_pool is installed (DB_POOL=0 turns
+# it off), each connection checked before it is handed out; otherwise persistent connections kept for
+# DB_CONN_MAX_AGE seconds, health-checked before reuse.
+# SQLite: WAL journaling so readers never wait for the writer, synchronous=NORMAL (safe with WAL, and
+# no fsync per commit), a busy timeout instead of immediate "database is locked" errors, memory-mapped
+# reads, and BEGIN IMMEDIATE so writers queue on the timeout rather than deadlock upgrading a read lock.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+database = DATABASES['default']
+database.setdefault('OPTIONS', {})
+if database['ENGINE'] in ('django.db.backends.postgresql', 'django.db.backends.postgresql_psycopg2'):
+    database['ENGINE'] = 'django.db.backends.postgresql'
+    if os.environ.get('DB_POOL', '1').lower() in ('1', 'true', 'yes') and find_spec('psycopg_pool'):
+        from psycopg_pool import ConnectionPool
+
+        database['CONN_MAX_AGE'] = 0 # Connections go back to the pool after each request
+        database['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)), # Seconds to wait for a free connection
+            'check': ConnectionPool.check_connection,
+        }
+    else:
+        database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+        database['CONN_HEALTH_CHECKS'] = True
+elif database['ENGINE'] == 'django.db.backends.sqlite3':
+    database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE # The pragmas below then run once per connection
+    database['OPTIONS'].update({
+        'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5)), # Seconds
+        'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        'init_command': ';'.join([
+            f"PRAGMA journal_mode={os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')}",
+            f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+            f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+            # Re-analyzes tables whose size changed a lot since their statistics were taken (or that
+            # have none), so the planner keeps choosing the index walks; cheap when nothing changed.
+            f"PRAGMA optimize={os.environ.get('SQLITE_OPTIMIZE', '0x10002')}",
+        ]),
+    })
+
+
+# Cache (used for API response caching, see students/caching.py)
+# The local-memory default is per process. That is fine for the response bodies, whose keys
+# carry the versions of the data they show, but those versions must be shared by every process
+# that writes or serves the API (the gunicorn workers and the job worker of the Procfile), or
+# a write in one leaves the others serving stale responses. API_CACHE_VERSIONS picks where they
+# live: 'cache' (only with a shared cache, i.e. REDIS_URL) or 'database' (the students_cacheversion
+# table; one more query per cached read). Set REDIS_URL in production.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sms-api',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+if 'REDIS_URL' in os.environ:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+API_CACHE_VERSIONS = os.environ.get('API_CACHE_VERSIONS', 'cache' if 'REDIS_URL' in os.environ else 'database')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -145,6 +211,68 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST Framework
+# Pagination is opt-in per request: send ?page_size=N (or follow a returned ?cursor=) to page through results.
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'students.pagination.KeysetPagination',
+    # Response formats picked by the Accept header (or ?format=); see students/formats.py
+    'DEFAULT_RENDERER_CLASSES': [
+        'students.formats.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'students.formats.ColumnarRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'students.formats.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'students.formats.ColumnarParser',
+    ],
+}
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('students.formats.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('students.formats.MessagePackParser')
+
+# /api/ responses of at least this many bytes are compressed (students.middleware.CompressionMiddleware),
+# with Brotli at API_BROTLI_QUALITY when the client accepts it and the brotli package is installed, else gzip.
+API_COMPRESS_MIN_SIZE = int(os.environ.get('API_COMPRESS_MIN_SIZE', 1024))
+API_BROTLI_QUALITY = int(os.environ.get('API_BROTLI_QUALITY', 4))
+
+# Change feed (/api/changes/): on PostgreSQL, entries are held back while an older writing transaction
+# is still open, plus this many seconds, so that a client never moves its cursor past a change that has
+# not committed yet (see students.changes._settle_cutoff). The margin must exceed the clock skew between
+# the web and database servers. SQLite commits one writer at a time and needs none.
+CHANGE_FEED_SETTLE_SECONDS = float(os.environ.get(
+    'CHANGE_FEED_SETTLE_SECONDS', 2 if database['ENGINE'] == 'django.db.backends.postgresql' else 0,
+))
+
+# Serve the list/detail reads of the four viewsets from async views (students/async_views.py).
+# Only worth it under an ASGI server, e.g.:
+#   ASYNC_READ_VIEWS=1 uvicorn sms_backend.asgi:application --workers 4
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '').lower() in ('1', 'true', 'yes')
+# Threads per process running their queries and rendering; each may hold a database connection
+# while busy, so on PostgreSQL keep it near DB_POOL_MAX_SIZE.
+ASYNC_READ_THREADS = int(os.environ.get('ASYNC_READ_THREADS', 10))
+# Middleware for the anonymous JSON reads those views answer (see students.async_views.ReadHandler)
+ASYNC_READ_MIDDLEWARE = [
+    'students.middleware.SecurityMiddleware',
+    'students.performance.PerformanceMiddleware',
+    'students.middleware.CompressionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+]
+
+# Per-request instrumentation (students/performance.py): Server-Timing headers, logging of slow
+# requests, slow queries and repeated query shapes (N+1), and the staff-only /api/performance/ report.
+PERF_MONITORING = os.environ.get('PERF_MONITORING', '').lower() in ('1', 'true', 'yes')
+PERF_SLOW_REQUEST_MS = float(os.environ.get('PERF_SLOW_REQUEST_MS', 500))
+PERF_SLOW_QUERY_MS = float(os.environ.get('PERF_SLOW_QUERY_MS', 100))
+PERF_REPEATED_QUERY_THRESHOLD = int(os.environ.get('PERF_REPEATED_QUERY_THRESHOLD', 10))
+
+# Background jobs (students/jobs.py), run by `manage.py run_workers`. Uploaded import files
+# and finished exports are kept under JOB_FILES_DIR until the job is deleted. Running jobs whose
+# worker process has not checked in for JOB_STALE_SECONDS (it crashed or was killed) are requeued.
+JOB_FILES_DIR = os.environ.get('JOB_FILES_DIR', os.path.join(BASE_DIR, 'job_files'))
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 120))
+
 # CORS Configuration for both local and production environments
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:8000", # For local development if backend is on 8000
@@ -3,7 +3,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from students.views import StudentViewSet, SubjectViewSet, EnrollmentViewSet, GradeViewSet
+from students.views import StudentViewSet, SubjectViewSet, EnrollmentViewSet, GradeViewSet, ChangeFeedViewSet, PerformanceViewSet, JobViewSet
 # Import TemplateView to serve index.html
 from django.views.generic.base import TemplateView
 # Import settings and os to get the BASE_DIR
@@ -16,6 +16,9 @@ router.register(r'students', StudentViewSet)
 router.register(r'subjects', SubjectViewSet)
 router.register(r'enrollments', EnrollmentViewSet)
 router.register(r'grades', GradeViewSet)
+router.register(r'changes', ChangeFeedViewSet, basename='change')
+router.register(r'performance', PerformanceViewSet, basename='performance')
+router.register(r'jobs', JobViewSet)
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
@@ -23,4 +26,8 @@ urlpatterns = [
     path('api/', include(router.urls)), # Our API endpoints
     # Add a URL pattern for the root path to serve index.html
     path('', TemplateView.as_view(template_name='index.html'), name='home'),
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # Async list/detail reads for ASGI workers (students/async_urls.py), ahead of the router
+    urlpatterns.insert(1, path('api/', include('students.async_urls')))
@@ -1,29 +1,101 @@
 from django.contrib import admin
-from .models import Student, Subject, Enrollment, Grade
+from django.db.models import Q
+from .jobs import JOB_KINDS
+from .models import Student, Subject, Enrollment, Grade, Job
+from .search import matching_ids, tokenize
 
 # Register your models here so they appear in the Django admin interface.
 
+class IndexedSearchMixin:
+    """
+    Answers the changelist search box from the search index (students/search.py)
+    instead of LIKE '%...%' scans. `search_index_paths` maps the lookup leading to
+    a Student or Subject (e.g. 'student' or 'enrollment__subject') to that model.
+    As with search_fields, every word has to match, but each may match a different
+    model: "juan math" finds Juan's enrollment in Mathematics.
+    """
+    search_index_paths = {}
+
+    def get_search_results(self, request, queryset, search_term):
+        tokens = tokenize(search_term)
+        if not tokens:
+            return queryset, False # Nothing searchable in the term
+        for token in tokens:
+            condition = Q()
+            for path, model in self.search_index_paths.items():
+                condition |= Q(**{f'{path}__in': matching_ids(model, token)})
+            queryset = queryset.filter(condition)
+        return queryset, False
+
+class GradeSubjectFilter(admin.SimpleListFilter):
+    """
+    Filters grades by subject through a subquery on the enrollments, so the database
+    walks the grades by enrollment index instead of sorting the joined rows.
+    """
+    title = 'subject'
+    parameter_name = 'subject'
+
+    def lookups(self, request, model_admin):
+        return Subject.objects.order_by('name').values_list('pk', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(enrollment__in=Enrollment.objects.filter(subject=self.value()).values('pk'))
+
+class JobKindFilter(admin.SimpleListFilter):
+    """
+    Offers the known job kinds instead of reading the distinct kinds off every job row.
+    """
+    title = 'kind'
+    parameter_name = 'kind'
+
+    def lookups(self, request, model_admin):
+        return [(kind, kind) for kind in JOB_KINDS]
+
+    def queryset(self, request, queryset):
+        return queryset if self.value() is None else queryset.filter(kind=self.value())
+
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'student_id', 'email', 'date_of_birth')
     search_fields = ('name', 'student_id', 'email')
+    search_index_paths = {'pk': Student}
     list_filter = ('date_of_birth',)
 
 @admin.register(Subject)
-class SubjectAdmin(admin.ModelAdmin):
-    list_display = ('name', 'code')
+class SubjectAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('name', 'code', 'passing_grade')
     search_fields = ('name', 'code')
+    search_index_paths = {'pk': Subject}
+    fieldsets = (
+        (None, {'fields': ('name', 'code')}),
+        # Saving a changed weight or rounding recomputes the subject's total grades
+        ('Grading policy', {'fields': (
+            ('activity_weight', 'quiz_weight', 'exam_weight'), ('total_decimals', 'rounding'), 'passing_grade',
+        )}),
+    )
 
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
+class EnrollmentAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('student', 'subject', 'enrollment_date')
     list_filter = ('subject', 'enrollment_date')
+    ordering = ('-enrollment_date', '-id') # Newest first, read off the enrollment date indexes
     search_fields = ('student__name', 'subject__name')
+    search_index_paths = {'student': Student, 'subject': Subject}
     raw_id_fields = ('student', 'subject') # Makes it easier to select related objects
 
 @admin.register(Grade)
-class GradeAdmin(admin.ModelAdmin):
+class GradeAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('enrollment', 'activity_grade', 'quiz_grade', 'exam_grade', 'total_grade')
-    list_filter = ('enrollment__subject',)
+    list_filter = (GradeSubjectFilter,)
+    ordering = ('-enrollment',) # Newest enrollments first, read off the foreign key's index
     search_fields = ('enrollment__student__name', 'enrollment__subject__name')
-    raw_id_fields = ('enrollment',) # Makes it easier to select related objects
\ No newline at end of file
+    search_index_paths = {'enrollment__student': Student, 'enrollment__subject': Subject}
+    raw_id_fields = ('enrollment',) # Makes it easier to select related objects
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'total', 'attempts', 'created_at', 'finished_at')
+    list_filter = (JobKindFilter, 'status')
+    readonly_fields = ('input_file', 'output_file', 'worker', 'started_at', 'heartbeat_at', 'finished_at')
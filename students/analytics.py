@@ -0,0 +1,177 @@
+import math
+
+from django.db.models import Avg, Count, DecimalField, ExpressionWrapper, F, FloatField, Max, Min, Q, Value, Window
+from django.db.models.functions import Cast, Floor, PercentRank, Rank, RowNumber
+
+from .models import Grade
+
+GRADE_FIELDS = ('activity_grade', 'quiz_grade', 'exam_grade', 'total_grade')
+
+
+def _round(value):
+    return None if value is None else round(float(value), 2)
+
+
+def grade_medians(grades, field):
+    """
+    Returns {subject_id: median of `field`} computed in the database.
+
+    Each subject's grades are numbered with ROW_NUMBER() and only the middle row
+    (or the two middle rows for an even count) are fetched, so at most two rows
+    per subject ever reach Python.
+    """
+    subject = F('enrollment__subject_id')
+    middle = (
+        grades
+        .annotate(
+            subject=subject,
+            position=Window(RowNumber(), partition_by=subject, order_by=F(field).asc()),
+            size=Window(Count('id'), partition_by=subject),
+        )
+        .filter(Q(position=(F('size') + 1) / 2) | Q(position=(F('size') + 2) / 2))
+        .values_list('subject', field)
+    )
+    values = {}
+    for subject_id, value in middle:
+        values.setdefault(subject_id, []).append(value)
+    return {subject_id: sum(pair) / len(pair) for subject_id, pair in values.items()}
+
+
+def subject_stats(subject_ids=None, passing_grade=None):
+    """
+    Returns per-subject count, pass rate and mean/median/min/max/stddev of every
+    grade component, using one GROUP BY query plus one window query per component.
+    Pass rates use each subject's own passing grade unless `passing_grade` is given.
+    """
+    grades = Grade.objects.all()
+    if subject_ids is not None:
+        grades = grades.filter(enrollment__subject_id__in=subject_ids)
+
+    aggregates = {
+        'count': Count('id'),
+        'passed': Count('id', filter=Q(total_grade__gte=F('threshold'))),
+    }
+    for field in GRADE_FIELDS:
+        aggregates[f'{field}__mean'] = Avg(field)
+        aggregates[f'{field}__min'] = Min(field)
+        aggregates[f'{field}__max'] = Max(field)
+        # Population stddev as sqrt(E[x^2] - E[x]^2): plain SQL on every backend,
+        # where StdDev() falls back to a Python aggregate on SQLite.
+        aggregates[f'{field}__squares'] = Avg(
+            ExpressionWrapper(F(field) * F(field), output_field=FloatField())
+        )
+    rows = (
+        grades
+        .values(
+            subject=F('enrollment__subject_id'),
+            threshold=F('enrollment__subject__passing_grade') if passing_grade is None else Value(passing_grade),
+        )
+        .annotate(**aggregates)
+        .order_by('subject')
+    )
+    medians = {field: grade_medians(grades, field) for field in GRADE_FIELDS}
+
+    results = []
+    for row in rows:
+        subject_id = row['subject']
+        stats = {
+            'subject': subject_id,
+            'count': row['count'],
+            'passed': row['passed'],
+            'pass_rate': _round(row['passed'] / row['count']) if row['count'] else None,
+            'passing_grade': _round(row['threshold']),
+        }
+        for field in GRADE_FIELDS:
+            mean, squares = row[f'{field}__mean'], row[f'{field}__squares']
+            stddev = None if mean is None else math.sqrt(max(0.0, squares - float(mean) ** 2))
+            stats[field] = {
+                'mean': _round(row[f'{field}__mean']),
+                'median': _round(medians[field].get(subject_id)),
+                'min': _round(row[f'{field}__min']),
+                'max': _round(row[f'{field}__max']),
+                'stddev': _round(stddev),
+            }
+        results.append(stats)
+    return results
+
+
+def grade_distribution(subject_id, field='total_grade', bucket_size=10):
+    """
+    Returns histogram buckets [{'start', 'end', 'count'}] of `field` for a subject,
+    grouped with FLOOR(value / bucket_size) in the database.
+    """
+    bucket = Cast(
+        Floor(ExpressionWrapper(F(field) / bucket_size, output_field=DecimalField())),
+        output_field=FloatField(),
+    )
+    rows = (
+        Grade.objects
+        .filter(enrollment__subject_id=subject_id)
+        .values(bucket=bucket)
+        .annotate(count=Count('id'))
+        .order_by('bucket')
+    )
+    return [
+        {'start': _round(row['bucket'] * bucket_size), 'end': _round((row['bucket'] + 1) * bucket_size), 'count': row['count']}
+        for row in rows
+    ]
+
+
+def student_ranking(subject_id, student_id):
+    """
+    Returns one student's rank and percentile within a subject, matching the
+    RANK()/PERCENT_RANK() semantics of subject_rankings() with a single aggregate
+    query instead of ranking the whole subject.
+    """
+    grades = Grade.objects.filter(enrollment__subject_id=subject_id)
+    row = (
+        grades.filter(enrollment__student_id=student_id)
+        .values(
+            'total_grade',
+            student=F('enrollment__student_id'),
+            student_id=F('enrollment__student__student_id'),
+            name=F('enrollment__student__name'),
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    counts = grades.aggregate(
+        size=Count('id'),
+        above=Count('id', filter=Q(total_grade__gt=row['total_grade'])),
+        below=Count('id', filter=Q(total_grade__lt=row['total_grade'])),
+    )
+    percentile = counts['below'] / (counts['size'] - 1) if counts['size'] > 1 else 0
+    return {
+        'rank': counts['above'] + 1,
+        'percentile': _round(percentile * 100),
+        **row,
+        'total_grade': _round(row['total_grade']),
+    }
+
+
+def subject_rankings(subject_id, limit=None):
+    """
+    Ranks a subject's students by total_grade with RANK() and PERCENT_RANK().
+    """
+    rows = (
+        Grade.objects
+        .filter(enrollment__subject_id=subject_id)
+        .annotate(
+            rank=Window(Rank(), order_by=F('total_grade').desc()),
+            percentile=Window(PercentRank(), order_by=F('total_grade').asc()),
+        )
+        .values(
+            'rank', 'percentile', 'total_grade',
+            student=F('enrollment__student_id'),
+            student_id=F('enrollment__student__student_id'),
+            name=F('enrollment__student__name'),
+        )
+        .order_by('rank', 'enrollment__student__name')
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    return [
+        {**row, 'total_grade': _round(row['total_grade']), 'percentile': _round(row['percentile'] * 100)}
+        for row in rows
+    ]
@@ -0,0 +1,18 @@
+from django.urls import path
+
+from .async_views import read_view
+from .views import StudentViewSet, SubjectViewSet, EnrollmentViewSet, GradeViewSet
+
+# Async list/detail routes, mounted ahead of the router when ASYNC_READ_VIEWS is set.
+# Detail routes only match numeric ids, so extra actions like students/search/ still reach the router.
+urlpatterns = []
+for prefix, viewset in (
+    ('students', StudentViewSet),
+    ('subjects', SubjectViewSet),
+    ('enrollments', EnrollmentViewSet),
+    ('grades', GradeViewSet),
+):
+    urlpatterns += [
+        path(f'{prefix}/', read_view(viewset, detail=False)),
+        path(f'{prefix}/<int:pk>/', read_view(viewset, detail=True)),
+    ]
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+
+from .formats import FastJSONRenderer
+
+# The router's method -> action maps for list and detail routes
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+# Query parameters the async path understands; anything else is left to the viewset
+ASYNC_PARAMS = {'cursor', 'page_size', 'fields', 'expand'}
+JSON_TYPES = {'*/*', 'application/*', 'application/json'}
+
+renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), content_type=renderer.media_type, status=status)
+
+
+def serves_async(method, params, accept, viewset_class):
+    """
+    The async path covers plain JSON reads that need no authentication. Writes, the
+    browsable API, other query parameters and viewsets with permission checks (which
+    would load the user synchronously) go to the DRF viewset.
+    """
+    if method != 'GET' or not set(params) <= ASYNC_PARAMS:
+        return False
+    accepted = {part.split(';')[0].strip() for part in (accept or '*/*').split(',')}
+    if 'text/html' in accepted or not accepted & JSON_TYPES:
+        return False
+    return all(permission is AllowAny for permission in viewset_class.permission_classes)
+
+
+_executor = None
+
+
+def read_executor():
+    """
+    The thread pool the async reads run their sync work in, ASYNC_READ_THREADS threads
+    shared by all requests of this process. asyncio's default executor has only
+    min(32, CPUs + 4) threads, so a few slow queries would hold up every read.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_READ_THREADS, thread_name_prefix='async-read')
+    return _executor
+
+
+def _in_worker(function):
+    def run(*args, **kwargs):
+        close_old_connections() # Honour CONN_MAX_AGE, as at a request boundary
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections() # Returns a pooled connection instead of holding it while idle
+
+    # Runs on a long-lived pool rather than in a fresh thread per request, so each
+    # thread keeps its own database connection between requests (unless pooled).
+    return sync_to_async(run, thread_sensitive=False, executor=read_executor())
+
+
+def list_response(viewset):
+    return json_response(viewset.list_data())
+
+
+def retrieve_response(viewset):
+    queryset = viewset.filter_queryset(viewset.get_queryset())
+    value = viewset.kwargs[viewset.lookup_url_kwarg or viewset.lookup_field]
+    try:
+        obj = queryset.get(**{viewset.lookup_field: value})
+    except (queryset.model.DoesNotExist, ValueError, TypeError, ValidationError):
+        raise NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+    return json_response(viewset.get_serializer(obj).data)
+
+
+def read_view(viewset_class, detail):
+    """
+    Returns an async view for a viewset's list or detail route. GET requests are
+    answered through the viewset's own queryset, serializer, pagination and response
+    cache, so the output is identical to the sync view; everything else is handed to
+    the sync viewset.
+    """
+    sync_view = sync_to_async(viewset_class.as_view(DETAIL_ACTIONS if detail else LIST_ACTIONS))
+    action = 'retrieve' if detail else 'list'
+    handler = retrieve_response if detail else list_response
+
+    async def view(request, **kwargs):
+        if not serves_async(request.method, request.GET, request.headers.get('Accept'), viewset_class):
+            return await sync_view(request, **kwargs)
+
+        drf_request = Request(request)
+        drf_request.accepted_renderer, drf_request.accepted_media_type = renderer, renderer.media_type
+        viewset = viewset_class(action=action, args=(), kwargs=kwargs, format_kwarg=None, headers={})
+        viewset.request = drf_request
+        try:
+            # Cache lookup, queries and rendering happen in one hop to a worker thread
+            return await _in_worker(viewset.cached_read)(drf_request, lambda: handler(viewset))
+        except APIException as exc:
+            return json_response({'detail': exc.detail}, status=exc.status_code)
+
+    view.viewset_class = viewset_class
+    return csrf_exempt(view)
+
+
+class ReadHandler(ASGIHandler):
+    """
+    ASGIHandler with the shorter ASYNC_READ_MIDDLEWARE chain. Sessions, authentication,
+    CSRF and messages are not needed by anonymous JSON reads, and each of those
+    middleware would cost two thread switches per request under ASGI.
+    """
+
+    def load_middleware(self, is_async=False):
+        # BaseHandler builds the chain from settings.MIDDLEWARE; swap it in for the build only
+        middleware = settings.MIDDLEWARE
+        settings.MIDDLEWARE = settings.ASYNC_READ_MIDDLEWARE
+        try:
+            super().load_middleware(is_async)
+        finally:
+            settings.MIDDLEWARE = middleware
+
+
+class AsyncReadApplication:
+    """
+    ASGI application sending the requests the async read views answer themselves
+    (see serves_async) through ReadHandler, and everything else to `application`.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.read_handler = ReadHandler()
+
+    def is_async_read(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return False
+        path = scope['path'][len(scope.get('root_path', '')):]
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return False
+        viewset_class = getattr(match.func, 'viewset_class', None)
+        if viewset_class is None:
+            return False
+        params = [name for name, _ in parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)]
+        accept = next((value.decode('latin-1') for name, value in scope['headers'] if name == b'accept'), None)
+        return serves_async('GET', params, accept, viewset_class)
+
+    async def __call__(self, scope, receive, send):
+        if self.is_async_read(scope):
+            return await self.read_handler(scope, receive, send)
+        return await self.application(scope, receive, send)
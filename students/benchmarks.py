@@ -0,0 +1,349 @@
+import http.client
+import json
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .caching import invalidate_all
+from .grading import ROUND_DOWN, ROUND_HALF_UP
+from .models import Student, Subject, Enrollment, Grade
+
+# One benchmarked request. `data` may be a callable returning a fresh payload (uploads are consumed).
+# Writes run inside a transaction that is rolled back, so every iteration sees the same data.
+# Full-table cases (unpaginated lists, exports) only run when asked for.
+Case = namedtuple('Case', 'name method path data format write full', defaults=(None, None, False, False))
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[rank - 1]
+
+
+def build_cases():
+    """
+    Returns a Case for every public /api/ endpoint, pointed at rows of the current database.
+    Left out: the staff-only performance report, and the actions on a single job, which need a job
+    in a given state.
+    """
+    student = Student.objects.order_by('id')[Student.objects.count() // 2]
+    subject = Subject.objects.annotate(size=Count('enrollments')).order_by('-size', 'id').first()
+    grade = Grade.objects.filter(enrollment__student=student).select_related('enrollment__subject').first()
+    enrollment = grade.enrollment
+    newcomers = list(
+        Student.objects.exclude(enrollments__subject=subject).order_by('id').values_list('id', flat=True)[:100]
+    )
+    class_grades = [
+        {'id': pk, 'version': version, 'exam_grade': str(exam)}
+        for pk, version, exam in Grade.objects.filter(enrollment__subject=subject).order_by('id')
+        .values_list('id', 'version', 'exam_grade')[:100]
+    ]
+    import_rows = list(
+        Grade.objects.filter(enrollment__subject=subject).order_by('id')
+        .values_list('enrollment__student__student_id', 'activity_grade', 'quiz_grade', 'exam_grade')[:1000]
+    )
+
+    def grades_csv():
+        lines = ['student_id,code,activity_grade,quiz_grade,exam_grade']
+        lines += [f'{sid},{subject.code},{a},{q},{e}' for sid, a, q, e in import_rows]
+        return {'file': SimpleUploadedFile('grades.csv', '\n'.join(lines).encode())}
+
+    prefix = student.name.split()[0][:3]
+    return [
+        Case('students.list.page', 'get', '/api/students/?page_size=100'),
+        Case('students.list.narrow', 'get', '/api/students/?page_size=100&fields=id,name,student_id'),
+        Case('students.list', 'get', '/api/students/', full=True),
+        Case('students.detail', 'get', f'/api/students/{student.id}/'),
+        Case('students.summary', 'get', f'/api/students/{student.id}/summary/'),
+        Case('students.search', 'get', f'/api/students/search/?q={prefix}'),
+        Case('students.export', 'get', '/api/students/export/', full=True),
+        Case('students.update', 'patch', f'/api/students/{student.id}/', {'name': student.name}, 'json', write=True),
+        Case('subjects.list', 'get', '/api/subjects/'),
+        Case('subjects.detail', 'get', f'/api/subjects/{subject.id}/'),
+        Case('subjects.summary', 'get', f'/api/subjects/{subject.id}/summary/'),
+        Case('subjects.search', 'get', f'/api/subjects/search/?q={subject.name[:4]}'),
+        Case('subjects.gradebook', 'get', f'/api/subjects/{subject.id}/gradebook/', full=True),
+        Case('subjects.stats.list', 'get', '/api/subjects/stats/'),
+        Case('subjects.stats', 'get', f'/api/subjects/{subject.id}/stats/'),
+        Case('subjects.distribution', 'get', f'/api/subjects/{subject.id}/distribution/'),
+        Case('subjects.rankings', 'get', f'/api/subjects/{subject.id}/rankings/'),
+        Case('subjects.policy', 'get', f'/api/subjects/{subject.id}/policy/'),
+        Case( # A changed rounding recomputes every total_grade of the subject
+            'subjects.policy.update', 'patch', f'/api/subjects/{subject.id}/policy/',
+            {'rounding': ROUND_DOWN if subject.rounding != ROUND_DOWN else ROUND_HALF_UP}, 'json', write=True,
+        ),
+        Case('enrollments.list.page', 'get', '/api/enrollments/?page_size=100'),
+        Case('enrollments.list', 'get', '/api/enrollments/', full=True),
+        Case('enrollments.detail', 'get', f'/api/enrollments/{enrollment.id}/'),
+        Case('enrollments.export', 'get', '/api/enrollments/export/', full=True),
+        Case(
+            'enrollments.bulk', 'post', '/api/enrollments/bulk/',
+            {'subject': subject.id, 'students': newcomers}, 'json', write=True,
+        ),
+        Case('grades.list.page', 'get', '/api/grades/?page_size=100'),
+        Case('grades.list', 'get', '/api/grades/', full=True),
+        Case('grades.list.columnar', 'get', '/api/grades/?format=columnar', full=True),
+        Case('grades.detail', 'get', f'/api/grades/{grade.id}/'),
+        Case(
+            'grades.update', 'patch', f'/api/grades/{grade.id}/',
+            {'exam_grade': str(grade.exam_grade)}, 'json', write=True,
+        ),
+        Case('grades.batch', 'post', '/api/grades/batch/', {'grades': class_grades}, 'json', write=True),
+        Case('grades.import', 'post', '/api/grades/import/', grades_csv, 'multipart', write=True),
+        Case('changes.latest', 'get', '/api/changes/latest/'),
+        Case('changes.list', 'get', '/api/changes/?since=0&limit=1000'),
+        Case('jobs.list', 'get', '/api/jobs/'),
+        Case('jobs.create', 'post', '/api/jobs/', {'kind': 'recompute_totals', 'subject': subject.id}, 'json', write=True),
+    ]
+
+
+def request(client, case):
+    """
+    Sends one request and reads the whole body, so streamed responses are timed in full.
+    Returns (status code, body size in bytes).
+    """
+    data = case.data() if callable(case.data) else case.data
+    send = getattr(client, case.method)
+    if data is None:
+        response = send(case.path)
+    elif case.format == 'json':
+        response = send(case.path, data, content_type='application/json')
+    else:
+        response = send(case.path, data) # Encoded as multipart
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response.status_code, size
+
+
+def measure(client, case, warm=False):
+    """
+    Runs one iteration and returns (seconds, query count, status, size).
+    Unless `warm`, the response cache is invalidated first, so the view itself is measured.
+    """
+    if not warm:
+        invalidate_all()
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            status, size = request(client, case)
+            elapsed = time.perf_counter() - started
+        if case.write:
+            transaction.set_rollback(True)
+    return elapsed, len(ctx.captured_queries), status, size
+
+
+def peak_memory(client, case, warm=False):
+    """
+    Peak Python memory allocated while serving one request, in KiB. Measured in a
+    separate iteration because tracing allocations slows everything down.
+    """
+    if not warm:
+        invalidate_all()
+    tracemalloc.start()
+    try:
+        with transaction.atomic():
+            request(client, case)
+            if case.write:
+                transaction.set_rollback(True)
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(client, case, iterations, warm=False):
+    measure(client, case, warm) # Warm-up: imports, connection, query plans
+    timings, queries = [], []
+    for _ in range(iterations):
+        elapsed, count, status, size = measure(client, case, warm)
+        timings.append(elapsed * 1000)
+        queries.append(count)
+    latency = {f'p{pct}': round(percentile(timings, pct), 3) for pct in PERCENTILES}
+    latency.update(
+        min=round(min(timings), 3), max=round(max(timings), 3), mean=round(statistics.fmean(timings), 3),
+    )
+    return {
+        'name': case.name,
+        'method': case.method.upper(),
+        'path': case.path,
+        'status': status,
+        'iterations': iterations,
+        'latency_ms': latency,
+        'queries': max(queries),
+        'response_bytes': size,
+        'peak_memory_kb': peak_memory(client, case, warm),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(iterations=20, warm=False, full=False, only=None, client=None):
+    """
+    Benchmarks every endpoint and returns the results with enough metadata
+    (commit, database, row counts) to compare runs.
+    `only` restricts the run to cases whose name contains one of the given strings.
+    """
+    client = client or Client()
+    cases = [
+        case for case in build_cases()
+        if (full or not case.full) and (not only or any(part in case.name for part in only))
+    ]
+    return {
+        'meta': {
+            'timestamp': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'rows': {
+                'students': Student.objects.count(),
+                'subjects': Subject.objects.count(),
+                'enrollments': Enrollment.objects.count(),
+            },
+            'iterations': iterations,
+            'cache': 'warm' if warm else 'cold',
+        },
+        'results': [run_case(client, case, iterations, warm) for case in cases],
+    }
+
+
+def compare(baseline, current):
+    """
+    Pairs up the cases of two runs: yields (name, baseline p50, current p50, change in %,
+    baseline queries, current queries) for every case present in both.
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    for result in current['results']:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        old, new = before['latency_ms']['p50'], result['latency_ms']['p50']
+        change = (new - old) / old * 100 if old else 0.0
+        yield result['name'], old, new, change, before['queries'], result['queries']
+
+
+def read_mix(size=500, seed=0, slow_share=0.0):
+    """
+    A spread of read requests over the current database: list pages and many distinct
+    detail URLs, so that the response cache does not answer everything. With `slow_share`,
+    that fraction of the requests are uncached analytics queries that take a while.
+    Returns (method, path, body) tuples.
+    """
+    rng = random.Random(seed)
+    student_ids = list(Student.objects.values_list('id', flat=True))
+    grade_ids = list(Grade.objects.values_list('id', flat=True))
+    subject_ids = list(Subject.objects.values_list('id', flat=True))
+    mix = [
+        ('GET', '/api/students/?page_size=50', None),
+        ('GET', '/api/enrollments/?page_size=50', None),
+        ('GET', '/api/grades/?page_size=50', None),
+        ('GET', '/api/subjects/', None),
+    ]
+    mix += [('GET', f'/api/students/{pk}/', None) for pk in rng.sample(student_ids, min(size, len(student_ids)))]
+    mix += [('GET', f'/api/grades/{pk}/', None) for pk in rng.sample(grade_ids, min(size, len(grade_ids)))]
+    mix += [('GET', f'/api/subjects/{pk}/', None) for pk in subject_ids]
+    if slow_share:
+        slow = round(len(mix) * slow_share / (1 - slow_share))
+        mix += [('GET', f'/api/subjects/{rng.choice(subject_ids)}/stats/', None) for _ in range(slow)]
+    return mix
+
+
+def add_writes(mix, write_share, size=500, seed=0):
+    """
+    Adds single-row writes to a request mix so that they make up `write_share` of it:
+    exam grade updates, which also update the summaries, the change log and the response
+    cache, and student renames to their current name. Changes the target database.
+    """
+    rng = random.Random(seed)
+    grades = list(Grade.objects.order_by('?').values_list('id', flat=True)[:size])
+    students = list(Student.objects.order_by('?').values_list('id', 'name')[:size])
+    writes = [
+        ('PATCH', f'/api/grades/{pk}/', {'exam_grade': f'{rng.uniform(50, 100):.2f}'}) for pk in grades
+    ] + [
+        ('PATCH', f'/api/students/{pk}/', {'name': name}) for pk, name in students
+    ]
+    count = round(len(mix) * write_share / (1 - write_share))
+    return mix + [rng.choice(writes) for _ in range(count)]
+
+
+def load_test(base_url, mix, concurrency, duration):
+    """
+    Sends requests drawn at random from `mix` to a running server from `concurrency`
+    threads, each on its own keep-alive connection, for `duration` seconds.
+    Returns throughput, error count and latency percentiles.
+    """
+    url = urlsplit(base_url)
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        timings, failed = [], 0
+        while time.perf_counter() < deadline:
+            method, path, body = rng.choice(mix)
+            headers = {'Accept': 'application/json'}
+            if body is not None:
+                body, headers['Content-Type'] = json.dumps(body), 'application/json'
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+                ok = False
+            timings.append((time.perf_counter() - started) * 1000)
+            failed += not ok
+        connection.close()
+        with lock:
+            latencies.extend(timings)
+            errors.append(failed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+    }
+    if latencies:
+        result['latency_ms'] = {f'p{pct}': round(percentile(latencies, pct), 2) for pct in PERCENTILES}
+    return result
@@ -0,0 +1,125 @@
+from django.db import transaction
+
+from . import changes
+from .caching import bump, invalidate_all
+from .importers import GRADE_COLUMNS
+from .models import Student, Subject, Enrollment, Grade, StudentSummary, SubjectSummary
+
+# Rows per INSERT statement; keeps us under SQLite's bound-parameter limit.
+BATCH_SIZE = 1000
+# Grades one batched update may change
+MAX_GRADE_UPDATES = 1000
+
+
+def bulk_enroll(pairs):
+    """
+    Enrolls many (student_id, subject_id) pairs at once.
+
+    Every pair is validated in batch (unknown ids, duplicates in the request and
+    existing enrollments under the unique_together constraint). Valid pairs are
+    inserted together with their zeroed Grade rows using bulk inserts inside a
+    single transaction. Invalid pairs are reported as conflicts and skipped
+    instead of aborting the batch.
+
+    Returns a tuple of (created enrollments, conflicts), where each conflict is a
+    dict with the pair's index in the input, its ids and an error message.
+    """
+    pairs = [(int(student_id), int(subject_id)) for student_id, subject_id in pairs]
+    student_ids = {student_id for student_id, _ in pairs}
+    subject_ids = {subject_id for _, subject_id in pairs}
+
+    conflicts = []
+    to_create = []
+    with transaction.atomic():
+        known_students = set(Student.objects.filter(id__in=student_ids).values_list('id', flat=True))
+        known_subjects = set(Subject.objects.filter(id__in=subject_ids).values_list('id', flat=True))
+        existing = set(
+            Enrollment.objects
+            .filter(student_id__in=known_students, subject_id__in=known_subjects)
+            .values_list('student_id', 'subject_id')
+        )
+
+        seen = set()
+        for index, (student_id, subject_id) in enumerate(pairs):
+            if student_id not in known_students:
+                error = f'Student {student_id} does not exist.'
+            elif subject_id not in known_subjects:
+                error = f'Subject {subject_id} does not exist.'
+            elif (student_id, subject_id) in existing:
+                error = 'Student is already enrolled in this subject.'
+            elif (student_id, subject_id) in seen:
+                error = 'Duplicate pair in request.'
+            else:
+                seen.add((student_id, subject_id))
+                to_create.append(Enrollment(student_id=student_id, subject_id=subject_id))
+                continue
+            conflicts.append({'index': index, 'student': student_id, 'subject': subject_id, 'error': error})
+
+        # Both backends we run on (SQLite 3.35+, PostgreSQL) return the new primary keys.
+        created = Enrollment.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        grades = Grade.objects.bulk_create(
+            [Grade(enrollment=enrollment) for enrollment in created], batch_size=BATCH_SIZE
+        )
+        # bulk_create() skips the signal handlers: record changes, rebuild summaries and drop cached responses here
+        changes.record(Enrollment, [e.pk for e in created])
+        changes.record(Grade, [g.pk for g in grades])
+        StudentSummary.objects.rebuild({e.student_id for e in created})
+        SubjectSummary.objects.rebuild({e.subject_id for e in created})
+        invalidate_all()
+    return created, conflicts
+
+
+def update_grades(patches):
+    """
+    Applies many grade changes in one transaction, with optimistic concurrency.
+
+    Each patch is a dict with a grade `id`, the `version` of the grade the client
+    based its changes on and new values for some of GRADE_COLUMNS. The grades are
+    read in one query (locked against concurrent writers on PostgreSQL; SQLite
+    transactions take the write lock up front), their totals computed under their
+    subject's grading policy and all of them written by one bulk_update(), each with
+    its version raised by one.
+
+    If any grade no longer exists or has a newer version, nothing is written: the
+    conflicts are returned instead, each a dict with the patch's index in the input,
+    the grade id, an error message and the grade as it is now (None if it is gone).
+
+    Returns a tuple of (updated grades, conflicts).
+    """
+    with transaction.atomic():
+        grades = Grade.objects.select_related('enrollment__subject').select_for_update(of=('self',))
+        grades = {grade.pk: grade for grade in grades.filter(pk__in=[patch['id'] for patch in patches])}
+
+        conflicts = []
+        for index, patch in enumerate(patches):
+            grade = grades.get(patch['id'])
+            if grade is None:
+                conflicts.append({'index': index, 'id': patch['id'], 'error': 'Grade does not exist.', 'current': None})
+            elif grade.version != patch['version']:
+                error = f"Grade was changed meanwhile (version {grade.version}, not {patch['version']})."
+                conflicts.append({'index': index, 'id': patch['id'], 'error': error, 'current': grade})
+        if conflicts:
+            return [], conflicts
+
+        updated = []
+        for patch in patches:
+            grade = grades[patch['id']]
+            for field in GRADE_COLUMNS:
+                if field in patch:
+                    setattr(grade, field, patch[field])
+            grade.total_grade = Grade.compute_total(
+                grade.activity_grade, grade.quiz_grade, grade.exam_grade, grade.enrollment.subject.grading_policy
+            )
+            grade.version += 1
+            updated.append(grade)
+        Grade.objects.bulk_update(updated, [*GRADE_COLUMNS, 'total_grade', 'version'], batch_size=BATCH_SIZE)
+
+        # bulk_update() skips the signal handlers: record changes, rebuild summaries and drop cached responses here
+        changes.record(Grade, [grade.pk for grade in updated])
+        StudentSummary.objects.rebuild({grade.enrollment.student_id for grade in updated})
+        SubjectSummary.objects.rebuild({grade.enrollment.subject_id for grade in updated})
+        scopes = ['grades:list', 'enrollments:list', 'students:list']
+        for grade in updated:
+            scopes += [f'grade:{grade.pk}', f'enrollment:{grade.enrollment_id}', f'student:{grade.enrollment.student_id}']
+        bump(*scopes)
+    return updated, []
@@ -0,0 +1,229 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .db import insert_rows
+from .performance import add_render_time
+
+# Every cached response also depends on this scope, so bulk writes can drop everything at once.
+GLOBAL_SCOPE = 'all'
+CLOCK_KEY = 'api-cache:clock'
+# Cached bodies expire eventually even if nothing invalidates them.
+RESPONSE_TIMEOUT = 60 * 60
+# Only data formats are cached: the browsable API's HTML shows the user and a CSRF token
+CACHED_FORMATS = ('json', 'msgpack', 'columnar')
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_versions(app_configs, **kwargs):
+    """
+    Scope versions kept in a per-process cache do not reach the other web workers or the
+    job worker, which would keep serving responses cached before a write.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.API_CACHE_VERSIONS == 'cache' and backend.endswith(('LocMemCache', 'DummyCache')):
+        return [checks.Warning(
+            "API_CACHE_VERSIONS is 'cache' but the default cache is not shared between processes.",
+            hint="Set REDIS_URL, or API_CACHE_VERSIONS='database'.",
+            id='students.W001',
+        )]
+    return []
+
+
+def _version_key(scope):
+    return f'api-cache:version:{scope}'
+
+
+def next_version():
+    """
+    Returns a version number never handed out before. The clock starts from the current
+    time in nanoseconds, so it does not repeat earlier numbers after a restart, a
+    cache.clear() or an eviction, and an old ETag never matches changed data.
+    """
+    try:
+        return cache.incr(CLOCK_KEY)
+    except ValueError: # Counter missing or evicted
+        cache.add(CLOCK_KEY, time.time_ns(), timeout=None)
+        return cache.incr(CLOCK_KEY)
+
+
+def bump(*scopes):
+    """
+    Invalidates every cached response depending on one of `scopes` (e.g. 'students:list'
+    or 'student:42') by moving it to a new version. The versions are shared by every
+    process (see settings.API_CACHE_VERSIONS), so a bump in a job worker or another web
+    worker reaches the responses all of them have cached.
+
+    The bump is applied now, so later reads in this transaction see it, and again on
+    commit, so a response cached by a concurrent reader before the commit is not kept.
+    """
+    if not scopes:
+        return
+
+    def apply():
+        if settings.API_CACHE_VERSIONS == 'database':
+            _bump_table(scopes)
+            return
+        version = next_version()
+        cache.set_many({_version_key(scope): version for scope in scopes}, timeout=None)
+
+    apply()
+    transaction.on_commit(apply)
+
+
+def invalidate_all():
+    """
+    Invalidates every cached response; used by the bulk write paths.
+    """
+    bump(GLOBAL_SCOPE)
+
+
+def _bump_table(scopes):
+    from .models import CacheVersion # Imported here: students.models imports this module
+
+    # The current time in nanoseconds differs from every earlier version of the scope
+    version = time.time_ns()
+    insert_rows(
+        CacheVersion._meta.db_table, ['scope', 'version'], [(scope, version) for scope in scopes],
+        conflict='scope', update=('version',),
+    )
+
+
+def _table_versions(scopes):
+    from .models import CacheVersion
+
+    found = dict(CacheVersion.objects.filter(scope__in=scopes).values_list('scope', 'version'))
+    return [found.get(scope, 0) for scope in scopes]
+
+
+def versions(scopes):
+    """
+    Returns the current version of each scope. From the cache, a scope without one (never
+    bumped, or its key evicted or cleared) gets a new version, as its responses may have
+    changed; in the database, where nothing is evicted, a scope never bumped is at 0.
+    """
+    if settings.API_CACHE_VERSIONS == 'database':
+        return _table_versions(scopes)
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        version = next_version()
+        for key in missing:
+            cache.add(key, version, timeout=None)
+        found.update(cache.get_many(missing)) # Another process may have added them first
+    return [found.get(key, 0) for key in keys]
+
+
+def etag_for(request, scopes, scope_versions):
+    # Paginated bodies hold absolute next/previous links, so the scheme and host are part of the key
+    fingerprint = '|'.join([
+        request.scheme,
+        request.get_host(),
+        request.get_full_path(),
+        request.accepted_media_type or '',
+        *scopes,
+        *(str(version) for version in scope_versions),
+    ])
+    return '"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def response_key(etag):
+    return f'api-cache:response:{etag}'
+
+
+def early_response(request, etag, cached):
+    """
+    Returns a 304 if the client already has `etag`, the `cached` (content, content type)
+    body if there is one, or None if the view has to run.
+    """
+    if_none_match = request.headers.get('If-None-Match', '')
+    # Weak comparison: compressed responses carry the ETag as W/"..."
+    if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+    if cached is not None:
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+
+class CachedResponseMixin:
+    """
+    Read-through cache with ETag/304 support for a viewset's list and retrieve actions.
+
+    Responses are cached under the request's scheme, host and URL, the negotiated media
+    type and the versions of the scopes they depend on ('<cache_scope>:list' for lists
+    and '<detail_scope>:<pk>' for details). Invalidation only has to bump the affected
+    scopes; see students/signals.py. The ETag is derived from the same versions, so
+    a matching If-None-Match is answered with 304 before the view runs a query.
+    Browsable API (HTML) responses are neither cached nor given an ETag.
+    """
+    cache_scope = None # e.g. 'students'
+    detail_scope = None # e.g. 'student'
+
+    def get_cache_scopes(self):
+        if self.action == 'list':
+            return [GLOBAL_SCOPE, f'{self.cache_scope}:list']
+        return [GLOBAL_SCOPE, f'{self.detail_scope}:{self.kwargs[self.lookup_url_kwarg or self.lookup_field]}']
+
+    def get_etag(self, request):
+        scopes = self.get_cache_scopes()
+        return etag_for(request, scopes, versions(scopes))
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if request.accepted_renderer.format not in CACHED_FORMATS:
+            return handler(request, *args, **kwargs)
+        etag = self.get_etag(request)
+        response = early_response(request, etag, cache.get(response_key(etag)))
+        if response is not None:
+            return response
+
+        response = handler(request, *args, **kwargs)
+        self._cache_key, self._etag = response_key(etag), etag # Stored by finalize_response() once rendered
+        return response
+
+    def cached_read(self, request, handler):
+        """
+        cached_response() for the async read views, which run it in a worker thread;
+        `handler` returns a rendered response, which is stored here.
+        """
+        scopes = self.get_cache_scopes()
+        etag = etag_for(request, scopes, versions(scopes))
+        response = early_response(request, etag, cache.get(response_key(etag)))
+        if response is not None:
+            return response
+
+        response = handler()
+        if response.status_code == 200:
+            cache.set(response_key(etag), (response.content, response['Content-Type']), timeout=RESPONSE_TIMEOUT)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_cache_key', None)
+        if key is not None and response.status_code == 200:
+            started = time.perf_counter()
+            response.render()
+            add_render_time(request, time.perf_counter() - started)
+            cache.set(key, (response.content, response['Content-Type']), timeout=RESPONSE_TIMEOUT)
+            response['ETag'] = self._etag
+            response['Cache-Control'] = 'no-cache'
+        return response
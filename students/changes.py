@@ -0,0 +1,158 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .db import insert_rows
+from .models import Student, Subject, Enrollment, Grade, Change
+
+# Flat row shape sent for each model: output name -> ORM lookup
+FEED_FIELDS = {
+    'student': (Student, {'id': 'id', 'name': 'name', 'student_id': 'student_id', 'email': 'email', 'date_of_birth': 'date_of_birth'}),
+    'subject': (Subject, {'id': 'id', 'name': 'name', 'code': 'code'}),
+    'enrollment': (Enrollment, {'id': 'id', 'student': 'student_id', 'subject': 'subject_id', 'enrollment_date': 'enrollment_date'}),
+    'grade': (Grade, {
+        'id': 'id', 'enrollment': 'enrollment_id', 'activity_grade': 'activity_grade',
+        'quiz_grade': 'quiz_grade', 'exam_grade': 'exam_grade', 'total_grade': 'total_grade', 'version': 'version',
+    }),
+}
+MODEL_NAMES = {model: name for name, (model, _) in FEED_FIELDS.items()}
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+BATCH_SIZE = 1000
+
+
+class CursorExpired(Exception):
+    """
+    Raised when the requested cursor predates pruned changes; the client must resync.
+    """
+
+
+def record(model, ids, deleted=False):
+    """
+    Appends change entries for the given primary keys of a Student/Subject/Enrollment/Grade model.
+    Used by the signal handlers and, for rows written without signals, by the bulk paths.
+    """
+    name = MODEL_NAMES[model]
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    insert_rows(
+        Change._meta.db_table, ['model', 'object_id', 'deleted', 'changed_at'],
+        [(name, pk, deleted, now) for pk in ids],
+    )
+
+
+def _oldest_write_start():
+    """
+    PostgreSQL: when the oldest transaction that has written and not committed yet
+    started, or None. Its change entries get ids after that moment, which may be lower
+    than the ids of entries committed meanwhile; see _settle_cutoff().
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT min(xact_start) FROM pg_stat_activity '
+            'WHERE datname = current_database() AND backend_xid IS NOT NULL AND pid <> pg_backend_pid()'
+        )
+        return cursor.fetchone()[0]
+
+
+def _settle_cutoff():
+    """
+    Entries recorded after the returned time are held back, or None if all can be sent.
+
+    On PostgreSQL ids are handed out before commit, so a later id can become visible
+    before an earlier one. Entries recorded since the oldest writing transaction still
+    open began are therefore held back until it ends, whatever its length, and so is a
+    margin of CHANGE_FEED_SETTLE_SECONDS behind it and behind now. The margin covers
+    transactions that commit while the feed is read and clock skew between the web and
+    database servers. pg_stat_activity only shows other roles' transactions to
+    members of pg_read_all_stats; with a single application role it shows them all.
+    """
+    seconds = settings.CHANGE_FEED_SETTLE_SECONDS
+    oldest = _oldest_write_start()
+    if not seconds and oldest is None:
+        return None
+    cutoff = timezone.now() if oldest is None else min(timezone.now(), oldest)
+    return cutoff - timedelta(seconds=seconds)
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return f'{value:.2f}'
+    return value
+
+
+def changes_since(since=0, limit=DEFAULT_LIMIT):
+    """
+    Returns the changes after cursor `since` as a dict with the new `cursor`,
+    whether more changes are pending and the changed rows.
+
+    Several changes to the same row within the window collapse into one entry
+    carrying the row's current state, or a delete if the row no longer exists,
+    so the payload is proportional to the number of rows changed.
+    """
+    if since:
+        # Entries between the cursor and the oldest kept entry were pruned
+        oldest = Change.objects.aggregate(oldest=Min('id'))['oldest']
+        if oldest is not None and oldest > since + 1:
+            raise CursorExpired
+
+    entries = Change.objects.filter(id__gt=since)
+    cutoff = _settle_cutoff()
+    if cutoff is not None:
+        entries = entries.filter(changed_at__lte=cutoff)
+    window = list(entries.order_by('id').values_list('id', 'model', 'object_id')[:limit + 1])
+    has_more = len(window) > limit
+    window = window[:limit]
+
+    # Latest position of each touched row, in cursor order
+    latest = {}
+    for position, model, object_id in window:
+        latest[(model, object_id)] = position
+    touched = {}
+    for model, object_id in latest:
+        touched.setdefault(model, []).append(object_id)
+
+    rows = {}
+    for model, ids in touched.items():
+        model_class, fields = FEED_FIELDS[model]
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            for values in model_class.objects.filter(pk__in=chunk).values_list(*fields.values()):
+                row = {name: _encode(value) for name, value in zip(fields, values)}
+                rows[(model, row['id'])] = row
+
+    changes = []
+    for (model, object_id), position in sorted(latest.items(), key=lambda item: item[1]):
+        data = rows.get((model, object_id))
+        if data is None:
+            changes.append({'model': model, 'id': object_id, 'deleted': True})
+        else:
+            changes.append({'model': model, 'id': object_id, 'deleted': False, 'data': data})
+
+    return {
+        'cursor': window[-1][0] if window else since,
+        'has_more': has_more,
+        'changes': changes,
+    }
+
+
+def latest_cursor():
+    """
+    Returns the newest cursor; clients start here after a full download.
+    """
+    return Change.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def prune(before):
+    """
+    Deletes entries recorded before `before`, always keeping the newest entry so that
+    ids keep growing on backends that reuse them (SQLite without AUTOINCREMENT).
+    """
+    newest = latest_cursor()
+    return Change.objects.filter(changed_at__lt=before).exclude(id=newest).delete()[0]
@@ -0,0 +1,56 @@
+from django.db import connection
+
+
+def insert_rows(table, columns, rows, conflict=None, update=(), returning=None, increment=()):
+    """
+    Inserts `rows` (sequences of values in `columns` order) with multi-row INSERT
+    statements, bypassing model instantiation, which dominates bulk_create() on
+    large batches.
+
+    With `conflict` (a column name) the statement becomes an upsert:
+    ON CONFLICT (conflict) DO UPDATE SET each `update` column to the new value,
+    and each `increment` column (e.g. a version) to its current value plus one.
+    Both SQLite (3.24+, RETURNING since 3.35) and PostgreSQL support this syntax.
+    Returns the values of the `returning` column, if given.
+    """
+    quote = connection.ops.quote_name
+    sql = f'INSERT INTO {quote(table)} ({", ".join(quote(c) for c in columns)}) VALUES '
+    suffix = ''
+    if conflict:
+        if update:
+            assignments = ', '.join(
+                [f'{quote(c)} = EXCLUDED.{quote(c)}' for c in update]
+                + [f'{quote(c)} = {quote(table)}.{quote(c)} + 1' for c in increment]
+            )
+            suffix += f' ON CONFLICT ({quote(conflict)}) DO UPDATE SET {assignments}'
+        else:
+            suffix += f' ON CONFLICT ({quote(conflict)}) DO NOTHING'
+    if returning:
+        suffix += f' RETURNING {quote(returning)}'
+
+    # Stay below the backend's bound-parameter limit (999 on older SQLite builds).
+    max_params = connection.features.max_query_params or 65535
+    per_statement = max(1, max_params // len(columns))
+    row_sql = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    rows = rows if isinstance(rows, list) else list(rows)
+    returned = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), per_statement):
+            chunk = rows[start:start + per_statement]
+            cursor.execute(
+                sql + ', '.join([row_sql] * len(chunk)) + suffix,
+                [value for row in chunk for value in row],
+            )
+            if returning:
+                returned.extend(value for value, in cursor.fetchall())
+    return returned
+
+
+def analyze():
+    """
+    Refreshes the query planner's statistics, e.g. after a bulk load. Plain ANALYZE
+    works on both SQLite and PostgreSQL.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
@@ -0,0 +1,101 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Student, Enrollment
+
+# Rows fetched per round trip. On PostgreSQL iterator() uses a server-side cursor,
+# elsewhere it fetches in chunks, so memory stays flat regardless of table size.
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+STUDENT_COLUMNS = ('id', 'name', 'student_id', 'email', 'date_of_birth')
+
+# Flat column name -> ORM lookup, for the enrollment/grade dumps.
+ENROLLMENT_COLUMNS = {
+    'enrollment_id': 'id',
+    'student_id': 'student__student_id',
+    'student_name': 'student__name',
+    'email': 'student__email',
+    'subject_code': 'subject__code',
+    'subject_name': 'subject__name',
+    'enrollment_date': 'enrollment_date',
+    'activity_grade': 'grades__activity_grade',
+    'quiz_grade': 'grades__quiz_grade',
+    'exam_grade': 'grades__exam_grade',
+    'total_grade': 'grades__total_grade',
+}
+
+GRADEBOOK_COLUMNS = {
+    name: lookup for name, lookup in ENROLLMENT_COLUMNS.items()
+    if name not in ('subject_code', 'subject_name')
+}
+
+
+class Echo:
+    """
+    File-like object whose write() hands the value back, so csv.writer can
+    produce one line at a time for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def student_rows():
+    return STUDENT_COLUMNS, (
+        Student.objects.order_by('name', 'id')
+        .values_list(*STUDENT_COLUMNS)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def enrollment_rows(subject=None, columns=ENROLLMENT_COLUMNS):
+    """
+    Returns the column names and a lazy row iterator for enrollments joined to
+    their student, subject and grade, optionally limited to one subject.
+    """
+    queryset = Enrollment.objects.all()
+    if subject is not None:
+        queryset = queryset.filter(subject=subject).order_by('student__name', 'id')
+    else:
+        queryset = queryset.order_by('id') # Primary key order avoids a sort over the whole table
+    rows = queryset.values_list(*columns.values()).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return tuple(columns), rows
+
+
+def gradebook_rows(subject):
+    return enrollment_rows(subject, columns=GRADEBOOK_COLUMNS)
+
+
+def iter_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_ndjson(columns, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def export_response(filename, columns, rows, file_format='csv'):
+    """
+    Wraps a (columns, rows) pair in a StreamingHttpResponse in the given format.
+    Rows are encoded one at a time as the client reads them.
+    """
+    if file_format == 'ndjson':
+        content = iter_ndjson(columns, rows)
+    else:
+        file_format = 'csv'
+        content = iter_csv(columns, rows)
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
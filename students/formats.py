@@ -0,0 +1,142 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Optional: orjson speeds up the JSON path, msgpack enables MessagePack (only registered
+# in settings when installed).
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Types the serializers leave in their output (datetimes, decimals, lazy strings, ...) are
+# converted the way DRF's own JSON encoder does, so every format carries the same values.
+encoder = JSONEncoder()
+
+
+def to_columns(rows):
+    """
+    [{'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}] -> {'count': 2, 'columns': {'id': [1, 2], 'name': ['A', 'B']}}
+    Rows missing a field get None in its column.
+    """
+    names = dict.fromkeys(name for row in rows for name in row)
+    return {'count': len(rows), 'columns': {name: [row.get(name) for row in rows] for name in names}}
+
+
+def from_columns(columns):
+    """
+    The inverse of to_columns(): {'id': [1, 2], 'name': ['A', 'B']} -> a list of row dicts.
+    """
+    if not isinstance(columns, dict) or not all(isinstance(values, list) for values in columns.values()):
+        raise ParseError("'columns' must map each field name to a list of values.")
+    if len({len(values) for values in columns.values()}) > 1:
+        raise ParseError("Every column must have the same number of values.")
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def is_rows(data):
+    return isinstance(data, list) and all(isinstance(row, dict) for row in data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed, several times faster on
+    large lists. The output is the same compact JSON; indented output (requested
+    through the Accept header) and values orjson refuses go through DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=encoder.default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError: # e.g. an integer beyond 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like DRF does, for JSON embedded in JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser decoding with orjson when it is installed. Like DRF's strict mode,
+    NaN and Infinity are rejected.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack (Accept: application/msgpack or ?format=msgpack): the JSON body's
+    values in a compact binary encoding, with numbers kept as numbers.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encoder.default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack request bodies (Content-Type: application/msgpack).
+    """
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class ColumnarRenderer(FastJSONRenderer):
+    """
+    Column-oriented JSON (Accept: application/vnd.sms.columnar+json or ?format=columnar).
+    A list of rows, bare or as a page's 'results', is sent as one array per field, so
+    field names are not repeated on every row:
+        {"count": 2, "columns": {"id": [1, 2], "name": ["A", "B"]}}
+    Other bodies (details, errors) are sent as plain JSON.
+    """
+    media_type = 'application/vnd.sms.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if is_rows(data):
+            data = to_columns(data)
+        elif isinstance(data, dict) and is_rows(data.get('results')):
+            data = {**data, 'results': to_columns(data['results'])}
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class ColumnarParser(FastJSONParser):
+    """
+    Parses column-oriented JSON bodies into a list of rows; see ColumnarRenderer.
+    Bodies without 'columns' are passed on as they are.
+    """
+    media_type = 'application/vnd.sms.columnar+json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        data = super().parse(stream, media_type, parser_context)
+        if isinstance(data, dict) and 'columns' in data:
+            return from_columns(data['columns'])
+        return data
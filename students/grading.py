@@ -0,0 +1,77 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import BigIntegerField, DecimalField, ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Cast, Round
+
+ROUND_HALF_UP, ROUND_DOWN, ROUND_UP = 'half_up', 'down', 'up'
+ROUNDING_CHOICES = [
+    (ROUND_HALF_UP, 'Round half up'),
+    (ROUND_DOWN, 'Round down'),
+    (ROUND_UP, 'Round up'),
+]
+# Subject fields that determine total_grade; changing one recomputes the subject's grades
+POLICY_FIELDS = ('activity_weight', 'quiz_weight', 'exam_weight', 'total_decimals', 'rounding')
+COMPONENTS = ('activity_grade', 'quiz_grade', 'exam_grade')
+CENT = Decimal('0.01')
+DEFAULT_PASSING_GRADE = Decimal('75.00')
+
+
+def _hundredths(value):
+    return int((Decimal(str(value)) * 100).to_integral_value())
+
+
+class GradingPolicy(namedtuple('GradingPolicy', POLICY_FIELDS)):
+    """
+    How a subject turns activity, quiz and exam grades into total_grade: the weighted
+    mean of the components (weights are relative, so 1/1/1 is the plain average),
+    rounded to `total_decimals` places by `rounding`.
+
+    The arithmetic is done on whole hundredths, so total() in Python and
+    total_expression() in SQL agree exactly on every backend instead of depending on
+    SQLite's floating point. Grades are never negative, so floor division is rounding down.
+    """
+
+    @classmethod
+    def of(cls, subject):
+        return cls(*(getattr(subject, field) for field in POLICY_FIELDS))
+
+    def _terms(self):
+        weights = [_hundredths(weight) for weight in self[:3]]
+        if not any(weights): # Rejected by Subject's constraint; an unsaved policy counts as the plain average
+            weights = [1, 1, 1]
+        step = sum(weights) * 10 ** (2 - self.total_decimals) # Denominator of one rounding unit
+        return weights, step
+
+    def total(self, activity_grade, quiz_grade, exam_grade):
+        """
+        Returns the total grade as a Decimal with two decimal places.
+        """
+        weights, step = self._terms()
+        weighted = sum(_hundredths(grade) * weight for grade, weight in zip((activity_grade, quiz_grade, exam_grade), weights))
+        units = self._round(weighted, step, lambda a, b: a // b)
+        return (Decimal(units) * Decimal(10) ** -self.total_decimals).quantize(CENT)
+
+    def total_expression(self):
+        """
+        total() as a database expression over a Grade row, for set-based UPDATEs.
+        """
+        weights, step = self._terms()
+        weighted = sum(
+            Cast(Round(F(field) * 100), BigIntegerField()) * Value(weight)
+            for field, weight in zip(COMPONENTS, weights)
+        )
+        # Integer division truncates on SQLite and PostgreSQL alike (all operands are >= 0)
+        units = self._round(weighted, Value(step), lambda a, b: ExpressionWrapper(a / b, output_field=BigIntegerField()))
+        total = ExpressionWrapper(units * Value(10 ** (2 - self.total_decimals)) / Value(100.0), output_field=FloatField())
+        return Cast(total, DecimalField(max_digits=5, decimal_places=2))
+
+    def _round(self, weighted, step, divide):
+        if self.rounding == ROUND_DOWN:
+            return divide(weighted, step)
+        if self.rounding == ROUND_UP:
+            return divide(weighted + step - 1, step)
+        return divide(weighted * 2 + step, step * 2)
+
+
+DEFAULT_POLICY = GradingPolicy(Decimal(1), Decimal(1), Decimal(1), 2, ROUND_HALF_UP)
@@ -0,0 +1,187 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from . import changes
+from .caching import invalidate_all
+from .db import insert_rows
+from .grading import DEFAULT_POLICY
+from .models import Subject, Enrollment, Grade, StudentSummary, SubjectSummary
+
+# Rows upserted per INSERT ... ON CONFLICT statement.
+IMPORT_BATCH_SIZE = 2000
+# Only the first few bad rows are echoed back; the rest are just counted.
+MAX_REPORTED_ERRORS = 100
+
+GRADE_COLUMNS = ('activity_grade', 'quiz_grade', 'exam_grade')
+MAX_GRADE = Decimal('999.99') # Largest value that fits max_digits=5, decimal_places=2
+CENT = Decimal('0.01')
+
+
+class ImportFormatError(ValueError):
+    """
+    Raised when an import file cannot be parsed at all (as opposed to a single bad row).
+    """
+
+
+def detect_format(filename, default='csv'):
+    """
+    Guesses the import format ('csv' or 'ndjson') from a file name.
+    """
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_csv_rows(lines):
+    """
+    Yields one dict per CSV record. `lines` may be any iterable of text lines,
+    so the file is never loaded into memory as a whole.
+    """
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None:
+        return
+    missing = {'student_id', 'code', *GRADE_COLUMNS} - {name.strip() for name in reader.fieldnames}
+    if missing:
+        raise ImportFormatError(f"CSV header is missing columns: {', '.join(sorted(missing))}")
+    reader.fieldnames = [name.strip() for name in reader.fieldnames]
+    yield from reader
+
+
+def iter_ndjson_rows(lines):
+    """
+    Yields one dict per non-blank NDJSON line. Lines that are not JSON objects
+    are yielded as None so they are reported as row errors.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def iter_records(records):
+    """
+    Yields already-parsed rows (e.g. a JSON, MessagePack or columnar request body);
+    entries that are not objects are yielded as None so they are reported as row errors.
+    """
+    for row in records:
+        yield row if isinstance(row, dict) else None
+
+
+def parse_grade(value):
+    grade = Decimal(str(value).strip()).quantize(CENT)
+    if not grade.is_finite() or grade < 0 or grade > MAX_GRADE:
+        raise InvalidOperation
+    return grade
+
+
+def build_enrollment_lookup():
+    """
+    Maps (student.student_id, subject.code) to (enrollment id, student pk, subject pk), in one query.
+    """
+    rows = Enrollment.objects.values_list(
+        'student__student_id', 'subject__code', 'id', 'student_id', 'subject_id'
+    ).iterator(chunk_size=10000)
+    return {(student_id, code): ids for student_id, code, *ids in rows}
+
+
+def upsert_grades(rows):
+    """
+    Writes (enrollment_id, activity, quiz, exam, total) tuples with multi-row
+    INSERT ... ON CONFLICT (enrollment_id) DO UPDATE statements and returns the
+    ids of the written grades. Updated grades get a new version.
+    """
+    columns = ['enrollment_id', *GRADE_COLUMNS, 'total_grade']
+    return insert_rows(
+        Grade._meta.db_table, columns, rows, conflict='enrollment_id', update=columns[1:], returning='id',
+        increment=['version'],
+    )
+
+
+def import_grades(lines, file_format='csv', batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Streams grade rows from `lines` and upserts them in fixed-size batches.
+    With file_format 'records', `lines` is an iterable of row dicts instead of text.
+
+    Each row needs a `student_id`, a subject `code` and the three grade components.
+    Rows are resolved to enrollments through a lookup built once per file, and
+    every batch is written with upsert_grades() in one transaction, with
+    total_grade computed alongside the components, so no per-row save() is involved.
+
+    `progress`, if given, is called with the running result after each batch; an
+    exception it raises stops the import after the batches written so far.
+
+    Returns a dict with the number of rows read, grades written and the row errors.
+    """
+    if file_format == 'csv':
+        rows = iter_csv_rows(lines)
+    elif file_format == 'ndjson':
+        rows = iter_ndjson_rows(lines)
+    elif file_format == 'records':
+        rows = iter_records(lines)
+    else:
+        raise ImportFormatError(f"Unsupported import format '{file_format}'.")
+
+    lookup = build_enrollment_lookup()
+    policies = {subject.pk: subject.grading_policy for subject in Subject.objects.all()}
+    result = {'rows': 0, 'imported': 0, 'error_count': 0, 'errors': []}
+    touched_students, touched_subjects = set(), set()
+
+    def report(line, message):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': line, 'error': message})
+
+    def grades():
+        for row in rows:
+            result['rows'] += 1
+            line = result['rows']
+            if row is None:
+                report(line, 'Row is not a JSON object.')
+                continue
+            key = (str(row.get('student_id') or '').strip(), str(row.get('code') or '').strip())
+            ids = lookup.get(key)
+            if ids is None:
+                report(line, f'No enrollment for student {key[0]!r} in subject {key[1]!r}.')
+                continue
+            enrollment_id, student_pk, subject_pk = ids
+            try:
+                activity, quiz, exam = (parse_grade(row[column]) for column in GRADE_COLUMNS)
+            except (KeyError, TypeError, InvalidOperation):
+                report(line, 'Grades must be numbers between 0 and 999.99.')
+                continue
+            touched_students.add(student_pk)
+            touched_subjects.add(subject_pk)
+            total = Grade.compute_total(activity, quiz, exam, policies.get(subject_pk, DEFAULT_POLICY))
+            yield (enrollment_id, activity, quiz, exam, total)
+
+    stream = grades()
+    try:
+        while True:
+            batch = list(islice(stream, batch_size))
+            if not batch:
+                break
+            # The last row for an enrollment wins; ON CONFLICT can't touch one row twice per statement.
+            batch = list({row[0]: row for row in batch}.values())
+            with transaction.atomic():
+                changes.record(Grade, upsert_grades(batch))
+            result['imported'] += len(batch)
+            if progress is not None:
+                progress(result)
+    finally:
+        # The raw upserts bypass the signal handlers; refresh the summaries the file touched.
+        StudentSummary.objects.rebuild(touched_students)
+        SubjectSummary.objects.rebuild(touched_subjects)
+        invalidate_all()
+    return result
@@ -0,0 +1,30 @@
+"""
+Entry points of the processes in the `run_workers` pool. The module imports nothing
+from the app at load time, so spawned processes can unpickle these functions before
+Django is set up.
+"""
+import signal
+
+import django
+
+
+def setup():
+    # Stopping is up to the parent, which stops claiming and waits for the running jobs
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    django.setup()
+
+
+def run(job_id):
+    """
+    Runs a job claimed by the parent and returns its final status.
+    """
+    from django.db import connections # Imported here: the app is loaded by setup()
+    from .jobs import run_job
+    from .models import Job
+
+    try:
+        return run_job(Job.objects.get(pk=job_id))
+    finally:
+        # The next job starts on a fresh connection, with nothing left open by this one
+        connections.close_all()
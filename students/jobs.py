@@ -0,0 +1,310 @@
+import codecs
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .exporters import enrollment_rows, gradebook_rows, iter_csv, iter_ndjson, student_rows
+from .importers import import_grades
+from .models import Enrollment, Grade, Job, Student, Subject
+
+logger = logging.getLogger('students.jobs')
+
+# Seconds between writes of a running job's progress (and heartbeat) to its row
+PROGRESS_INTERVAL = 1.0
+# Exported rows between progress reports
+EXPORT_PROGRESS_ROWS = 2000
+# A job that has lost its worker this many times (e.g. it keeps crashing it) fails instead of requeueing
+MAX_ATTEMPTS = 3
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job at its next progress report once cancellation was
+    requested (or the job was handed to another worker meanwhile).
+    """
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def job_path(name):
+    return os.path.join(settings.JOB_FILES_DIR, name)
+
+
+def save_input(upload):
+    """
+    Copies an uploaded file to JOB_FILES_DIR and returns its name there.
+    """
+    os.makedirs(settings.JOB_FILES_DIR, exist_ok=True)
+    extension = os.path.splitext(upload.name or '')[1].lower()[:10]
+    name = f'input-{uuid.uuid4().hex}{extension}'
+    with open(job_path(name), 'wb') as handle:
+        for chunk in upload.chunks():
+            handle.write(chunk)
+    return name
+
+
+def remove_files(*names):
+    for name in names:
+        if name:
+            try:
+                os.remove(job_path(name))
+            except FileNotFoundError:
+                pass
+
+
+class Progress:
+    """
+    Handed to a job's handler: progress(done, total) notes how far the job got and
+    raises JobCancelled once cancellation was requested.
+
+    Used as a context manager around the handler, it runs a reporter thread that writes
+    the latest numbers to the job row every PROGRESS_INTERVAL (which also serves as the
+    worker's heartbeat) and picks up cancellation requests. The thread has its own
+    database connection: on SQLite the handler's connection cannot write while one of
+    its read cursors is open (an export), and a long UPDATE (a recomputation) must not
+    make the worker look dead.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.done, self.total = 0, None
+        self.cancelled = False
+        self.stopped = threading.Event()
+
+    def __call__(self, done, total=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if self.cancelled:
+            raise JobCancelled
+
+    def __enter__(self):
+        self.report()
+        if self.cancelled: # Requested before the job started
+            raise JobCancelled
+        self.reporter = threading.Thread(target=self.run, name=f'job-{self.job.pk}-progress', daemon=True)
+        self.reporter.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.reporter.join()
+
+    def report(self):
+        updates = {'progress': self.done, 'heartbeat_at': timezone.now()}
+        if self.total is not None:
+            updates['total'] = self.total
+        # attempts tells this run apart from a later one after the job was requeued
+        mine = Job.objects.filter(pk=self.job.pk, attempts=self.job.attempts, status=Job.RUNNING)
+        if not mine.filter(cancel_requested=False).update(**updates):
+            self.cancelled = True
+
+    def run(self):
+        try:
+            while not self.stopped.wait(PROGRESS_INTERVAL):
+                try:
+                    self.report()
+                except DatabaseError as exc: # e.g. SQLite busy past its timeout; the next round catches up
+                    logger.warning("Progress of job %s not saved: %s", self.job.pk, exc)
+        finally:
+            connection.close() # This thread's own connection
+
+
+# Job handlers: each takes the claimed job and its Progress and returns the job's result.
+
+def run_import(job, progress):
+    """
+    Imports the uploaded grade file (params: file_format). Progress is in bytes read.
+    """
+    path = job_path(job.input_file)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as handle:
+        # utf-8-sig strips the BOM spreadsheet tools like to add.
+        lines = codecs.iterdecode(handle, 'utf-8-sig')
+        return import_grades(
+            lines, job.params.get('file_format', 'csv'), progress=lambda result: progress(handle.tell(), size),
+        )
+
+
+def run_export(job, progress):
+    """
+    Writes an export to a file under JOB_FILES_DIR (params: export = students, enrollments
+    or gradebook, subject for a gradebook, file_format). Progress is in rows.
+    """
+    params = job.params
+    file_format = params.get('file_format', 'csv')
+    if params['export'] == 'gradebook':
+        subject = Subject.objects.get(pk=params['subject'])
+        filename, (columns, rows) = f'gradebook-{subject.code}', gradebook_rows(subject)
+        total = Enrollment.objects.filter(subject=subject).count()
+    elif params['export'] == 'enrollments':
+        filename, (columns, rows) = 'enrollments', enrollment_rows()
+        total = Enrollment.objects.count()
+    else:
+        filename, (columns, rows) = 'students', student_rows()
+        total = Student.objects.count()
+    progress(0, total)
+
+    written = 0
+
+    def counted():
+        nonlocal written
+        for row in rows:
+            yield row
+            written += 1
+            if written % EXPORT_PROGRESS_ROWS == 0:
+                progress(written, total)
+
+    encode = iter_ndjson if file_format == 'ndjson' else iter_csv
+    output = f'job-{job.pk}-{filename}.{file_format}'
+    partial = job_path(output + '.part')
+    os.makedirs(settings.JOB_FILES_DIR, exist_ok=True)
+    try:
+        with open(partial, 'w', newline='', encoding='utf-8') as handle:
+            handle.writelines(encode(columns, counted()))
+        os.replace(partial, job_path(output))
+    finally:
+        rows.close() # Closes the cursor now, also when cancelled; an open one blocks writes on SQLite
+        if os.path.exists(partial):
+            os.remove(partial)
+    job.output_file = output
+    return {'rows': written, 'filename': f'{filename}.{file_format}', 'file_format': file_format}
+
+
+def run_recompute(job, progress):
+    """
+    Recomputes total_grade under the subjects' grading policies (params: subject, or
+    every grade). Progress is in grades.
+    """
+    grades = Grade.objects.all()
+    if job.params.get('subject') is not None:
+        grades = grades.filter(enrollment__subject_id=job.params['subject'])
+    return {'updated': grades.recompute_totals(progress=progress)}
+
+
+JOB_KINDS = {
+    'import_grades': run_import,
+    'export': run_export,
+    'recompute_totals': run_recompute,
+}
+
+
+def enqueue(kind, params=None, input_file=''):
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind '{kind}'.")
+    return Job.objects.create(kind=kind, params=params or {}, input_file=input_file)
+
+
+def claim(worker):
+    """
+    Marks the oldest queued job as running for `worker` and returns it, or None when
+    the queue is empty. Concurrent workers never claim the same job: PostgreSQL skips
+    rows locked by another claim, SQLite serializes the write transactions, and the
+    conditional UPDATE settles any remaining race.
+    """
+    with transaction.atomic():
+        candidates = Job.objects.filter(status=Job.QUEUED).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        job_id = candidates.values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, attempts=F('attempts') + 1,
+            started_at=now, heartbeat_at=now, progress=0, total=None,
+        )
+    return Job.objects.get(pk=job_id) if claimed else None
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records how it ended. Returns the final status.
+    """
+    progress = Progress(job)
+    try:
+        with progress:
+            result = JOB_KINDS[job.kind](job, progress)
+    except JobCancelled:
+        return finish(job, progress, Job.CANCELLED)
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed", job.pk, job.kind)
+        return finish(job, progress, Job.FAILED, error=f'{type(exc).__name__}: {exc}')
+    return finish(job, progress, Job.SUCCEEDED, result=result)
+
+
+def finish(job, progress, status, result=None, error=''):
+    updates = {
+        'status': status, 'result': result, 'error': error, 'finished_at': timezone.now(),
+        'progress': progress.done, 'total': progress.total,
+    }
+    if status == Job.SUCCEEDED:
+        done = progress.total if progress.total is not None else progress.done
+        updates.update(input_file='', output_file=job.output_file, progress=done, total=done)
+    finished = Job.objects.filter(pk=job.pk, attempts=job.attempts, status=Job.RUNNING).update(**updates)
+    if not finished:
+        # Requeued or cancelled meanwhile; the output of this run is not the job's
+        remove_files(job.output_file)
+        return None
+    if status == Job.SUCCEEDED:
+        remove_files(job.input_file) # Only kept for retries
+    return status
+
+
+def cancel(job_id):
+    """
+    Cancels a queued job at once; a running one stops at its next progress report.
+    Returns False if the job had already finished.
+    """
+    now = timezone.now()
+    if Job.objects.filter(pk=job_id, status=Job.QUEUED).update(status=Job.CANCELLED, cancel_requested=True, finished_at=now):
+        return True
+    return bool(Job.objects.filter(pk=job_id, status=Job.RUNNING).update(cancel_requested=True))
+
+
+def retry(job_id):
+    """
+    Queues a failed or cancelled job again with the same parameters and input.
+    Returns False for jobs in any other state.
+    """
+    job = Job.objects.filter(pk=job_id, status__in=(Job.FAILED, Job.CANCELLED)).first()
+    if job is None:
+        return False
+    remove_files(job.output_file)
+    return bool(Job.objects.filter(pk=job_id, status__in=(Job.FAILED, Job.CANCELLED)).update(
+        status=Job.QUEUED, progress=0, total=None, result=None, error='', output_file='',
+        cancel_requested=False, worker='', started_at=None, heartbeat_at=None, finished_at=None,
+    ))
+
+
+def release(jobs, reason):
+    """
+    Takes back running jobs whose worker is gone: they are queued again, or end as
+    cancelled if that was requested, or as failed after MAX_ATTEMPTS runs.
+    `jobs` is a Job queryset.
+    """
+    running = jobs.filter(status=Job.RUNNING)
+    now = timezone.now()
+    released = running.filter(cancel_requested=True).update(status=Job.CANCELLED, finished_at=now)
+    released += running.filter(attempts__gte=MAX_ATTEMPTS).update(status=Job.FAILED, error=reason, finished_at=now)
+    released += running.update(status=Job.QUEUED, worker='', heartbeat_at=None)
+    return released
+
+
+def release_stale(seconds=None):
+    """
+    Releases running jobs whose worker has not checked in for JOB_STALE_SECONDS.
+    """
+    seconds = settings.JOB_STALE_SECONDS if seconds is None else seconds
+    cutoff = timezone.now() - timedelta(seconds=seconds)
+    return release(Job.objects.filter(heartbeat_at__lt=cutoff), "The worker running the job stopped responding.")
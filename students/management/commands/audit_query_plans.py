@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from students.models import Student
+from students.query_plans import audit
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN QUERY PLAN on the statements behind every viewset's pages, detail "
+        "routes and list queryset and the admin changelists, against the current database "
+        "(see seed_benchmark; SQLite only). Fails if any scans a table or sorts in a temporary B-tree."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan, not only the failing ones.")
+
+    def handle(self, *args, **options):
+        if not Student.objects.exists():
+            raise CommandError("The database is empty; run seed_benchmark first.")
+        # Allows the test client's host
+        setup_test_environment()
+        try:
+            reports = audit()
+        except NotImplementedError as exc:
+            raise CommandError(str(exc))
+        finally:
+            teardown_test_environment()
+
+        failed = [report for report in reports if report.problems]
+        for report in reports:
+            if report.problems or options['verbose_plans']:
+                style = self.style.ERROR if report.problems else self.style.SUCCESS
+                self.stdout.write(style(report.source))
+                self.stdout.write(f'  {report.sql}')
+                for depth, detail in report.plan:
+                    self.stdout.write(f"  {'  ' * depth}{detail}")
+        if failed:
+            raise CommandError(f"{len(failed)} of {len(reports)} statements scan a table or sort.")
+        self.stdout.write(self.style.SUCCESS(f"{len(reports)} statements checked; no table scans or sorts."))
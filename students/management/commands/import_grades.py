@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from students.importers import IMPORT_BATCH_SIZE, ImportFormatError, detect_format, import_grades
+
+
+class Command(BaseCommand):
+    help = "Imports grades from a CSV or NDJSON file (columns: student_id, code, activity_grade, quiz_grade, exam_grade)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to the .csv or .ndjson file.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Override the format guessed from the file name.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Rows per upsert statement.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        started = time.perf_counter()
+        try:
+            # utf-8-sig strips the BOM spreadsheet tools like to add.
+            with open(path, newline='', encoding='utf-8-sig') as handle:
+                result = import_grades(handle, file_format, batch_size=options['batch_size'])
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        except ImportFormatError as exc:
+            raise CommandError(str(exc))
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} of {result['rows']} rows "
+            f"({result['error_count']} errors) in {elapsed:.1f}s."
+        ))
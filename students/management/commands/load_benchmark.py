@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from students.benchmarks import add_writes, git_commit, load_test, read_mix
+from students.models import Student
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures throughput of a running server (e.g. gunicorn or uvicorn) under concurrent load. "
+        "Request URLs are picked from the database this command is configured with, so point both at the same one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the running server.")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help="Concurrent clients per run.")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds per run.")
+        parser.add_argument('--slow-share', type=float, default=0.0, help="Fraction of slow analytics requests, e.g. 0.02.")
+        parser.add_argument(
+            '--write-share', type=float, default=0.0,
+            help="Fraction of grade/student updates, e.g. 0.1. These modify the database.",
+        )
+        parser.add_argument('--label', default='', help="Stored with the results, e.g. the server command.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if not Student.objects.exists():
+            raise CommandError("The database is empty; run seed_benchmark first.")
+        mix = read_mix(slow_share=options['slow_share'])
+        if options['write_share']:
+            mix = add_writes(mix, options['write_share'])
+        # Connections must not be shared with the load threads
+        connection.close()
+
+        runs = []
+        self.stdout.write(f"{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for concurrency in options['concurrency']:
+            result = load_test(options['url'], mix, concurrency, options['duration'])
+            runs.append(result)
+            latency = result.get('latency_ms', {})
+            self.stdout.write(
+                f"{concurrency:>8}{result['requests_per_second']:>10.1f}{latency.get('p50', 0):>10.2f}"
+                f"{latency.get('p99', 0):>10.2f}{result['errors']:>8}"
+            )
+
+        if options['output']:
+            results = {
+                'meta': {
+                    'timestamp': timezone.now().isoformat(),
+                    'commit': git_commit(),
+                    'url': options['url'],
+                    'label': options['label'],
+                    'duration': options['duration'],
+                    'slow_share': options['slow_share'],
+                    'write_share': options['write_share'],
+                    'database': connection.vendor,
+                    'requests_in_mix': len(mix),
+                },
+                'runs': runs,
+            }
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from students.changes import prune
+
+
+class Command(BaseCommand):
+    help = "Deletes change feed entries older than --days. Clients with older cursors must resync."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Keep entries from the last N days.")
+
+    def handle(self, *args, **options):
+        deleted = prune(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} change entries."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from students.models import StudentSummary, SubjectSummary
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-subject and per-student grade summaries from scratch, or verifies them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Only compare stored summaries with fresh aggregates.")
+
+    def handle(self, *args, **options):
+        summaries = (('subject', SubjectSummary), ('student', StudentSummary))
+        if options['verify']:
+            failed = False
+            for label, model in summaries:
+                problems = model.objects.mismatches()
+                for pk, field, stored, expected in problems[:50]:
+                    self.stderr.write(f"{label} {pk}: {field} is {stored}, expected {expected}")
+                if problems:
+                    failed = True
+                    self.stderr.write(f"{len(problems)} {label} summary mismatches.")
+            if failed:
+                raise CommandError("Summaries are out of date; run rebuild_summaries to fix them.")
+            self.stdout.write(self.style.SUCCESS("All summaries are consistent."))
+            return
+
+        with transaction.atomic():
+            for label, model in summaries:
+                model.objects.rebuild()
+                self.stdout.write(f"Rebuilt {model.objects.count()} {label} summaries.")
+        self.stdout.write(self.style.SUCCESS("Done."))
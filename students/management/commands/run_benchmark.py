@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from students.benchmarks import run_suite, compare
+from students.models import Student
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives every public /api/ endpoint through the test client against the current database "
+        "(see seed_benchmark; the staff-only performance report is not included) and writes latency percentiles, query counts and peak memory as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', default='benchmark.json', help="Where to write the results.")
+        parser.add_argument('--compare', metavar='FILE', help="Earlier results to compare the p50 latencies with.")
+        parser.add_argument('--only', nargs='+', help="Only run cases whose name contains one of these strings.")
+        parser.add_argument('--full', action='store_true', help="Include unpaginated lists and exports.")
+        parser.add_argument('--warm-cache', action='store_true', help="Keep the response cache between iterations.")
+
+    def handle(self, *args, **options):
+        if not Student.objects.exists():
+            raise CommandError("The database is empty; run seed_benchmark first.")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+
+        # Allows the test client's host and runs with DEBUG off, as in production
+        setup_test_environment()
+        try:
+            results = run_suite(
+                iterations=options['iterations'], warm=options['warm_cache'],
+                full=options['full'], only=options['only'],
+            )
+        finally:
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+        self.stdout.write(f"{'case':<28}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>10}")
+        for result in results['results']:
+            latency = result['latency_ms']
+            line = (
+                f"{result['name']:<28}{result['status']:>7}{latency['p50']:>10.2f}{latency['p95']:>10.2f}"
+                f"{result['queries']:>9}{result['peak_memory_kb']:>10}"
+            )
+            self.stdout.write(line if result['status'] < 400 else self.style.ERROR(line))
+
+        if baseline:
+            self.stdout.write(f"\nCompared with {baseline['meta'].get('commit') or options['compare']}:")
+            for name, old, new, change, old_queries, new_queries in compare(baseline, results):
+                line = f"{name:<28}{old:>10.2f}{new:>10.2f}{change:>+9.1f}%"
+                if old_queries != new_queries:
+                    line += f"  queries {old_queries} -> {new_queries}"
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+from students import job_worker
+from students.jobs import claim, release, release_stale, run_job, worker_name
+from students.models import Job
+
+# Seconds between checks for running jobs whose worker died
+STALE_CHECK_INTERVAL = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued background jobs (grade imports, exports, total recomputations), "
+        "each in a process of a local pool. SIGINT/SIGTERM stop claiming and wait for the "
+        "running jobs; a second signal requeues them and exits at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help="Jobs run at once, one per process. 0 runs them one after another in this process.",
+        )
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between checks for new jobs.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        self.name = worker_name()
+        handlers = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            if options['processes'] > 0:
+                self.run_pool(options['processes'], options['poll'], options['burst'])
+            else:
+                self.run_inline(options['poll'], options['burst'])
+        finally:
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+
+    def stop(self, signum, frame):
+        if self.stopping:
+            raise KeyboardInterrupt
+        self.stopping = True
+        self.stdout.write("Stopping: waiting for the running jobs (signal again to requeue them and exit).")
+
+    def report(self, job_id, status):
+        if status is None:
+            status = "taken over" # Requeued or cancelled while it ran
+        self.stdout.write(f"Job {job_id}: {status}")
+
+    def run_inline(self, poll, burst):
+        while not self.stopping:
+            job = claim(self.name)
+            if job is None:
+                if burst:
+                    break
+                release_stale()
+                time.sleep(poll)
+                continue
+            self.report(job.pk, run_job(job))
+
+    def run_pool(self, processes, poll, burst):
+        """
+        Claims jobs here and runs them in a pool of spawned processes, each with its own
+        interpreter and database connection. Jobs lost with a crashed pool process are
+        requeued, and so are those of other workers that stopped sending heartbeats.
+        """
+        def new_pool():
+            context = multiprocessing.get_context('spawn')
+            return ProcessPoolExecutor(processes, mp_context=context, initializer=job_worker.setup)
+
+        pool = new_pool()
+        running = {} # future -> job id
+        checked = 0
+        self.stdout.write(f"Worker {self.name} running up to {processes} jobs at once.")
+        try:
+            while True:
+                lost = []
+                for future in [future for future in running if future.done()]:
+                    job_id = running.pop(future)
+                    try:
+                        self.report(job_id, future.result())
+                    except BrokenProcessPool:
+                        lost.append(job_id)
+                    except Exception as exc: # Recording the outcome failed, e.g. the database was unavailable
+                        self.stderr.write(f"Job {job_id}: {type(exc).__name__}: {exc}")
+                        release(Job.objects.filter(pk=job_id), f"The job's outcome could not be saved: {exc}")
+                if lost:
+                    # A pool process died; every job still in the broken pool is lost with it
+                    lost += running.values()
+                    running.clear()
+                    release(Job.objects.filter(pk__in=lost), "The worker process running the job exited.")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = new_pool()
+
+                try:
+                    if time.monotonic() - checked >= STALE_CHECK_INTERVAL:
+                        release_stale()
+                        checked = time.monotonic()
+                    while not self.stopping and len(running) < processes:
+                        job = claim(self.name)
+                        if job is None:
+                            break
+                        running[pool.submit(job_worker.run, job.pk)] = job.pk
+                except OperationalError as exc: # e.g. SQLite busy past its timeout; try again next round
+                    self.stderr.write(f"Job queue unavailable: {exc}")
+
+                if not running and (self.stopping or burst):
+                    break
+                if running:
+                    wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(poll)
+        except KeyboardInterrupt:
+            for child in multiprocessing.active_children():
+                child.terminate()
+        finally:
+            if running:
+                release(Job.objects.filter(pk__in=running.values()), "The worker was stopped.")
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,130 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from students import changes
+from students.caching import invalidate_all
+from students.db import analyze, insert_rows
+from students.models import Student, Subject, Enrollment, Grade, StudentSummary, SubjectSummary
+
+SCALES = {'small': 10_000, 'medium': 100_000, 'large': 1_000_000}
+
+FIRST_NAMES = (
+    'Maria', 'Jose', 'Juan', 'Ana', 'Mark', 'John', 'Angel', 'Paul', 'Michael', 'Grace',
+    'Joy', 'Rose', 'Carlo', 'Miguel', 'Andrea', 'Nicole', 'Kevin', 'Christian', 'Sofia', 'Gabriel',
+)
+LAST_NAMES = (
+    'Santos', 'Reyes', 'Cruz', 'Bautista', 'Ocampo', 'Garcia', 'Mendoza', 'Torres', 'Tomas', 'Andrada',
+    'Castillo', 'Flores', 'Villanueva', 'Ramos', 'Castro', 'Rivera', 'Aquino', 'Navarro', 'Salazar', 'Mercado',
+)
+SUBJECT_AREAS = ('Mathematics', 'Science', 'English', 'Filipino', 'History', 'Computing', 'Physics', 'Chemistry', 'Biology', 'Economics')
+
+CENT = Decimal('0.01')
+# Students are generated and inserted this many at a time to bound memory.
+CHUNK = 20_000
+
+
+def grade(rng, mean, spread):
+    """
+    A component grade drawn from a normal distribution, clipped to 0..100.
+    """
+    return Decimal(min(100.0, max(0.0, rng.gauss(mean, spread)))).quantize(CENT)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a reproducible benchmark dataset with bulk inserts. "
+        "Seeded rows are not written to the change feed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="10k, 100k or 1M students.")
+        parser.add_argument('--students', type=int, help="Exact number of students (overrides --scale).")
+        parser.add_argument('--subjects', type=int, default=60)
+        parser.add_argument('--min-enrollments', type=int, default=4, help="Subjects per student, lower bound.")
+        parser.add_argument('--max-enrollments', type=int, default=8, help="Subjects per student, upper bound.")
+        parser.add_argument('--seed', type=int, default=106, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--clear', action='store_true', help="Delete all existing students, subjects and grades first.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        students = options['students'] or SCALES[options['scale']]
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+            subject_ids = self.create_subjects(rng, options['subjects'])
+            offset = Student.objects.count()
+            for start in range(0, students, CHUNK):
+                count = min(CHUNK, students - start)
+                self.create_students(rng, offset + start, count, subject_ids, options)
+                self.stdout.write(f"  {start + count}/{students} students")
+            StudentSummary.objects.rebuild()
+            SubjectSummary.objects.rebuild()
+        invalidate_all()
+        analyze() # Plans at this size depend on up-to-date statistics
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {students} students, {len(subject_ids)} subjects and "
+            f"{Enrollment.objects.count()} enrollments in {elapsed:.1f}s."
+        ))
+
+    def clear(self):
+        # Plain DELETEs: the ORM would load every row to send signals.
+        with connection.cursor() as cursor:
+            for model in (StudentSummary, SubjectSummary, Grade, Enrollment, Student, Subject):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        # Expires older sync cursors, so those clients resync instead of missing the deletes
+        changes.prune(timezone.now())
+
+    def create_subjects(self, rng, count):
+        existing = Subject.objects.count()
+        rows = []
+        for i in range(existing, existing + count):
+            area = SUBJECT_AREAS[i % len(SUBJECT_AREAS)]
+            rows.append((f'{area} {i // len(SUBJECT_AREAS) + 1}', f'{area[:4].upper()}{i + 1:03d}'))
+        insert_rows(Subject._meta.db_table, ['name', 'code'], rows)
+        return list(Subject.objects.values_list('id', flat=True))
+
+    def create_students(self, rng, offset, count, subject_ids, options):
+        today = date.today()
+        student_rows = []
+        for i in range(offset, offset + count):
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            birthday = today - timedelta(days=rng.randint(17 * 365, 25 * 365))
+            student_rows.append((name, f'B{i:07d}', f'student{i:07d}@example.edu', birthday))
+        student_ids = insert_rows(
+            Student._meta.db_table, ['name', 'student_id', 'email', 'date_of_birth'], student_rows, returning='id'
+        )
+
+        low = min(options['min_enrollments'], len(subject_ids))
+        high = min(options['max_enrollments'], len(subject_ids))
+        enrollment_rows = []
+        for student_id in student_ids:
+            for subject_id in rng.sample(subject_ids, rng.randint(low, high)):
+                enrollment_rows.append((student_id, subject_id, today))
+        enrollment_ids = insert_rows(
+            Enrollment._meta.db_table, ['student_id', 'subject_id', 'enrollment_date'], enrollment_rows, returning='id'
+        )
+
+        policies = {subject.pk: subject.grading_policy for subject in Subject.objects.filter(pk__in=subject_ids)}
+        grade_rows = []
+        for enrollment_id, (_, subject_id, _) in zip(enrollment_ids, enrollment_rows):
+            ability = rng.gauss(0, 8) # Shared by the components of one enrollment
+            activity = grade(rng, 86 + ability, 6)
+            quiz = grade(rng, 80 + ability, 9)
+            exam = grade(rng, 75 + ability, 12)
+            total = Grade.compute_total(activity, quiz, exam, policies[subject_id])
+            grade_rows.append((enrollment_id, activity, quiz, exam, total))
+        insert_rows(
+            Grade._meta.db_table,
+            ['enrollment_id', 'activity_grade', 'quiz_grade', 'exam_grade', 'total_grade'],
+            grade_rows,
+        )
@@ -0,0 +1,164 @@
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.gzip import GZipMiddleware, re_accepts_gzip
+from django.middleware.security import SecurityMiddleware as DjangoSecurityMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .caching import RESPONSE_TIMEOUT, response_key
+
+try:
+    import brotli # Optional; without it responses are gzipped
+except ImportError:
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, usable in both sync and async middleware chains.
+
+    WhiteNoise itself is sync-only, so under ASGI Django would run it in a thread and
+    switch back to the event loop for the rest of the chain on every request. Looking
+    up a static file is a dict lookup (or, with autorefresh, a check of the static
+    prefix before touching the filesystem), so it can run on the event loop as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class SecurityMiddleware(DjangoSecurityMiddleware):
+    """
+    Django's SecurityMiddleware, with its hooks run on the event loop under ASGI
+    instead of in a thread. They only inspect the request and set headers.
+    """
+
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+
+
+def brotli_sequence(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def abrotli_sequence(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    async for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def agzip_sequence(chunks, max_random_bytes):
+    # As GZipMiddleware does for async streams: one gzip member per chunk
+    async for chunk in chunks:
+        yield compress_string(chunk, max_random_bytes=max_random_bytes)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses /api/ responses of at least API_COMPRESS_MIN_SIZE bytes, and streamed
+    ones (exports), in every format but the browsable API's HTML: with Brotli when the client accepts it and the brotli package is
+    installed, otherwise with gzip as Django's GZipMiddleware does. The ETag becomes
+    weak, which If-None-Match still matches (see caching.early_response).
+
+    Compressing a large list costs far more than serving it from the response cache,
+    so bodies with an ETag (cached responses) are compressed once per encoding and
+    kept next to the uncompressed one. Under ASGI, compression runs in a worker
+    thread rather than on the event loop.
+    """
+    max_random_bytes = GZipMiddleware.max_random_bytes # Length padding against BREACH
+
+    def compresses(self, request, response):
+        if not request.path.startswith('/api/') or response.has_header('Content-Encoding'):
+            return False
+        if response.get('Content-Type', '').startswith('text/html'):
+            return False # The browsable API echoes the query string next to a CSRF token (BREACH)
+        return response.streaming or len(response.content) >= settings.API_COMPRESS_MIN_SIZE
+
+    def compress(self, content, encoding):
+        if encoding == 'br':
+            return brotli.compress(content, quality=settings.API_BROTLI_QUALITY)
+        return compress_string(content, max_random_bytes=self.max_random_bytes)
+
+    def compress_stream(self, response, encoding):
+        if encoding == 'br':
+            sequence = abrotli_sequence if response.is_async else brotli_sequence
+            return sequence(response.streaming_content, settings.API_BROTLI_QUALITY)
+        if response.is_async:
+            return agzip_sequence(response.streaming_content, self.max_random_bytes)
+        return compress_sequence(response.streaming_content, max_random_bytes=self.max_random_bytes)
+
+    def process_response(self, request, response):
+        if not self.compresses(request, response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_brotli.search(accepted):
+            encoding = 'br'
+        elif re_accepts_gzip.search(accepted):
+            encoding = 'gzip'
+        else:
+            return response
+
+        etag = response.get('ETag')
+        if response.streaming:
+            response.streaming_content = self.compress_stream(response, encoding)
+            del response.headers['Content-Length'] # Unknown until streamed
+        else:
+            key = f'{response_key(etag)}:{encoding}' if etag else None
+            compressed = cache.get(key) if key else None
+            if compressed is None:
+                compressed = self.compress(response.content, encoding)
+                if key:
+                    cache.set(key, compressed, timeout=RESPONSE_TIMEOUT)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if not self.compresses(request, response) or response.streaming: # Nothing to do, or only wraps the iterator
+            return self.process_response(request, response)
+        return await sync_to_async(self.process_response, thread_sensitive=False)(request, response)
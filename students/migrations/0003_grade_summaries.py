@@ -0,0 +1,82 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+
+
+def build_summaries(apps, schema_editor):
+    """
+    Fills the summary tables for existing data. Later changes are applied incrementally.
+    """
+    Enrollment = apps.get_model('students', 'Enrollment')
+    Grade = apps.get_model('students', 'Grade')
+    squares = models.DecimalField(max_digits=20, decimal_places=4)
+    for model_name, group_name in (('StudentSummary', 'student'), ('SubjectSummary', 'subject')):
+        Summary = apps.get_model('students', model_name)
+        Group = apps.get_model('students', group_name.capitalize())
+        counts = dict(Enrollment.objects.values_list(f'{group_name}_id').annotate(n=Count('id')).order_by())
+        aggregates = {
+            row.pop('group'): row for row in
+            Grade.objects.values(group=F(f'enrollment__{group_name}_id')).annotate(
+                grade_count=Count('id'),
+                activity_sum=Sum('activity_grade'),
+                quiz_sum=Sum('quiz_grade'),
+                exam_sum=Sum('exam_grade'),
+                total_sum=Sum('total_grade'),
+                total_squares=Sum(F('total_grade') * F('total_grade'), output_field=squares),
+                total_min=Min('total_grade'),
+                total_max=Max('total_grade'),
+            ).order_by()
+        }
+        Summary.objects.bulk_create([
+            Summary(**{f'{group_name}_id': pk, 'enrollment_count': counts.get(pk, 0), **aggregates.get(pk, {})})
+            for pk in Group.objects.values_list('pk', flat=True)
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSummary',
+            fields=[
+                ('enrollment_count', models.PositiveIntegerField(default=0)),
+                ('grade_count', models.PositiveIntegerField(default=0)),
+                ('activity_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quiz_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('exam_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_squares', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('total_min', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('total_max', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='students.student')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SubjectSummary',
+            fields=[
+                ('enrollment_count', models.PositiveIntegerField(default=0)),
+                ('grade_count', models.PositiveIntegerField(default=0)),
+                ('activity_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quiz_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('exam_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_squares', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('total_min', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('total_max', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('subject', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='students.subject')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+from django.db import migrations
+
+# Table -> searchable columns; mirrors students.search.SEARCH_FIELDS
+SEARCH_TABLES = {
+    'students_student': ('name', 'student_id', 'email'),
+    'students_subject': ('name', 'code'),
+}
+
+
+def sqlite_statements(table, columns):
+    """
+    An external-content FTS5 table plus the triggers that keep it in sync with every
+    write, including bulk inserts and raw SQL that bypass the ORM signals.
+    """
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', prefix='1 2 3')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def postgresql_statements(table, columns):
+    """
+    Trigram GIN indexes, which serve icontains/istartswith lookups (and therefore the
+    admin search) without sequential scans. PostgreSQL maintains them on every write.
+    """
+    return [
+        f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)'
+        for column in columns
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for table, columns in SEARCH_TABLES.items():
+            for statement in sqlite_statements(table, columns):
+                schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, columns in SEARCH_TABLES.items():
+            for statement in postgresql_statements(table, columns):
+                schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in SEARCH_TABLES.items():
+        if vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        elif vendor == 'postgresql':
+            for column in columns:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0004_change_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
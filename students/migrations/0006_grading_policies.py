@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:31
+
+import django.core.validators
+from decimal import Decimal
+from importlib import import_module
+from django.db import migrations, models
+
+
+def restore_search_triggers(apps, schema_editor):
+    """
+    SQLite adds and drops these columns by rebuilding students_subject, which drops
+    the FTS5 sync triggers of 0005_search_index; recreate them and resync the index.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_index = import_module('students.migrations.0005_search_index')
+    table = 'students_subject'
+    for statement in search_index.sqlite_statements(table, search_index.SEARCH_TABLES[table])[1:]:
+        schema_editor.execute(statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0005_search_index'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards, after the columns are removed again
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='subject',
+            name='activity_weight',
+            field=models.DecimalField(db_default=1, decimal_places=2, default=1, max_digits=5, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='exam_weight',
+            field=models.DecimalField(db_default=1, decimal_places=2, default=1, max_digits=5, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='passing_grade',
+            field=models.DecimalField(db_default=Decimal('75.00'), decimal_places=2, default=Decimal('75.00'), max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='quiz_weight',
+            field=models.DecimalField(db_default=1, decimal_places=2, default=1, max_digits=5, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='rounding',
+            field=models.CharField(choices=[('half_up', 'Round half up'), ('down', 'Round down'), ('up', 'Round up')], db_default='half_up', default='half_up', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='total_decimals',
+            field=models.PositiveSmallIntegerField(db_default=2, default=2, validators=[django.core.validators.MaxValueValidator(2)]),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:02
+
+from importlib import import_module
+from django.db import migrations, models
+
+
+def restore_search_triggers(apps, schema_editor):
+    """
+    SQLite adds the unique constraint by rebuilding students_student, which drops the
+    FTS5 sync triggers of 0005_search_index; recreate them.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_index = import_module('students.migrations.0005_search_index')
+    table = 'students_student'
+    for statement in search_index.sqlite_statements(table, search_index.SEARCH_TABLES[table])[1:]:
+        schema_editor.execute(statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS'))
+
+
+def analyze(apps, schema_editor):
+    """
+    Refreshes the planner statistics so the new indexes are used at once: without
+    them SQLite prefers sorting the joined rows over walking students by name.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('ANALYZE')
+    elif vendor == 'postgresql':
+        schema_editor.execute('ANALYZE students_student, students_enrollment')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0007_jobs'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards, after the constraint is removed again
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['enrollment_date', 'id'], name='enrollment_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['subject', 'enrollment_date', 'id'], name='enrollment_subject_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('name', 'student_id'), name='student_name_number_uniq'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
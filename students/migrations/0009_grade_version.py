@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0008_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grade',
+            name='version',
+            field=models.PositiveIntegerField(db_default=1, default=1),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:18
+
+from importlib import import_module
+from django.db import migrations, models
+
+
+def reset_zero_weights(apps, schema_editor):
+    """
+    Subjects saved with every weight at zero (possible through the admin) get the
+    default 1/1/1 weights, so the constraint can be added.
+    """
+    Subject = apps.get_model('students', 'Subject')
+    Subject.objects.filter(activity_weight=0, quiz_weight=0, exam_weight=0).update(
+        activity_weight=1, quiz_weight=1, exam_weight=1,
+    )
+
+
+def restore_search_triggers(apps, schema_editor):
+    """
+    SQLite adds and drops the check constraint by rebuilding students_subject, which
+    drops the FTS5 sync triggers of 0005_search_index; recreate them.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_index = import_module('students.migrations.0005_search_index')
+    table = 'students_subject'
+    for statement in search_index.sqlite_statements(table, search_index.SEARCH_TABLES[table])[1:]:
+        schema_editor.execute(statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0009_grade_version'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards, after the constraint is removed again
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.RunPython(reset_zero_weights, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subject',
+            constraint=models.CheckConstraint(condition=models.Q(('activity_weight__gt', 0), ('quiz_weight__gt', 0), ('exam_weight__gt', 0), _connector='OR'), name='subject_weight_above_zero', violation_error_message='At least one component weight must be above zero.'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
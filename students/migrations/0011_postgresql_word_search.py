@@ -0,0 +1,65 @@
+from importlib import import_module
+from django.db import migrations
+
+# Table -> searchable columns; mirrors students.search.SEARCH_FIELDS
+SEARCH_TABLES = {
+    'students_student': ('name', 'student_id', 'email'),
+    'students_subject': ('name', 'code'),
+}
+
+
+def search_vector(columns):
+    # Must stay the same expression as students.search.search_vector_sql() for the index to be used
+    text = " || ' ' || ".join(columns)
+    return f"to_tsvector('simple', regexp_replace(students_unaccent({text}), '[^[:alnum:]]+', ' ', 'g'))"
+
+
+def create_word_index(apps, schema_editor):
+    """
+    On PostgreSQL, search matched substrings through the trigram indexes of
+    0005_search_index, which cannot serve tokens shorter than three characters, while
+    SQLite's FTS5 matches word prefixes. Index the words of each row in a tsvector
+    instead, whose prefix queries match what FTS5 matches and use the index at any length.
+
+    unaccent() is not IMMUTABLE, so it is wrapped in a function that is, pinned to the
+    extension's schema so the index does not depend on the search_path.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT extnamespace::regnamespace::text FROM pg_extension WHERE extname = 'unaccent'")
+        schema, = cursor.fetchone()
+    schema_editor.execute(
+        'CREATE OR REPLACE FUNCTION students_unaccent(text) RETURNS text '
+        'LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE '
+        f"AS $$ SELECT {schema}.unaccent('{schema}.unaccent'::regdictionary, $1) $$"
+    )
+    for table, columns in SEARCH_TABLES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_search ON {table} USING gin (({search_vector(columns)}))'
+        )
+        for column in columns:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+def drop_word_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    search_index = import_module('students.migrations.0005_search_index')
+    for table, columns in SEARCH_TABLES.items():
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search')
+        for statement in search_index.postgresql_statements(table, columns):
+            schema_editor.execute(statement)
+    schema_editor.execute('DROP FUNCTION IF EXISTS students_unaccent(text)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0010_subject_weight_above_zero'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_word_index, drop_word_index),
+    ]
@@ -1,4 +1,25 @@
+from decimal import Decimal
+
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Case, Count, F, Max, Min, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .caching import invalidate_all
+from .db import insert_rows
+from .grading import DEFAULT_PASSING_GRADE, DEFAULT_POLICY, POLICY_FIELDS, ROUND_HALF_UP, ROUNDING_CHOICES, GradingPolicy
+
+class LoadedValuesMixin:
+    """
+    Remembers the field values loaded from the database on `_loaded_values`, so
+    signal handlers can tell what changed on save without re-reading the row.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
 # Model for Student details
 class Student(models.Model):
@@ -11,22 +32,66 @@ class Student(models.Model):
     email = models.EmailField(unique=True)
     date_of_birth = models.DateField(null=True, blank=True) # Optional date of birth
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='student_name_id_idx'), # Keyset pagination by name
+        ]
+        constraints = [
+            # Always holds, as student_id alone is unique. Declared unique so the planner knows
+            # students come out of this index one per (name, student_id), and can walk
+            # enrollments and grades ordered by student name without sorting (see the viewsets).
+            models.UniqueConstraint(fields=['name', 'student_id'], name='student_name_number_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.student_id})"
 
 # Model for Subjects
-class Subject(models.Model):
+class Subject(LoadedValuesMixin, models.Model):
     """
-    Represents a subject offered in the system.
+    Represents a subject offered in the system, with the grading policy its
+    total grades are computed by (see students/grading.py).
     """
     name = models.CharField(max_length=255)
     code = models.CharField(max_length=20, unique=True) # Unique code for the subject
+    # Relative weights of the grade components; 1/1/1 is the plain average
+    activity_weight = models.DecimalField(
+        max_digits=5, decimal_places=2, default=1, db_default=1, validators=[MinValueValidator(0)]
+    )
+    quiz_weight = models.DecimalField(
+        max_digits=5, decimal_places=2, default=1, db_default=1, validators=[MinValueValidator(0)]
+    )
+    exam_weight = models.DecimalField(
+        max_digits=5, decimal_places=2, default=1, db_default=1, validators=[MinValueValidator(0)]
+    )
+    total_decimals = models.PositiveSmallIntegerField(default=2, db_default=2, validators=[MaxValueValidator(2)])
+    rounding = models.CharField(max_length=10, choices=ROUNDING_CHOICES, default=ROUND_HALF_UP, db_default=ROUND_HALF_UP)
+    passing_grade = models.DecimalField(
+        max_digits=5, decimal_places=2, default=DEFAULT_PASSING_GRADE, db_default=DEFAULT_PASSING_GRADE
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='subject_name_id_idx'), # Keyset pagination by name
+        ]
+        constraints = [
+            # Totals divide by the sum of the weights; checked by full_clean() too, so the admin reports it
+            models.CheckConstraint(
+                condition=models.Q(activity_weight__gt=0) | models.Q(quiz_weight__gt=0) | models.Q(exam_weight__gt=0),
+                name='subject_weight_above_zero',
+                violation_error_message="At least one component weight must be above zero.",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.code})"
 
+    @property
+    def grading_policy(self):
+        return GradingPolicy.of(self)
+
 # Model to link Students to Subjects (Enrollment)
-class Enrollment(models.Model):
+class Enrollment(LoadedValuesMixin, models.Model):
     """
     Represents a student's enrollment in a specific subject.
     This acts as a junction table between Student and Subject.
@@ -37,12 +102,67 @@ class Enrollment(models.Model):
 
     class Meta:
         unique_together = ('student', 'subject') # A student can only be enrolled in a subject once
+        indexes = [
+            # Admin changelist: newest first, optionally within a subject or a date range
+            models.Index(fields=['enrollment_date', 'id'], name='enrollment_date_id_idx'),
+            models.Index(fields=['subject', 'enrollment_date', 'id'], name='enrollment_subject_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student.name} enrolled in {self.subject.name}"
 
+# Subjects with more grades than this are recomputed in several UPDATE statements
+RECOMPUTE_BATCH_SIZE = 50000
+
+class GradeQuerySet(models.QuerySet):
+    """
+    QuerySet for Grade with set-based helpers.
+    """
+
+    def recompute_totals(self, batch_size=RECOMPUTE_BATCH_SIZE, progress=None):
+        """
+        Recalculates total_grade for every grade in the queryset under its subject's
+        grading policy, with one set-based UPDATE per subject; subjects with more than
+        `batch_size` grades are updated in id ranges of that size, to keep each
+        statement's locks and undo log bounded.
+        Use this after bulk_update() or update(), which bypass Grade.save(), and after a
+        policy change. Every grade's version is raised. The summary rows of the affected subjects and students are rebuilt afterwards.
+        `progress`, if given, is called with (grades updated, grades in total) after each statement.
+        """
+        from .changes import record # Imported here: students.changes imports this module
+
+        rows = list(self.values_list('id', 'enrollment__student_id', 'enrollment__subject_id'))
+        by_subject = {}
+        for pk, _, subject_id in rows:
+            by_subject.setdefault(subject_id, []).append(pk)
+        policies = {subject.pk: subject.grading_policy for subject in Subject.objects.filter(pk__in=by_subject)}
+
+        updated = 0
+        try:
+            for subject_id, ids in by_subject.items():
+                grades = self.filter(enrollment__subject_id=subject_id)
+                total = policies[subject_id].total_expression()
+                statements = [grades]
+                if len(ids) > batch_size:
+                    ids.sort()
+                    statements = [
+                        grades.filter(pk__gte=ids[start], pk__lte=ids[min(start + batch_size, len(ids)) - 1])
+                        for start in range(0, len(ids), batch_size)
+                    ]
+                for statement in statements:
+                    updated += statement.update(total_grade=total, version=F('version') + 1)
+                    if progress is not None:
+                        progress(updated, len(rows))
+        finally:
+            # Also after an interrupted run: the rebuilt summaries match whatever was written
+            SubjectSummary.objects.rebuild(by_subject)
+            StudentSummary.objects.rebuild({student_id for _, student_id, _ in rows})
+            record(Grade, [pk for pk, _, _ in rows])
+            invalidate_all()
+        return updated
+
 # Model for Grades
-class Grade(models.Model):
+class Grade(LoadedValuesMixin, models.Model):
     """
     Stores grades for a specific enrollment (student in a subject).
     Includes grades for activities, quizzes, and exams.
@@ -52,17 +172,323 @@ class Grade(models.Model):
     activity_grade = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     quiz_grade = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     exam_grade = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
-    # You might want to add weights for a more realistic total grade calculation
-    # For simplicity, we'll average them here.
+    # Weighted and rounded by the subject's grading policy
     total_grade = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
+    # Raised by every write to the row; batched updates name the version they were based on
+    version = models.PositiveIntegerField(default=1, db_default=1)
+
+    objects = GradeQuerySet.as_manager()
+
+    @staticmethod
+    def compute_total(activity_grade, quiz_grade, exam_grade, policy=DEFAULT_POLICY):
+        """
+        Returns the total grade for the given components under a grading policy.
+        GradeQuerySet.recompute_totals() computes the same in SQL.
+        """
+        return policy.total(activity_grade, quiz_grade, exam_grade)
+
+    def grading_policy(self):
+        """
+        The policy of the subject this grade belongs to, read without loading the subject if it is not cached.
+        """
+        if Grade.enrollment.is_cached(self) and Enrollment.subject.is_cached(self.enrollment):
+            return self.enrollment.subject.grading_policy
+        values = Subject.objects.filter(enrollments=self.enrollment_id).values_list(*POLICY_FIELDS).first()
+        return DEFAULT_POLICY if values is None else GradingPolicy(*values)
 
     def save(self, *args, **kwargs):
         """
         Overrides the save method to calculate the total_grade automatically.
         """
-        # Basic average calculation. You can implement more complex weighting here.
-        self.total_grade = (self.activity_grade + self.quiz_grade + self.exam_grade) / 3
+        self.total_grade = self.compute_total(self.activity_grade, self.quiz_grade, self.exam_grade, self.grading_policy())
+        updating = not self._state.adding
+        if updating:
+            # Counted by the database, so an instance loaded long ago cannot reuse a version
+            self.version = F('version') + 1
         super().save(*args, **kwargs) # Call the "real" save method
+        if updating:
+            self.refresh_from_db(fields=['version'])
+
+    def __str__(self):
+        return f"Grades for {self.enrollment.student.name} in {self.enrollment.subject.name}"
+
+    def summary_values(self):
+        """
+        Returns the (activity, quiz, exam, total) tuple the summaries aggregate,
+        rounded the way the database stores them.
+        """
+        cent = Decimal('0.01')
+        return tuple(
+            Decimal(str(value)).quantize(cent)
+            for value in (self.activity_grade, self.quiz_grade, self.exam_grade, self.total_grade)
+        )
+
+# Columns aggregated into the summary rows: summary field -> Grade field
+SUMMARY_SUMS = {
+    'activity_sum': 'activity_grade',
+    'quiz_sum': 'quiz_grade',
+    'exam_sum': 'exam_grade',
+    'total_sum': 'total_grade',
+}
+
+# Rebuilding more groups than this recomputes the whole table instead
+FULL_REBUILD_THRESHOLD = 10000
+
+class GradeSummaryQuerySet(models.QuerySet):
+    """
+    Maintains the summary rows of a GradeSummary model.
+    `self.model.group_field` names the Enrollment foreign key being summarized.
+    """
+
+    def compute(self, ids=None):
+        """
+        Returns unsaved summary instances computed from scratch with GROUP BY queries.
+        Pass `ids` to limit the computation to some subjects/students.
+        """
+        group = self.model.group_field
+        groups = self.model._meta.get_field(group).related_model.objects.all()
+        enrollments = Enrollment.objects.all()
+        grades = Grade.objects.all()
+        if ids is not None:
+            ids = list(ids)
+            groups = groups.filter(pk__in=ids)
+            enrollments = enrollments.filter(**{f'{group}_id__in': ids})
+            grades = grades.filter(**{f'enrollment__{group}_id__in': ids})
+
+        counts = dict(
+            enrollments.values_list(f'{group}_id').annotate(count=Count('id')).order_by()
+        )
+        aggregates = {
+            row.pop('group'): row for row in
+            grades.values(group=F(f'enrollment__{group}_id')).annotate(
+                grade_count=Count('id'),
+                total_squares=Sum(
+                    F('total_grade') * F('total_grade'), output_field=models.DecimalField(max_digits=20, decimal_places=4)
+                ),
+                total_min=Min('total_grade'),
+                total_max=Max('total_grade'),
+                **{name: Sum(field) for name, field in SUMMARY_SUMS.items()},
+            ).order_by()
+        }
+        return [
+            self.model(**{f'{group}_id': pk, 'enrollment_count': counts.get(pk, 0), **aggregates.get(pk, {})})
+            for pk in groups.values_list('pk', flat=True).iterator()
+        ]
+
+    def rebuild(self, ids=None, batch_size=500):
+        """
+        Recomputes and upserts the summary rows. Used by the bulk write paths, where
+        per-row deltas are unavailable, and by `manage.py rebuild_summaries`.
+        """
+        if ids is not None:
+            ids = list(ids)
+        if ids is None or len(ids) > FULL_REBUILD_THRESHOLD:
+            # One unfiltered GROUP BY beats hundreds of IN (...) batches
+            self._upsert(self.compute())
+            return
+        for start in range(0, len(ids), batch_size):
+            self._upsert(self.compute(ids[start:start + batch_size]))
+
+    def mismatches(self, tolerance=Decimal('0.01')):
+        """
+        Compares every stored summary with a fresh computation.
+        Returns a list of (group id, field, stored value, expected value).
+        """
+        group = f'{self.model.group_field}_id'
+        stored = {getattr(summary, group): summary for summary in self.all()}
+        fields = [f.name for f in self.model._meta.concrete_fields if not f.primary_key]
+        problems = []
+        for expected in self.compute():
+            pk = getattr(expected, group)
+            actual = stored.get(pk)
+            if actual is None:
+                problems.append((pk, 'row', None, 'missing'))
+                continue
+            for field in fields:
+                have, want = getattr(actual, field), getattr(expected, field)
+                if have is None or want is None:
+                    if have != want:
+                        problems.append((pk, field, have, want))
+                elif abs(Decimal(have) - Decimal(want)) > tolerance:
+                    problems.append((pk, field, have, want))
+        return problems
+
+    def _upsert(self, summaries):
+        fields = [f for f in self.model._meta.concrete_fields]
+        pk = self.model._meta.pk.column
+        insert_rows(
+            self.model._meta.db_table,
+            [f.column for f in fields],
+            [[getattr(summary, f.attname) for f in fields] for summary in summaries],
+            conflict=pk,
+            update=[f.column for f in fields if f.column != pk],
+        )
+
+    def apply_delta(self, group_id, enrollments=0, old=None, new=None):
+        """
+        Applies one enrollment/grade change to a summary row with a single UPDATE.
+
+        `old` and `new` are Grade.summary_values() tuples before and after the change
+        (None for a creation or deletion). Min/max only need a rescan of the group when
+        the removed value was the current extreme; that is done with a subquery inside
+        the same UPDATE.
+        """
+        group = self.model.group_field
+        updates = {}
+        if enrollments:
+            updates['enrollment_count'] = F('enrollment_count') + enrollments
+        if old is not None or new is not None:
+            zero = (0, 0, 0, 0)
+            before, after = old or zero, new or zero
+            updates['grade_count'] = F('grade_count') + int(new is not None) - int(old is not None)
+            for index, name in enumerate(SUMMARY_SUMS):
+                updates[name] = F(name) + (after[index] - before[index])
+            updates['total_squares'] = F('total_squares') + (after[3] * after[3] - before[3] * before[3])
+
+            group_grades = Grade.objects.filter(**{f'enrollment__{group}_id': OuterRef(group)}).values(
+                f'enrollment__{group}_id'
+            )
+            for name, pick, aggregate in (('total_min', Least, Min), ('total_max', Greatest, Max)):
+                current = F(name)
+                if new is not None:
+                    # Coalesce so an empty group (NULL extreme) takes the new value
+                    current = pick(Coalesce(F(name), Value(after[3])), Value(after[3]))
+                if old is not None:
+                    rescan = Subquery(group_grades.annotate(extreme=aggregate('total_grade')).values('extreme'))
+                    current = Case(When(**{name: before[3]}, then=rescan), default=current)
+                updates[name] = current
+        updated = self.filter(**{group: group_id}).update(**updates) if updates else 0
+        # Rows created before summaries existed (or via bulk_create) are built on first use.
+        # Removals are skipped: during a cascade the summary row may already be deleted.
+        if updates and not updated and (new is not None or enrollments > 0):
+            self.rebuild([group_id])
+
+# Base model for the per-subject and per-student summaries
+class GradeSummary(models.Model):
+    """
+    Materialized grade aggregates, kept up to date incrementally by the signal
+    handlers in students/signals.py and rebuilt by the bulk write paths.
+    Averages and standard deviations are derived from the stored sums, so reading
+    them is a single primary-key lookup.
+    """
+    enrollment_count = models.PositiveIntegerField(default=0)
+    grade_count = models.PositiveIntegerField(default=0)
+    activity_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quiz_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    exam_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_squares = models.DecimalField(max_digits=20, decimal_places=4, default=0) # Sum of total_grade^2
+    total_min = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    total_max = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+
+    objects = GradeSummaryQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def mean(self, field='total_sum'):
+        if not self.grade_count:
+            return None
+        return getattr(self, field) / self.grade_count
+
+    @property
+    def total_mean(self):
+        return self.mean('total_sum')
+
+    @property
+    def total_stddev(self):
+        """
+        Population standard deviation of total_grade: sqrt(E[x^2] - E[x]^2).
+        """
+        if not self.grade_count:
+            return None
+        variance = self.total_squares / self.grade_count - self.total_mean ** 2
+        return max(variance, 0).sqrt()
+
+# Summary per subject
+class SubjectSummary(GradeSummary):
+    group_field = 'subject'
+    subject = models.OneToOneField(Subject, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+
+    def __str__(self):
+        return f"Summary for {self.subject_id}"
+
+# Summary per student
+class StudentSummary(GradeSummary):
+    group_field = 'student'
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+
+    def __str__(self):
+        return f"Summary for {self.student_id}"
+
+# Change log for delta sync
+class Change(models.Model):
+    """
+    One created/updated/deleted row of Student, Subject, Enrollment or Grade.
+    The auto-increment id is the sync cursor: clients ask for changes after the
+    last id they have seen (see students/changes.py).
+    """
+    model = models.CharField(max_length=20) # 'student', 'subject', 'enrollment' or 'grade'
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{'Deleted' if self.deleted else 'Changed'} {self.model} {self.object_id}"
+
+# Response cache versions shared by every process (see students/caching.py)
+class CacheVersion(models.Model):
+    """
+    The current version of one response cache scope (e.g. 'students:list' or 'student:42'),
+    used when settings.API_CACHE_VERSIONS is 'database' so that web and job worker processes
+    see each other's invalidations. A scope without a row has never been bumped; rows are
+    never deleted.
+    """
+    scope = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.scope} @ {self.version}"
+
+# Background jobs, run by `manage.py run_workers` (see students/jobs.py)
+class Job(models.Model):
+    """
+    A long-running operation (grade import, export, total recomputation) queued to
+    run outside the request cycle. Workers claim queued jobs, report progress on
+    the row and stop at the next progress report once cancel_requested is set.
+    """
+    QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+    kind = models.CharField(max_length=30) # A key of students.jobs.JOB_KINDS
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    params = models.JSONField(default=dict, blank=True)
+    # File names under settings.JOB_FILES_DIR: the uploaded input and the produced output
+    input_file = models.CharField(max_length=255, blank=True)
+    output_file = models.CharField(max_length=255, blank=True)
+    progress = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True) # Unknown until the job reports it
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0) # Times a worker has started the job
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=100, blank=True) # host:pid of the run_workers process
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # Refreshed while a worker holds the job
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_id_idx'), # Claiming the oldest queued job
+        ]
 
     def __str__(self):
-        return f"Grades for {self.enrollment.student.name} in {self.enrollment.subject.name}"
\ No newline at end of file
+        return f"Job {self.pk} ({self.kind}, {self.status})"
@@ -0,0 +1,152 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset (cursor) pagination for the router endpoints.
+
+    Pagination only kicks in when the request carries a `cursor` or `page_size`
+    query parameter, so existing clients keep receiving the full unpaginated list.
+    The queryset's own ordering (e.g. `name` or `student__name`) is reused with the
+    primary key appended as a tiebreaker, and each page is fetched with a
+    `WHERE (key, pk) > (last_key, last_pk)` filter instead of an OFFSET scan.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None  # Not requested: keep the legacy unpaginated response
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.keys = [f'_cursor_{i}' for i in range(len(self.ordering))]
+
+        reverse, position = self.decode_cursor(request)
+
+        # Expose the ordering values as plain columns so they can be read back from
+        # the boundary rows without touching related objects.
+        queryset = queryset.annotate(**{
+            key: F(field.lstrip('-')) for key, field in zip(self.keys, self.ordering)
+        })
+        if position is not None:
+            queryset = queryset.filter(self.build_filter(position, reverse))
+        order = [self.invert(field) if reverse else field for field in self.ordering]
+
+        # Fetch one extra row to learn whether another page follows.
+        results = list(queryset.order_by(*order)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """
+        Returns the queryset's ordering with the primary key appended as a tiebreaker.
+        """
+        ordering = list(queryset.query.order_by) or ['pk']
+        if not {'pk', '-pk', 'id', '-id'} & set(ordering):
+            descending = ordering[0].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def build_filter(self, position, reverse):
+        """
+        Builds the keyset condition `(a, b, c) > (x, y, z)` as a chain of OR-ed prefixes,
+        plus the redundant `a >= x`: with more than two keys SQLite only turns the OR
+        chain into a range seek on the index with that bound spelled out.
+        """
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            clause = Q(**{f'{self.keys[i]}__{lookup}': position[i]})
+            for j in range(i):
+                clause &= Q(**{self.keys[j]: position[j]})
+            condition |= clause
+        descending = self.ordering[0].startswith('-') != reverse
+        return Q(**{f"{self.keys[0]}__{'lte' if descending else 'gte'}": position[0]}) & condition
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        if isinstance(instance, dict): # A values() row
+            position = [instance[key] for key in self.keys]
+        else:
+            position = [getattr(instance, key) for key in self.keys]
+        payload = json.dumps({'r': reverse, 'p': position}, cls=DjangoJSONEncoder)
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return False, None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            reverse, position = bool(payload['r']), payload['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
@@ -0,0 +1,233 @@
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger('students.performance')
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+VALUES_RE = re.compile(r'(\((?:%s, )*%s\))(?:, \((?:%s, )*%s\))+')
+IN_LIST_RE = re.compile(r'\(%s(?:, %s)+\)')
+
+# Distinct SQL shapes kept per process; further shapes are counted under OTHER_SHAPE
+MAX_SHAPES = 1000
+OTHER_SHAPE = '<other>'
+
+
+def sql_shape(sql):
+    """
+    Reduces a statement to its shape: inline literals become ?, and IN lists and
+    multi-row VALUES collapse, so the same query with different arguments or batch
+    sizes counts as one.
+    """
+    sql = LITERAL_RE.sub('?', sql)
+    sql = VALUES_RE.sub(r'\1', sql)
+    return IN_LIST_RE.sub('(%s, ...)', sql)
+
+
+class RequestMetrics:
+    """
+    Timings of one request. Installed as an execute wrapper on every database
+    connection, it counts and times each statement by its SQL text.
+    """
+
+    def __init__(self, slow_query):
+        self.slow_query = slow_query
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = {} # sql -> [count, seconds]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            entry = self.statements.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed >= self.slow_query:
+                logger.warning("Slow query (%.0f ms): %s", elapsed * 1000, sql_shape(sql))
+
+    def collecting(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def shapes(self):
+        """
+        Returns {shape: [count, seconds]}, merging statements of the same shape.
+        """
+        shapes = {}
+        for sql, (count, seconds) in self.statements.items():
+            entry = shapes.setdefault(sql_shape(sql), [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        return shapes
+
+
+def add_render_time(request, seconds):
+    """
+    Attributes rendering done inside a view (e.g. before caching the body) to the request.
+    """
+    metrics = getattr(request, '_performance', None)
+    if metrics is not None:
+        metrics.render_time += seconds
+
+
+class PerformanceStats:
+    """
+    Per-process totals by endpoint and by SQL shape, served by /api/performance/.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.since = timezone.now()
+            self.endpoints = {}
+            self.shapes = {}
+
+    def add(self, endpoint, metrics, total, size, shapes, slow):
+        with self.lock:
+            entry = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'slow': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'db_ms': 0.0, 'queries': 0, 'bytes': 0,
+            })
+            entry['requests'] += 1
+            entry['slow'] += slow
+            entry['total_ms'] += total * 1000
+            entry['max_ms'] = max(entry['max_ms'], total * 1000)
+            entry['db_ms'] += metrics.db_time * 1000
+            entry['queries'] += metrics.queries
+            entry['bytes'] += size or 0
+            for shape, (count, seconds) in shapes.items():
+                if shape not in self.shapes and len(self.shapes) >= MAX_SHAPES:
+                    shape = OTHER_SHAPE
+                entry = self.shapes.setdefault(shape, {'count': 0, 'total_ms': 0.0, 'endpoints': set()})
+                entry['count'] += count
+                entry['total_ms'] += seconds * 1000
+                entry['endpoints'].add(endpoint)
+
+    def snapshot(self, limit=20):
+        """
+        The top endpoints and SQL shapes by cumulative time.
+        """
+        with self.lock:
+            endpoints = [
+                {
+                    'endpoint': name, **values,
+                    'mean_ms': values['total_ms'] / values['requests'],
+                    'mean_queries': values['queries'] / values['requests'],
+                }
+                for name, values in self.endpoints.items()
+            ]
+            shapes = [
+                {
+                    'sql': shape, 'count': values['count'], 'total_ms': values['total_ms'],
+                    'mean_ms': values['total_ms'] / values['count'], 'endpoints': sorted(values['endpoints']),
+                }
+                for shape, values in self.shapes.items()
+            ]
+            since = self.since
+        endpoints.sort(key=lambda row: row['total_ms'], reverse=True)
+        shapes.sort(key=lambda row: row['total_ms'], reverse=True)
+        return {'since': since, 'endpoints': endpoints[:limit], 'queries': shapes[:limit]}
+
+
+stats = PerformanceStats()
+
+
+class PerformanceMiddleware:
+    """
+    Measures every request: wall time, query count and database time, response
+    rendering time and response size. Adds them as a Server-Timing header, logs slow
+    requests and queries and repeated SQL shapes (N+1 patterns) to 'students.performance',
+    and adds everything to the per-process report at /api/performance/.
+
+    Only installed when PERF_MONITORING is set; otherwise Django drops it from the
+    middleware chain entirely.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_MONITORING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_request = settings.PERF_SLOW_REQUEST_MS / 1000
+        self.slow_query = settings.PERF_SLOW_QUERY_MS / 1000
+        self.repeated = settings.PERF_REPEATED_QUERY_THRESHOLD
+
+    def __call__(self, request):
+        metrics = request._performance = RequestMetrics(self.slow_query)
+        started = time.perf_counter()
+        with metrics.collecting():
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        response['Server-Timing'] = self.server_timing(metrics, elapsed)
+
+        if response.streaming and not response.is_async:
+            # Exports run most of their queries while the body streams out
+            response.streaming_content = self.stream(request, response, response.streaming_content, metrics, started)
+        else:
+            self.finish(request, response, metrics, elapsed, len(response.content))
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that separately
+        metrics = getattr(request, '_performance', None)
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def stream(self, request, response, content, metrics, started):
+        size = 0
+        try:
+            with metrics.collecting():
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.finish(request, response, metrics, time.perf_counter() - started, size)
+
+    def server_timing(self, metrics, elapsed):
+        app = max(0.0, elapsed - metrics.db_time - metrics.render_time)
+        return (
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+            f'render;dur={metrics.render_time * 1000:.1f}, '
+            f'app;dur={app * 1000:.1f}, '
+            f'total;dur={elapsed * 1000:.1f}'
+        )
+
+    def finish(self, request, response, metrics, elapsed, size):
+        match = request.resolver_match
+        endpoint = f'{request.method} {match.view_name if match else "<unresolved>"}'
+        shapes = metrics.shapes()
+        for shape, (count, seconds) in shapes.items():
+            if count >= self.repeated:
+                logger.warning(
+                    "Repeated query on %s (%d times, %.0f ms): %s", endpoint, count, seconds * 1000, shape,
+                )
+        slow = elapsed >= self.slow_request
+        if slow:
+            logger.warning(
+                "Slow request: %s %s -> %d in %.0f ms (%d queries, %.0f ms db, %.0f ms render, %d bytes)",
+                request.method, request.get_full_path(), response.status_code, elapsed * 1000,
+                metrics.queries, metrics.db_time * 1000, metrics.render_time * 1000, size,
+            )
+        stats.add(endpoint, metrics, elapsed, size, shapes, slow)
@@ -0,0 +1,177 @@
+from collections import namedtuple
+from datetime import timedelta
+
+import sqlparse
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .caching import invalidate_all
+from .models import CacheVersion, Student, Subject, Enrollment, Grade, Job
+from .views import StudentViewSet, SubjectViewSet, EnrollmentViewSet, GradeViewSet, JobViewSet
+
+# One audited statement and what SQLite's EXPLAIN QUERY PLAN says about it.
+# `problems` lists the plan lines that scan a whole table or sort in a temporary B-tree.
+PlanReport = namedtuple('PlanReport', 'source sql plan problems')
+
+LIST_VIEWSETS = {
+    'students': StudentViewSet, 'subjects': SubjectViewSet, 'enrollments': EnrollmentViewSet,
+    'grades': GradeViewSet, 'jobs': JobViewSet,
+}
+
+
+def query_plan(sql, params):
+    """
+    Returns EXPLAIN QUERY PLAN as (depth, detail) rows; depth 0 is the statement's own loops.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+    depths = {0: -1}
+    plan = []
+    for node, parent, _, detail in rows:
+        depths[node] = depths.get(parent, -1) + 1
+        plan.append((depths[node], detail))
+    return plan
+
+
+def plan_problems(sql, plan):
+    """
+    The plan lines to fix: a temporary B-tree sort anywhere, or a SCAN of a table in
+    the statement's own loops. One scan is fine in a statement without a WHERE clause,
+    as the outer loop (a LIMITed page or a count reads the table or index in order).
+    Scans in subqueries and coroutines read their own small results and are left alone.
+    """
+    statement = sqlparse.parse(sql)[0]
+    filtered = any(isinstance(token, sqlparse.sql.Where) for token in statement.tokens)
+    problems = []
+    loops = 0
+    for depth, detail in plan:
+        if 'TEMP B-TREE' in detail:
+            problems.append(detail)
+        elif depth == 0 and detail.startswith(('SCAN', 'SEARCH')):
+            loops += 1
+            if detail.startswith('SCAN') and not detail.startswith('SCAN CONSTANT') and (filtered or loops > 1):
+                problems.append(detail)
+    return problems
+
+
+def capture(client, path):
+    """
+    Requests `path` and returns the SELECT statements it ran as (sql, params) pairs.
+    """
+    statements = []
+
+    def record(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        response = client.get(path)
+    if response.status_code != 200:
+        raise AssertionError(f'GET {path} returned {response.status_code}')
+    return response, statements
+
+
+def follow(client, path):
+    """
+    Yields (source, statements) for `path` and, when it returns a page, for the next
+    page and for the previous page from there.
+    """
+    response, statements = capture(client, path)
+    yield path, statements
+    url = response.json().get('next')
+    if url:
+        response, statements = capture(client, url)
+        yield f'{path} (next page)', statements
+        url = response.json().get('previous')
+        if url:
+            yield f'{path} (previous page)', capture(client, url)[1]
+
+
+def list_queries(user):
+    """
+    The full list queryset of each viewset, as an unpaginated request builds it; these
+    are explained without being run.
+    """
+    for name, viewset_class in LIST_VIEWSETS.items():
+        request = APIRequestFactory().get(f'/api/{name}/')
+        request.user = user
+        viewset = viewset_class(action='list', args=(), kwargs={}, format_kwarg=None)
+        viewset.request = Request(request)
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        yield f'/api/{name}/ (queryset)', *queryset.query.sql_with_params()
+
+
+def audit_paths():
+    """
+    The requests to audit: every viewset's first, next and previous pages and detail
+    route, and the admin changelists with their filters. Rows are picked from the middle
+    of the tables so the pages are not the first ones.
+    """
+    student = Student.objects.order_by('pk')[Student.objects.count() // 2]
+    enrollment = Enrollment.objects.filter(student=student).order_by('pk').first()
+    grade = Grade.objects.filter(enrollment=enrollment).first()
+    subject = Subject.objects.order_by('pk').first()
+    job = Job.objects.order_by('pk').first()
+    details = {'students': student, 'subjects': subject, 'enrollments': enrollment, 'grades': grade, 'jobs': job}
+
+    paths = []
+    for name in LIST_VIEWSETS:
+        paths.append(f'/api/{name}/?page_size=100')
+        if details[name] is not None:
+            paths.append(f'/api/{name}/{details[name].pk}/')
+    paths += [
+        '/api/students/?page_size=100&fields=id,name,enrollments',
+        '/api/enrollments/?page_size=100&fields=id,student,subject',
+    ]
+    date = enrollment.enrollment_date
+    admin_paths = [
+        '/admin/students/student/', '/admin/students/subject/', '/admin/students/enrollment/',
+        f'/admin/students/enrollment/?subject__id__exact={subject.pk}',
+        f'/admin/students/enrollment/?enrollment_date__gte={date}&enrollment_date__lt={date + timedelta(days=30)}',
+        '/admin/students/grade/', f'/admin/students/grade/?subject={subject.pk}',
+        f'/admin/students/job/?status__exact={Job.QUEUED}',
+    ]
+    return paths, admin_paths
+
+
+def audit():
+    """
+    Runs the audited requests in a transaction that is rolled back and returns a
+    PlanReport for every distinct statement they ran, plus the full list querysets.
+    Only SQLite plans are read; other databases raise NotImplementedError.
+    """
+    if connection.vendor != 'sqlite':
+        raise NotImplementedError('The query plan audit reads SQLite query plans only.')
+    reports = {}
+
+    def add(source, sql, params):
+        ignored = ('django_session', 'auth_user', CacheVersion._meta.db_table) # Looked up by primary key
+        if sql not in reports and not any(table in sql for table in ignored):
+            plan = query_plan(sql, params)
+            reports[sql] = PlanReport(source, sql, plan, plan_problems(sql, plan))
+
+    with transaction.atomic():
+        user = User.objects.create_superuser('query-plan-audit', 'audit@example.com', None)
+        client = Client()
+        client.force_login(user)
+        invalidate_all() # Responses served from the cache would run no queries
+        try:
+            paths, admin_paths = audit_paths()
+            for path in paths:
+                for source, statements in follow(client, path):
+                    for sql, params in statements:
+                        add(source, sql, params)
+            for path in admin_paths:
+                for sql, params in capture(client, path)[1]:
+                    add(path, sql, params)
+            for source, sql, params in list_queries(user):
+                add(source, sql, params)
+        finally:
+            invalidate_all()
+            transaction.set_rollback(True)
+    return list(reports.values())
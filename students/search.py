@@ -0,0 +1,131 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+
+from .models import Student, Subject
+
+# Searchable columns per model. Kept in sync with migrations 0005_search_index, which
+# builds the SQLite FTS5 tables (and their triggers), and 0011_postgresql_word_search,
+# which indexes search_vector_sql() on PostgreSQL.
+SEARCH_FIELDS = {
+    Student: ('name', 'student_id', 'email'),
+    Subject: ('name', 'code'),
+}
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Shorter prefixes match too many rows to rank them all; return them in id order instead.
+MIN_RANKED_LENGTH = 3
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query or '')
+
+
+def _fts_query(tokens):
+    """
+    Builds an FTS5 MATCH expression requiring every token as a prefix: "jo"* "sm"*
+    Tokens are quoted, so user input can never inject FTS5 syntax.
+    """
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_vector_sql(model):
+    """
+    The searchable columns as a PostgreSQL tsvector holding the words FTS5 sees on
+    SQLite: runs of letters and digits, lowercased and without diacritics. Migration
+    0011 builds a GIN index on this expression.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = " || ' ' || ".join(f'{table}.{connection.ops.quote_name(field)}' for field in SEARCH_FIELDS[model])
+    return f"to_tsvector('simple', regexp_replace(students_unaccent({columns}), '[^[:alnum:]]+', ' ', 'g'))"
+
+
+def _postgresql_filter(model, tokens):
+    """
+    Every token must be a prefix of a word in one of the searchable columns, as with
+    FTS5. Prefix queries on the GIN index serve tokens of any length, one letter too.
+    Tokens are word characters only, so they cannot inject tsquery syntax.
+    """
+    query = ' & '.join(f'{token}:*' for token in tokens)
+    sql = f"{search_vector_sql(model)} @@ to_tsquery('simple', students_unaccent(%s))"
+    return RawSQL(sql, [query], output_field=BooleanField())
+
+
+def _fallback_filter(model, tokens):
+    """
+    Other databases: every token must appear somewhere in one of the searchable
+    columns, which also matches inside words.
+    """
+    condition = Q()
+    for token in tokens:
+        any_field = Q()
+        for field in SEARCH_FIELDS[model]:
+            any_field |= Q(**{f'{field}__icontains': token})
+        condition &= any_field
+    return condition
+
+
+def _search_filter(model, tokens):
+    if connection.vendor == 'postgresql':
+        return _postgresql_filter(model, tokens)
+    return _fallback_filter(model, tokens)
+
+
+def matching_ids(model, query):
+    """
+    Returns an expression for `pk__in=` selecting every row matching `query`,
+    or None if the query has no searchable tokens. Used by the admin changelists.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    if connection.vendor == 'sqlite':
+        table = connection.ops.quote_name(fts_table(model))
+        return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [_fts_query(tokens)])
+    return model.objects.filter(_search_filter(model, tokens)).values('pk')
+
+
+def search(model, query, limit=DEFAULT_LIMIT):
+    """
+    Returns up to `limit` rows of `model` matching `query` as flat dicts, best matches first.
+    Every word of the query is matched as a prefix, so it also serves typeahead.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    fields = ('id', *SEARCH_FIELDS[model])
+
+    if connection.vendor == 'sqlite':
+        table = connection.ops.quote_name(fts_table(model))
+        ranked = max(len(token) for token in tokens) >= MIN_RANKED_LENGTH
+        order = 'ORDER BY rank' if ranked else ''
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {table} WHERE {table} MATCH %s {order} LIMIT %s',
+                [_fts_query(tokens), limit],
+            )
+            ids = [pk for pk, in cursor.fetchall()]
+        rows = {row['id']: row for row in model.objects.filter(pk__in=ids).values(*fields)}
+        return [rows[pk] for pk in ids if pk in rows]
+
+    # Rows whose first searchable column starts with the first word come first.
+    starts_with = Case(
+        When(**{f'{SEARCH_FIELDS[model][0]}__istartswith': tokens[0]}, then=0),
+        default=1,
+        output_field=IntegerField(),
+    )
+    return list(
+        model.objects.filter(_search_filter(model, tokens))
+        .annotate(starts_with=starts_with)
+        .order_by('starts_with', SEARCH_FIELDS[model][0], 'id')
+        .values(*fields)[:limit]
+    )
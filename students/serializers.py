@@ -1,17 +1,41 @@
 from rest_framework import serializers
-from .models import Student, Subject, Enrollment, Grade
+from rest_framework.reverse import reverse
+from .bulk import MAX_GRADE_UPDATES
+from .importers import GRADE_COLUMNS, detect_format
+from .jobs import JOB_KINDS
+from .models import Student, Subject, Enrollment, Grade, Job
 
 # Serializer for the Grade model
 class GradeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Grade
-        fields = ['id', 'enrollment', 'activity_grade', 'quiz_grade', 'exam_grade', 'total_grade']
-        read_only_fields = ['total_grade'] # total_grade is calculated automatically
+        fields = ['id', 'enrollment', 'activity_grade', 'quiz_grade', 'exam_grade', 'total_grade', 'version']
+        read_only_fields = ['total_grade', 'version'] # total_grade is calculated automatically
+
+# Serializer for the Subject model
+class SubjectSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Subject
+        fields = ['id', 'name', 'code']
+
+# Serializer for a subject's grading policy (/api/subjects/<id>/policy/)
+class GradingPolicySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Subject
+        fields = ['activity_weight', 'quiz_weight', 'exam_weight', 'total_decimals', 'rounding', 'passing_grade']
+
+    def validate(self, attrs):
+        weights = [
+            attrs.get(field, getattr(self.instance, field, 1)) for field in ('activity_weight', 'quiz_weight', 'exam_weight')
+        ]
+        if not sum(weights):
+            raise serializers.ValidationError("At least one component weight must be above zero.")
+        return attrs
 
 # Serializer for the Enrollment model
 class EnrollmentSerializer(serializers.ModelSerializer):
-    # Nested serializer to display subject name and code within enrollment
-    subject_details = serializers.SerializerMethodField(read_only=True)
+    # Nested serializer to display subject id, name and code within enrollment
+    subject_details = SubjectSerializer(source='subject', read_only=True)
     # Nested serializer for grades related to this enrollment
     grades = GradeSerializer(read_only=True) # Use read_only=True as grades are often created/updated separately
 
@@ -19,16 +43,6 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         model = Enrollment
         fields = ['id', 'student', 'subject', 'enrollment_date', 'subject_details', 'grades']
 
-    def get_subject_details(self, obj):
-        """
-        Returns a dictionary containing details of the enrolled subject.
-        """
-        return {
-            'id': obj.subject.id,
-            'name': obj.subject.name,
-            'code': obj.subject.code
-        }
-
 # Serializer for the Student model
 class StudentSerializer(serializers.ModelSerializer):
     # Nested serializer to display subjects enrolled by the student
@@ -39,8 +53,170 @@ class StudentSerializer(serializers.ModelSerializer):
         model = Student
         fields = ['id', 'name', 'student_id', 'email', 'date_of_birth', 'enrollments']
 
-# Serializer for the Subject model
-class SubjectSerializer(serializers.ModelSerializer):
+# Serializer for the bulk enrollment endpoint
+class BulkEnrollmentSerializer(serializers.Serializer):
+    """
+    Accepts either an explicit list of pairs:
+        {"enrollments": [{"student": 1, "subject": 2}, ...]}
+    or a whole set of students for one subject:
+        {"subject": 2, "students": [1, 3, 5]}
+    """
+    enrollments = serializers.ListField(child=serializers.DictField(), required=False)
+    subject = serializers.IntegerField(required=False)
+    students = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate_enrollments(self, value):
+        pairs = []
+        for index, row in enumerate(value):
+            try:
+                pairs.append((int(row['student']), int(row['subject'])))
+            except (KeyError, TypeError, ValueError):
+                raise serializers.ValidationError(f"Row {index} needs integer 'student' and 'subject' ids.")
+        return pairs
+
+    def validate(self, attrs):
+        if 'enrollments' in attrs:
+            if 'subject' in attrs or 'students' in attrs:
+                raise serializers.ValidationError("Send either 'enrollments' or 'subject' with 'students', not both.")
+            attrs['pairs'] = attrs['enrollments']
+        elif 'subject' in attrs and 'students' in attrs:
+            attrs['pairs'] = [(student_id, attrs['subject']) for student_id in attrs['students']]
+        else:
+            raise serializers.ValidationError("Send 'enrollments' or 'subject' with 'students'.")
+        return attrs
+
+
+# Serializer for one change of a batched grade update
+class GradePatchSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField()
+    version = serializers.IntegerField(min_value=1) # The version the new values are based on
+
     class Meta:
-        model = Subject
-        fields = ['id', 'name', 'code']
\ No newline at end of file
+        model = Grade
+        fields = ['id', 'version', *GRADE_COLUMNS]
+        extra_kwargs = {field: {'required': False} for field in GRADE_COLUMNS}
+
+    def validate(self, attrs):
+        if not any(field in attrs for field in GRADE_COLUMNS):
+            raise serializers.ValidationError(f"Give a new value for at least one of {', '.join(GRADE_COLUMNS)}.")
+        return attrs
+
+# Serializer for the batched grade update endpoint
+class GradeBatchSerializer(serializers.Serializer):
+    """
+    Accepts the changes to apply together:
+        {"grades": [{"id": 7, "version": 3, "exam_grade": "91.50"}, ...]}
+    """
+    grades = GradePatchSerializer(many=True, allow_empty=False, max_length=MAX_GRADE_UPDATES)
+
+    def validate_grades(self, value):
+        ids = [patch['id'] for patch in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError("Each grade may only be changed once per batch.")
+        return value
+
+# Serializer for the query parameters of the analytics endpoints
+class AnalyticsQuerySerializer(serializers.Serializer):
+    passing_grade = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    field = serializers.ChoiceField(
+        choices=['activity_grade', 'quiz_grade', 'exam_grade', 'total_grade'], default='total_grade'
+    )
+    bucket_size = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    student = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+
+# Serializer for the materialized subject/student summaries
+class SummarySerializer(serializers.Serializer):
+    enrollment_count = serializers.IntegerField()
+    grade_count = serializers.IntegerField()
+    activity_mean = serializers.SerializerMethodField()
+    quiz_mean = serializers.SerializerMethodField()
+    exam_mean = serializers.SerializerMethodField()
+    total_mean = serializers.DecimalField(max_digits=5, decimal_places=2)
+    total_stddev = serializers.DecimalField(max_digits=5, decimal_places=2)
+    total_min = serializers.DecimalField(max_digits=5, decimal_places=2)
+    total_max = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+    def _mean(self, obj, field):
+        mean = obj.mean(field)
+        return None if mean is None else f'{mean:.2f}'
+
+    def get_activity_mean(self, obj):
+        return self._mean(obj, 'activity_sum')
+
+    def get_quiz_mean(self, obj):
+        return self._mean(obj, 'quiz_sum')
+
+    def get_exam_mean(self, obj):
+        return self._mean(obj, 'exam_sum')
+
+
+# Serializer for the query parameters of the change feed
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+
+
+# Serializer for the query parameters of the search endpoints
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(allow_blank=True, max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+# Serializer for the query parameters of the performance report
+class PerformanceQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=200, default=20)
+
+
+# Serializer for background jobs (/api/jobs/)
+class JobSerializer(serializers.ModelSerializer):
+    percent = serializers.SerializerMethodField()
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'params', 'progress', 'total', 'percent', 'result', 'error',
+            'attempts', 'cancel_requested', 'created_at', 'started_at', 'finished_at', 'download',
+        ]
+        read_only_fields = fields
+
+    def get_percent(self, obj):
+        if obj.status == Job.SUCCEEDED:
+            return 100.0
+        if not obj.total:
+            return None
+        return round(min(obj.progress / obj.total, 1) * 100, 1)
+
+    def get_download(self, obj):
+        if not obj.output_file:
+            return None
+        url = reverse('job-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+# Serializer for queueing a job (POST /api/jobs/); validated_data holds the job's kind, params and upload
+class JobRequestSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=list(JOB_KINDS))
+    file = serializers.FileField(required=False) # import_grades
+    file_format = serializers.ChoiceField(choices=['csv', 'ndjson'], required=False)
+    export = serializers.ChoiceField(choices=['students', 'enrollments', 'gradebook'], required=False)
+    subject = serializers.PrimaryKeyRelatedField(queryset=Subject.objects.all(), required=False)
+
+    def validate(self, attrs):
+        kind, subject = attrs['kind'], attrs.get('subject')
+        params = {}
+        if kind == 'import_grades':
+            if 'file' not in attrs:
+                raise serializers.ValidationError({'file': "Upload the grades as a 'file' field."})
+            params['file_format'] = attrs.get('file_format') or detect_format(attrs['file'].name)
+        elif kind == 'export':
+            if 'export' not in attrs:
+                raise serializers.ValidationError({'export': "Choose students, enrollments or gradebook."})
+            if attrs['export'] == 'gradebook' and subject is None:
+                raise serializers.ValidationError({'subject': "A gradebook export needs a subject."})
+            params.update(export=attrs['export'], file_format=attrs.get('file_format', 'csv'))
+        if subject is not None and kind != 'import_grades':
+            params['subject'] = subject.pk
+        return {'kind': kind, 'params': params, 'file': attrs.get('file')}
@@ -0,0 +1,176 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changes
+from .caching import bump
+from .grading import POLICY_FIELDS
+from .models import Student, Subject, Enrollment, Grade, StudentSummary, SubjectSummary
+
+SUMMARY_FIELDS = ('activity_grade', 'quiz_grade', 'exam_grade', 'total_grade')
+
+
+def _enrollment_groups(grade):
+    """
+    Returns (student_id, subject_id) for a grade's enrollment, or None if it is gone.
+    """
+    if Grade.enrollment.is_cached(grade):
+        return grade.enrollment.student_id, grade.enrollment.subject_id
+    # Remembered per enrollment id, so the summary and cache handlers share one query
+    memo = getattr(grade, '_enrollment_groups', None)
+    if memo is None or memo[0] != grade.enrollment_id:
+        groups = Enrollment.objects.filter(pk=grade.enrollment_id).values_list('student_id', 'subject_id').first()
+        memo = grade._enrollment_groups = (grade.enrollment_id, groups)
+    return memo[1]
+
+
+def _apply_grade_delta(grade, old, new):
+    groups = _enrollment_groups(grade)
+    if groups is None:
+        return
+    student_id, subject_id = groups
+    StudentSummary.objects.apply_delta(student_id, old=old, new=new)
+    SubjectSummary.objects.apply_delta(subject_id, old=old, new=new)
+
+
+@receiver(post_save, sender=Student)
+def create_student_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        StudentSummary.objects.get_or_create(student=instance)
+
+
+@receiver(post_save, sender=Subject)
+def create_subject_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        SubjectSummary.objects.get_or_create(subject=instance)
+
+
+@receiver(post_save, sender=Subject)
+def recompute_subject_totals(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    # Saved without being loaded first: the old policy is unknown, so recompute anyway.
+    if loaded is None or any(loaded.get(field) != getattr(instance, field) for field in POLICY_FIELDS):
+        Grade.objects.filter(enrollment__subject=instance).recompute_totals()
+    instance._loaded_values = {**(loaded or {}), **{field: getattr(instance, field) for field in POLICY_FIELDS}}
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        StudentSummary.objects.apply_delta(instance.student_id, enrollments=1)
+        SubjectSummary.objects.apply_delta(instance.subject_id, enrollments=1)
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return
+    # Moving an enrollment (and its grade) to another student/subject: rebuild both sides.
+    if loaded.get('student_id') != instance.student_id:
+        StudentSummary.objects.rebuild([loaded.get('student_id'), instance.student_id])
+    if loaded.get('subject_id') != instance.subject_id:
+        SubjectSummary.objects.rebuild([loaded.get('subject_id'), instance.subject_id])
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    StudentSummary.objects.apply_delta(instance.student_id, enrollments=-1)
+    SubjectSummary.objects.apply_delta(instance.subject_id, enrollments=-1)
+
+
+@receiver(post_save, sender=Grade)
+def grade_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = instance.summary_values()
+    old = None
+    if not created:
+        loaded = getattr(instance, '_loaded_values', None)
+        if loaded is not None and all(field in loaded for field in SUMMARY_FIELDS):
+            old = tuple(loaded[field] for field in SUMMARY_FIELDS)
+        else:
+            # Saved without being loaded first: the old values are already gone, so rebuild.
+            groups = _enrollment_groups(instance)
+            if groups is not None:
+                StudentSummary.objects.rebuild([groups[0]])
+                SubjectSummary.objects.rebuild([groups[1]])
+            return
+        if old == new:
+            return
+    _apply_grade_delta(instance, old, new)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **dict(zip(SUMMARY_FIELDS, new))}
+
+
+@receiver(post_delete, sender=Grade)
+def grade_deleted(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is not None and all(field in loaded for field in SUMMARY_FIELDS):
+        old = tuple(loaded[field] for field in SUMMARY_FIELDS)
+    else:
+        old = instance.summary_values()
+    _apply_grade_delta(instance, old, None)
+
+
+# Response cache invalidation: bump only the scopes whose cached responses can contain the row.
+
+@receiver([post_save, post_delete], sender=Student)
+def invalidate_student(sender, instance, **kwargs):
+    # Enrollment and grade lists are ordered by student name
+    bump('students:list', f'student:{instance.pk}', 'enrollments:list', 'grades:list')
+
+
+@receiver([post_save, post_delete], sender=Subject)
+def invalidate_subject(sender, instance, created=False, **kwargs):
+    scopes = ['subjects:list', f'subject:{instance.pk}']
+    loaded = getattr(instance, '_loaded_values', None)
+    # Grading policy changes show up through the recomputed grades, which invalidate everything
+    renamed = loaded is None or (loaded.get('name'), loaded.get('code')) != (instance.name, instance.code)
+    if not created and renamed:
+        # Subject details are nested in every enrollment of the subject and in its students
+        enrolled = Enrollment.objects.filter(subject=instance).values_list('id', 'student_id')
+        for enrollment_id, student_id in enrolled:
+            scopes += [f'enrollment:{enrollment_id}', f'student:{student_id}']
+        scopes += ['enrollments:list', 'students:list']
+    bump(*scopes)
+    if loaded is not None:
+        loaded.update(name=instance.name, code=instance.code)
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def invalidate_enrollment(sender, instance, **kwargs):
+    scopes = ['enrollments:list', f'enrollment:{instance.pk}', 'students:list', f'student:{instance.student_id}']
+    previous = getattr(instance, '_loaded_values', {}).get('student_id')
+    if previous is not None and previous != instance.student_id:
+        scopes.append(f'student:{previous}')
+    bump(*scopes)
+    # Registered last, so the summary handler above has seen the old ids too
+    if hasattr(instance, '_loaded_values'):
+        instance._loaded_values.update(student_id=instance.student_id, subject_id=instance.subject_id)
+
+
+@receiver([post_save, post_delete], sender=Grade)
+def invalidate_grade(sender, instance, **kwargs):
+    scopes = ['grades:list', f'grade:{instance.pk}', 'enrollments:list', f'enrollment:{instance.enrollment_id}', 'students:list']
+    groups = _enrollment_groups(instance)
+    if groups is not None:
+        scopes.append(f'student:{groups[0]}')
+    bump(*scopes)
+
+
+# Change feed for delta sync. post_delete also fires for rows removed by on_delete=CASCADE.
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_save, sender=Grade)
+def record_change(sender, instance, raw=False, **kwargs):
+    changes.record(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_delete, sender=Grade)
+def record_deletion(sender, instance, **kwargs):
+    changes.record(sender, [instance.pk], deleted=True)
@@ -1,3 +1,1231 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from sms_backend import urls as project_urls
+
+from .benchmarks import add_writes, read_mix, run_suite
+from . import async_views, jobs
+from .caching import check_shared_versions
+from .changes import prune
+from .fieldsets import FieldSelectionMixin
+from .formats import ColumnarParser, ColumnarRenderer, FastJSONRenderer, from_columns, msgpack
+from .grading import ROUND_DOWN, ROUND_HALF_UP, ROUND_UP, GradingPolicy
+from .importers import import_grades
+from .middleware import brotli
+from .models import Student, Subject, Enrollment, Grade, Job, StudentSummary, SubjectSummary
+from .performance import PerformanceMiddleware, sql_shape, stats as performance_stats
+from .query_plans import audit, plan_problems
+from .search import matching_ids
+
+
+class StudentsAPITestCase(APITestCase):
+    """
+    Starts every test with an empty response cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+
+def create_students(count, subjects, offset=0):
+    """
+    Creates `count` students, each enrolled in every subject with a Grade row.
+    """
+    for i in range(offset, offset + count):
+        student = Student.objects.create(name=f"Student {i:05d}", student_id=f"S{i:05d}", email=f"s{i}@example.com")
+        for subject in subjects:
+            enrollment = Enrollment.objects.create(student=student, subject=subject)
+            Grade.objects.create(enrollment=enrollment, activity_grade=80, quiz_grade=85, exam_grade=90)
+
+
+class QueryCountTests(StudentsAPITestCase):
+    """
+    The list endpoints must issue the same number of queries regardless of the row count.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.subjects = [Subject.objects.create(name=f"Subject {i}", code=f"SUB{i}") for i in range(3)]
+
+    def count_queries(self, url):
+        cache.clear() # Measure the uncached path
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertFlatQueryCount(self, url):
+        create_students(2, self.subjects)
+        small = self.count_queries(url)
+        create_students(10, self.subjects, offset=2)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_students_list(self):
+        self.assertFlatQueryCount('/api/students/')
+
+    def test_enrollments_list(self):
+        self.assertFlatQueryCount('/api/enrollments/')
+
+    def test_grades_list(self):
+        self.assertFlatQueryCount('/api/grades/')
+
+    def test_subjects_list(self):
+        self.assertFlatQueryCount('/api/subjects/')
+
+    def test_student_detail(self):
+        create_students(1, self.subjects)
+        student = Student.objects.get()
+        with self.assertNumQueries(3): # The scope versions, then the student with everything nested
+            response = self.client.get(f'/api/students/{student.pk}/')
+        codes = {e['subject_details']['code'] for e in response.data['enrollments']}
+        self.assertEqual(codes, {'SUB0', 'SUB1', 'SUB2'})
+
+
+class KeysetPaginationTests(StudentsAPITestCase):
+    """
+    Cursor pagination is opt-in and walks the ordering without gaps or duplicates.
+    """
+
+    def setUp(self):
+        super().setUp()
+        subject = Subject.objects.create(name="Math", code="MATH")
+        create_students(7, [subject])
+        Student.objects.update(name="Same Name")  # Force ties so the pk tiebreaker matters
+
+    def walk(self, url, key):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item[key] for item in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get('/api/students/')
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 7)
+
+    def test_walks_every_endpoint(self):
+        for endpoint, model in (('students', Student), ('enrollments', Enrollment), ('grades', Grade)):
+            seen = self.walk(f'/api/{endpoint}/?page_size=3', 'id')
+            self.assertEqual(seen, sorted(model.objects.values_list('id', flat=True)))
+
+    def test_previous_link(self):
+        first = self.client.get('/api/students/?page_size=3')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/students/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkEnrollmentTests(StudentsAPITestCase):
+    """
+    The bulk endpoint inserts valid pairs with grades and reports the rest as conflicts.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        self.science = Subject.objects.create(name="Science", code="SCI")
+        create_students(3, [])
+        self.students = list(Student.objects.order_by('id'))
+        Enrollment.objects.create(student=self.students[0], subject=self.math)
+
+    def test_pairs_with_conflicts(self):
+        payload = [
+            {'student': self.students[0].id, 'subject': self.math.id},  # Already enrolled
+            {'student': self.students[1].id, 'subject': self.math.id},
+            {'student': self.students[1].id, 'subject': self.math.id},  # Duplicate in request
+            {'student': 9999, 'subject': self.math.id},  # Unknown student
+            {'student': self.students[2].id, 'subject': self.science.id},
+        ]
+        response = self.client.post('/api/enrollments/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([c['index'] for c in response.data['conflicts']], [0, 2, 3])
+        self.assertEqual(Grade.objects.filter(enrollment__in=[e['id'] for e in response.data['enrollments']]).count(), 2)
+
+    def test_subject_with_students(self):
+        payload = {'subject': self.science.id, 'students': [s.id for s in self.students]}
+        response = self.client.post('/api/enrollments/bulk/', payload, format='json')
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(self.science.enrollments.filter(grades__total_grade=0).count(), 3)
+
+    def test_invalid_payload(self):
+        response = self.client.post('/api/enrollments/bulk/', {'subject': self.math.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class GradeBatchTests(StudentsAPITestCase):
+    """
+    A batch of grade changes is saved in one request and transaction, and only if no
+    grade in it was changed meanwhile.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(40, [self.math])
+        self.grades = list(Grade.objects.order_by('id'))
+
+    def post(self, patches):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/grades/batch/', patches, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_class_in_one_request(self):
+        _, single = self.post([{'id': self.grades[-1].pk, 'version': 1, 'quiz_grade': 85}])
+        patches = [{'id': grade.pk, 'version': 1, 'exam_grade': 60 + i} for i, grade in enumerate(self.grades[:-1])]
+        response, queries = self.post(patches)
+        self.assertEqual(queries, single) # A fixed handful, not one per grade
+        self.assertEqual(response.data['updated'], 39)
+        first = response.data['grades'][0]
+        self.assertEqual((first['exam_grade'], first['total_grade'], first['version']), ('60.00', '75.00', 2))
+        grade = Grade.objects.get(pk=self.grades[0].pk)
+        self.assertEqual((grade.exam_grade, grade.total_grade, grade.activity_grade), (60, 75, 80))
+        call_command('rebuild_summaries', verify=True, stdout=io.StringIO())
+        # The cached student list shows the new grades
+        student = next(s for s in self.client.get('/api/students/').data if s['id'] == grade.enrollment.student_id)
+        self.assertEqual(student['enrollments'][0]['grades']['version'], 2)
+
+    def test_stale_version_saves_nothing(self):
+        grade = self.grades[1]
+        response = self.client.patch(f'/api/grades/{grade.pk}/', {'quiz_grade': 100}, format='json')
+        self.assertEqual(response.data['version'], 2)
+        patches = [
+            {'id': self.grades[0].pk, 'version': 1, 'quiz_grade': 50},
+            {'id': grade.pk, 'version': 1, 'quiz_grade': 50},
+            {'id': 999999, 'version': 1, 'quiz_grade': 50},
+        ]
+        response = self.client.post('/api/grades/batch/', {'grades': patches}, format='json')
+        self.assertEqual(response.status_code, 409)
+        conflicts = response.data['conflicts']
+        self.assertEqual([(c['index'], c['id']) for c in conflicts], [(1, grade.pk), (2, 999999)])
+        self.assertEqual((conflicts[0]['current']['quiz_grade'], conflicts[0]['current']['version']), ('100.00', 2))
+        self.assertIsNone(conflicts[1]['current'])
+        self.assertEqual(Grade.objects.get(pk=self.grades[0].pk).quiz_grade, 85)
+
+    def test_invalid_batches(self):
+        pk = self.grades[0].pk
+        for payload in (
+            [], [{'id': pk, 'version': 1}], [{'id': pk, 'version': 1, 'exam_grade': 'x'}],
+            [{'id': pk, 'version': 1, 'exam_grade': 1}, {'id': pk, 'version': 1, 'quiz_grade': 1}],
+        ):
+            response = self.client.post('/api/grades/batch/', payload, format='json')
+            self.assertEqual(response.status_code, 400, payload)
+        self.assertEqual(Grade.objects.get(pk=pk).version, 1)
+
+
+class GradeImportTests(StudentsAPITestCase):
+    """
+    Grade imports resolve rows to enrollments and write total_grade in the same upsert.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(2, [self.math])
+
+    def test_csv_upload(self):
+        content = (
+            "student_id,code,activity_grade,quiz_grade,exam_grade\n"
+            "S00000,MATH,90,80,70\n"
+            "S00001,MATH,100,100,100\n"
+            "S99999,MATH,1,2,3\n"
+            "S00001,MATH,abc,1,1\n"
+        ).encode()
+        upload = SimpleUploadedFile('grades.csv', content, content_type='text/csv')
+        response = self.client.post('/api/grades/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual([e['row'] for e in response.data['errors']], [3, 4])
+        grade = Grade.objects.get(enrollment__student__student_id='S00000')
+        self.assertEqual((grade.total_grade, grade.version), (80, 2))
+
+    def test_ndjson(self):
+        lines = [
+            '{"student_id": "S00000", "code": "MATH", "activity_grade": 60, "quiz_grade": 70, "exam_grade": 80}\n',
+            'not json\n',
+        ]
+        result = import_grades(lines, 'ndjson')
+        self.assertEqual((result['imported'], result['error_count']), (1, 1))
+        self.assertEqual(Grade.objects.get(enrollment__student__student_id='S00000').total_grade, 70)
+
+    def test_recompute_totals(self):
+        Grade.objects.update(activity_grade=30, quiz_grade=60, exam_grade=90)
+        Grade.objects.recompute_totals()
+        self.assertEqual(set(Grade.objects.values_list('total_grade', 'version')), {(60, 2)})
+
+
+class ExportTests(StudentsAPITestCase):
+    """
+    Exports stream flat rows without serializing model instances.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(3, [self.math])
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_students_csv(self):
+        lines = self.read(self.client.get('/api/students/export/')).splitlines()
+        self.assertEqual(lines[0], 'id,name,student_id,email,date_of_birth')
+        self.assertEqual(len(lines), 4)
+
+    def test_gradebook_ndjson(self):
+        response = self.client.get(f'/api/subjects/{self.math.pk}/gradebook/?file_format=ndjson')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['student_id'] for row in rows], ['S00000', 'S00001', 'S00002'])
+        self.assertEqual(rows[0]['total_grade'], '85.00')
+
+    def test_enrollments_query_count(self):
+        with self.assertNumQueries(1):
+            content = self.read(self.client.get('/api/enrollments/export/'))
+        self.assertIn('MATH', content)
+
+
+class AnalyticsTests(StudentsAPITestCase):
+    """
+    Analytics endpoints aggregate in the database.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(4, [self.math])
+        for total, grade in zip((60, 70, 80, 90), Grade.objects.order_by('enrollment__student__name')):
+            grade.activity_grade = grade.quiz_grade = grade.exam_grade = total
+            grade.save()
+
+    def test_stats(self):
+        with self.assertNumQueries(5):  # One GROUP BY plus one median query per component
+            response = self.client.get('/api/subjects/stats/')
+        stats = response.data[0]
+        self.assertEqual((stats['count'], stats['passed'], stats['pass_rate']), (4, 2, 0.5))
+        self.assertEqual(stats['total_grade'], {'mean': 75.0, 'median': 75.0, 'min': 60.0, 'max': 90.0, 'stddev': 11.18})
+
+    def test_distribution(self):
+        response = self.client.get(f'/api/subjects/{self.math.pk}/distribution/?bucket_size=20')
+        self.assertEqual([(b['start'], b['count']) for b in response.data], [(60.0, 2), (80.0, 2)])
+
+    def test_rankings(self):
+        response = self.client.get(f'/api/subjects/{self.math.pk}/rankings/?limit=2')
+        self.assertEqual([(r['rank'], r['student_id']) for r in response.data], [(1, 'S00003'), (2, 'S00002')])
+        student = Student.objects.get(student_id='S00001')
+        response = self.client.get(f'/api/subjects/{self.math.pk}/rankings/?student={student.pk}')
+        self.assertEqual((response.data['rank'], response.data['percentile']), (3, 33.33))
+
+    def test_invalid_params(self):
+        response = self.client.get(f'/api/subjects/{self.math.pk}/distribution/?field=name')
+        self.assertEqual(response.status_code, 400)
+
+
+class SummaryTests(StudentsAPITestCase):
+    """
+    Summary rows follow every write path and match a fresh rebuild.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        self.science = Subject.objects.create(name="Science", code="SCI")
+        create_students(3, [self.math])
+
+    def assertConsistent(self):
+        self.assertEqual(SubjectSummary.objects.mismatches(), [])
+        self.assertEqual(StudentSummary.objects.mismatches(), [])
+
+    def test_single_row_writes(self):
+        grade = Grade.objects.select_related('enrollment').first()
+        response = self.client.put(f'/api/grades/{grade.pk}/', {
+            'enrollment': grade.enrollment_id, 'activity_grade': '100', 'quiz_grade': '100', 'exam_grade': '100',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertConsistent()
+        self.assertEqual(SubjectSummary.objects.get(pk=self.math.pk).total_max, 100)
+
+        # Lowering the current maximum forces the min/max rescan
+        self.client.patch(f'/api/grades/{grade.pk}/', {'exam_grade': '10'}, format='json')
+        self.assertConsistent()
+
+        self.client.delete(f'/api/enrollments/{grade.enrollment_id}/')
+        self.assertConsistent()
+        self.client.delete(f'/api/students/{Student.objects.first().pk}/')
+        self.assertConsistent()
+
+    def test_bulk_paths(self):
+        students = list(Student.objects.values_list('id', flat=True))
+        self.client.post('/api/enrollments/bulk/', {'subject': self.science.pk, 'students': students}, format='json')
+        import_grades(['student_id,code,activity_grade,quiz_grade,exam_grade\n', 'S00001,SCI,50,60,70\n'])
+        self.assertConsistent()
+        self.assertEqual(SubjectSummary.objects.get(pk=self.science.pk).enrollment_count, 3)
+
+    def test_summary_endpoint(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/subjects/{self.math.pk}/summary/')
+        self.assertEqual(response.data['enrollment_count'], 3)
+        self.assertEqual(response.data['total_mean'], '85.00')
+        self.assertEqual(self.client.get('/api/students/9999/summary/').status_code, 404)
+
+    def test_rebuild_command(self):
+        SubjectSummary.objects.update(total_sum=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_summaries', verify=True, stdout=io.StringIO(), stderr=io.StringIO())
+        call_command('rebuild_summaries', stdout=io.StringIO())
+        self.assertConsistent()
+
+
+class GradingPolicyTests(StudentsAPITestCase):
+    """
+    Totals follow the subject's grading policy, and the set-based recompute agrees
+    with the Python computation used by Grade.save() to the cent.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(2, [self.math])
+
+    def test_policy(self):
+        policy = GradingPolicy(Decimal('30'), Decimal('30'), Decimal('40'), 1, ROUND_HALF_UP)
+        self.assertEqual(policy.total(Decimal('80.25'), Decimal('70.50'), Decimal('99.99')), Decimal('85.20'))
+        self.assertEqual(policy.total(80, 70, Decimal('91.20')), Decimal('81.50'))
+        self.assertEqual(policy._replace(rounding=ROUND_DOWN).total(80, 70, Decimal('91.20')), Decimal('81.40'))
+        self.assertEqual(policy._replace(rounding=ROUND_UP, total_decimals=0).total(80, 70, Decimal('90.01')), Decimal('82.00'))
+        self.assertEqual(Grade.compute_total(90, 80, 70), Decimal('80.00'))
+
+    def test_recompute_matches_python(self):
+        rng = random.Random(15)
+        components = [[Decimal(rng.randint(0, 10000)) / 100 for _ in range(3)] for _ in range(60)]
+        components += [[Decimal('80.25'), Decimal('70.50'), Decimal('99.99')], [Decimal('0.05'), 0, 0]]
+        students = Student.objects.bulk_create(
+            Student(name=f"Bulk {i}", student_id=f"B{i}", email=f"b{i}@example.com") for i in range(len(components))
+        )
+        enrollments = Enrollment.objects.bulk_create(Enrollment(student=student, subject=self.math) for student in students)
+        Grade.objects.bulk_create(
+            Grade(enrollment=enrollment, activity_grade=a, quiz_grade=q, exam_grade=e)
+            for enrollment, (a, q, e) in zip(enrollments, components)
+        )
+        grades = Grade.objects.filter(enrollment__student__in=students)
+        for weights in ((1, 1, 1), ('0.25', '0.25', '0.5'), (3, 0, 7)):
+            for decimals in (0, 1, 2):
+                for rounding in (ROUND_HALF_UP, ROUND_DOWN, ROUND_UP):
+                    Subject.objects.filter(pk=self.math.pk).update(
+                        activity_weight=weights[0], quiz_weight=weights[1], exam_weight=weights[2],
+                        total_decimals=decimals, rounding=rounding,
+                    )
+                    policy = Subject.objects.get(pk=self.math.pk).grading_policy
+                    grades.recompute_totals(batch_size=25) # Several id ranges
+                    for grade in grades.all():
+                        expected = policy.total(grade.activity_grade, grade.quiz_grade, grade.exam_grade)
+                        self.assertEqual(grade.total_grade, expected, (policy, grade.pk))
+
+    def test_policy_endpoint(self):
+        url = f'/api/subjects/{self.math.pk}/policy/'
+        self.assertEqual(self.client.get(url).data['rounding'], ROUND_HALF_UP)
+        self.assertEqual(self.client.get('/api/grades/').data[0]['total_grade'], '85.00')
+
+        response = self.client.patch(url, {'activity_weight': '0', 'quiz_weight': '0'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['total_grade'] for row in self.client.get('/api/grades/').data}, {'90.00'})
+        self.assertEqual(SubjectSummary.objects.mismatches(), [])
+        self.assertEqual(StudentSummary.objects.mismatches(), [])
+
+        response = self.client.patch(url, {'exam_weight': '0'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(url, {'total_decimals': 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_weights_above_zero(self):
+        self.math.activity_weight = self.math.quiz_weight = self.math.exam_weight = 0
+        with self.assertRaisesMessage(ValidationError, "At least one component weight must be above zero."):
+            self.math.full_clean() # As the admin does
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.math.save()
+
+        # A policy that never passed the constraint falls back to the plain average
+        policy = GradingPolicy(Decimal(0), Decimal(0), Decimal(0), 2, ROUND_HALF_UP)
+        self.assertEqual(policy.total(90, 80, 70), Decimal('80.00'))
+        Grade.objects.update(total_grade=policy.total_expression())
+        self.assertEqual({grade.total_grade for grade in Grade.objects.all()}, {Decimal('85.00')})
+
+    def test_passing_grade(self):
+        self.assertEqual(self.client.get(f'/api/subjects/{self.math.pk}/stats/').data['passed'], 2)
+        self.client.patch(f'/api/subjects/{self.math.pk}/policy/', {'passing_grade': '90'}, format='json')
+        stats = self.client.get(f'/api/subjects/{self.math.pk}/stats/').data
+        self.assertEqual((stats['passed'], stats['passing_grade']), (0, 90.0))
+        self.assertEqual(self.client.get(f'/api/subjects/{self.math.pk}/stats/?passing_grade=80').data['passed'], 2)
+
+    def test_import_uses_policy(self):
+        self.client.patch(f'/api/subjects/{self.math.pk}/policy/', {'exam_weight': '2', 'total_decimals': 0}, format='json')
+        import_grades(['student_id,code,activity_grade,quiz_grade,exam_grade\n', 'S00001,MATH,50,60,71\n'])
+        self.assertEqual(Grade.objects.get(enrollment__student__student_id='S00001').total_grade, 63)
+
+
+class ResponseCacheTests(StudentsAPITestCase):
+    """
+    Cached list/detail responses are invalidated only by writes that affect them.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(2, [self.math])
+        self.first, self.second = Student.objects.order_by('name')
+
+    def test_cache_hit_and_304(self):
+        response = self.client.get('/api/students/')
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get('/api/students/')
+            not_modified = self.client.get('/api/students/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+        # Only the scope versions are read from the database, once per request
+        self.assertEqual(['students_cacheversion' in query['sql'] for query in queries], [True, True])
+
+        with override_settings(API_CACHE_VERSIONS='cache'): # Versions kept in a shared cache (Redis)
+            etag = self.client.get('/api/students/')['ETag']
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get('/api/students/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_grade_change_invalidates_only_its_student(self):
+        first_etag = self.client.get(f'/api/students/{self.first.pk}/')['ETag']
+        second_etag = self.client.get(f'/api/students/{self.second.pk}/')['ETag']
+        list_etag = self.client.get('/api/students/')['ETag']
+
+        grade = Grade.objects.get(enrollment__student=self.first)
+        self.client.patch(f'/api/grades/{grade.pk}/', {'exam_grade': '10'}, format='json')
+
+        response = self.client.get(f'/api/students/{self.first.pk}/', HTTP_IF_NONE_MATCH=first_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['enrollments'][0]['grades']['exam_grade'], '10.00')
+        response = self.client.get(f'/api/students/{self.second.pk}/', HTTP_IF_NONE_MATCH=second_etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/students/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_subject_rename_reaches_nested_details(self):
+        self.client.get(f'/api/students/{self.first.pk}/')
+        self.client.patch(f'/api/subjects/{self.math.pk}/', {'name': 'Algebra'}, format='json')
+        response = self.client.get(f'/api/students/{self.first.pk}/')
+        self.assertEqual(response.data['enrollments'][0]['subject_details']['name'], 'Algebra')
+
+    @override_settings(API_CACHE_VERSIONS='cache')
+    def test_etags_survive_cache_reset(self):
+        cache.clear() # No scope versions yet, as after a restart
+        etag = self.client.get('/api/subjects/')['ETag']
+        Subject.objects.create(name="Science", code="SCI")
+        cache.clear() # Also a restart with the local-memory cache, or evicted version keys
+        response = self.client.get('/api/subjects/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_links_follow_host_and_scheme(self):
+        create_students(3, [Subject.objects.get()], offset=10)
+        url = '/api/students/?page_size=2'
+        plain = self.client.get(url)
+        self.assertTrue(plain.data['next'].startswith('http://testserver/'))
+        secure = self.client.get(url, secure=True, HTTP_HOST='api.example.com', HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(secure.status_code, 200)
+        self.assertTrue(secure.json()['next'].startswith('https://api.example.com/'))
+
+    @override_settings(API_CACHE_VERSIONS='cache', CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_warns_about_unshared_versions(self):
+        self.assertEqual([message.id for message in check_shared_versions(None)], ['students.W001'])
+
+    def test_browsable_api_not_cached(self):
+        staff = User.objects.create_user('staff-member', password='x', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/api/subjects/', HTTP_ACCEPT='text/html')
+        self.assertContains(response, 'staff-member')
+        self.assertFalse(response.has_header('ETag'))
+        self.client.logout()
+        response = self.client.get('/api/subjects/', HTTP_ACCEPT='text/html')
+        self.assertNotContains(response, 'staff-member')
+
+    def test_bulk_write_invalidates(self):
+        etag = self.client.get('/api/enrollments/')['ETag']
+        science = Subject.objects.create(name="Science", code="SCI")
+        self.client.post('/api/enrollments/bulk/', {'subject': science.pk, 'students': [self.first.pk]}, format='json')
+        response = self.client.get('/api/enrollments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.data), 3)
+
+
+class CrossProcessInvalidationTests(APITransactionTestCase):
+    """
+    Writes in another process (the job worker, another web worker) invalidate the responses
+    this process cached. Both processes use a copy of the test database in a file.
+    """
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Copies the SQLite test database")
+        cache.clear()
+        create_students(1, [Subject.objects.create(name="Mathematics", code="MATH")])
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'shared.sqlite3')
+        connection.ensure_connection()
+        shared = sqlite3.connect(self.path)
+        connection.connection.backup(shared)
+        shared.close()
+
+        # Switch this process to the file until the test ends
+        memory, name = connection.connection, connection.settings_dict['NAME']
+        connection.connection, connection.settings_dict['NAME'] = None, self.path
+
+        def restore():
+            connection.close()
+            connection.connection, connection.settings_dict['NAME'] = memory, name
+        self.addCleanup(restore)
+
+    def manage(self, *args):
+        env = {**os.environ, 'DATABASE_URL': f'sqlite:///{self.path}'}
+        env.pop('REDIS_URL', None)
+        subprocess.run(
+            [sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR, env=env, check=True, capture_output=True,
+        )
+
+    def test_import_in_another_process(self):
+        grade = Grade.objects.get()
+        list_etag = self.client.get('/api/grades/')['ETag']
+        detail_etag = self.client.get(f'/api/grades/{grade.pk}/')['ETag']
+
+        csv_path = os.path.join(self.directory, 'grades.csv')
+        with open(csv_path, 'w') as handle:
+            handle.write('student_id,code,activity_grade,quiz_grade,exam_grade\nS00000,MATH,1,2,3\n')
+        self.manage('import_grades', csv_path)
+
+        response = self.client.get(f'/api/grades/{grade.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['exam_grade'], '3.00')
+        response = self.client.get('/api/grades/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['exam_grade'], '3.00')
+
+
+class ChangeFeedTests(StudentsAPITestCase):
+    """
+    The change feed reports creates, updates and deletes (including cascades) after a cursor.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(2, [self.math])
+        self.cursor = self.client.get('/api/changes/latest/').data['cursor']
+
+    def feed(self, since):
+        response = self.client.get(f'/api/changes/?since={since}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_updates_and_cascades(self):
+        student = Student.objects.order_by('name').first()
+        grade = Grade.objects.get(enrollment__student=student)
+        self.client.patch(f'/api/grades/{grade.pk}/', {'quiz_grade': '50'}, format='json')
+        self.client.patch(f'/api/grades/{grade.pk}/', {'quiz_grade': '60'}, format='json')
+
+        feed = self.feed(self.cursor)
+        self.assertEqual(len(feed['changes']), 1) # Both updates collapse into one entry
+        self.assertEqual(feed['changes'][0]['data']['quiz_grade'], '60.00')
+        self.assertEqual(feed['changes'][0]['data']['version'], 3) # Clients send it back to /api/grades/batch/
+
+        self.client.delete(f'/api/students/{student.pk}/')
+        deleted = {(c['model'], c['id']) for c in self.feed(feed['cursor'])['changes'] if c['deleted']}
+        self.assertEqual(deleted, {
+            ('student', student.pk), ('enrollment', grade.enrollment_id), ('grade', grade.pk),
+        })
+
+    def test_bulk_paths(self):
+        science = Subject.objects.create(name="Science", code="SCI")
+        cursor = self.feed(self.cursor)['cursor']
+        self.client.post('/api/enrollments/bulk/', {'subject': science.pk, 'students': list(
+            Student.objects.values_list('id', flat=True))}, format='json')
+        feed = self.feed(cursor)
+        self.assertEqual(sorted(c['model'] for c in feed['changes']), ['enrollment'] * 2 + ['grade'] * 2)
+
+        import_grades(['student_id,code,activity_grade,quiz_grade,exam_grade\n', 'S00000,SCI,1,2,3\n'])
+        changes = self.feed(feed['cursor'])['changes']
+        self.assertEqual([(c['model'], c['data']['total_grade']) for c in changes], [('grade', '2.00')])
+
+    def test_holds_back_changes_of_open_transactions(self):
+        Student.objects.create(name="New", student_id="N1", email="new@example.com")
+        # A transaction that began a minute ago is still writing (PostgreSQL only)
+        with mock.patch('students.changes._oldest_write_start', return_value=timezone.now() - timedelta(minutes=1)):
+            feed = self.feed(self.cursor)
+        self.assertEqual((feed['changes'], feed['cursor']), ([], self.cursor))
+        self.assertEqual(len(self.feed(self.cursor)['changes']), 1)
+
+    def test_expired_cursor(self):
+        Student.objects.create(name="New", student_id="N1", email="new@example.com")
+        prune(timezone.now() + timedelta(days=1))
+        response = self.client.get(f'/api/changes/?since={self.cursor - 5}')
+        self.assertEqual(response.status_code, 410)
+
+
+class SearchTests(StudentsAPITestCase):
+    """
+    Search goes through the index, which follows ORM and bulk writes alike.
+    """
+
+    def setUp(self):
+        super().setUp()
+        Student.objects.create(name="Maria Santos", student_id="2024-0001", email="maria@example.com")
+        Student.objects.create(name="Mario Reyes", student_id="2024-0002", email="reyes@example.com")
+        Student.objects.bulk_create([Student(name="Ana Cruz", student_id="2024-0003", email="ana@example.com")])
+        self.math = Subject.objects.create(name="Mathematics", code="MATH101")
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['name'] for row in response.data)
+
+    def test_prefix_search(self):
+        self.assertEqual(self.names('/api/students/search/?q=mar'), ['Maria Santos', 'Mario Reyes'])
+        self.assertEqual(self.names('/api/students/search/?q=mar san'), ['Maria Santos'])
+        self.assertEqual(self.names('/api/students/search/?q=cruz'), ['Ana Cruz'])
+        self.assertEqual(self.names('/api/subjects/search/?q=math1'), ['Mathematics'])
+        self.assertEqual(self.names('/api/students/search/?q="*'), [])
+
+    def test_word_prefixes_only(self):
+        # The same on every backend: any prefix of a word, never the inside of one
+        self.assertEqual(self.names('/api/students/search/?q=m'), ['Maria Santos', 'Mario Reyes'])
+        self.assertEqual(self.names('/api/students/search/?q=m s'), ['Maria Santos'])
+        self.assertEqual(self.names('/api/students/search/?q=ria'), [])
+        self.assertEqual(self.names('/api/students/search/?q=0003'), ['Ana Cruz'])
+        self.assertEqual(self.names('/api/subjects/search/?q=ath'), [])
+
+    def test_postgresql_index(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("PostgreSQL query plans")
+        queryset = Student.objects.filter(pk__in=matching_ids(Student, 'm'))
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off') # Too few rows to prefer an index otherwise
+        self.assertIn('students_student_search', queryset.explain())
+
+    def test_index_follows_writes(self):
+        student = Student.objects.get(name="Ana Cruz")
+        self.client.patch(f'/api/students/{student.pk}/', {'name': 'Ana Bautista'}, format='json')
+        self.assertEqual(self.names('/api/students/search/?q=cruz'), [])
+        self.assertEqual(self.names('/api/students/search/?q=bauti'), ['Ana Bautista'])
+        self.client.delete(f'/api/students/{student.pk}/')
+        self.assertEqual(self.names('/api/students/search/?q=bauti'), [])
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        for student in Student.objects.all():
+            Enrollment.objects.create(student=student, subject=self.math)
+        response = self.client.get('/admin/students/enrollment/?q=santos')
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get('/admin/students/student/?q=example')
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_admin_search_across_models(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        science = Subject.objects.create(name="Science", code="SCI101")
+        for student in Student.objects.all():
+            for subject in (self.math, science):
+                Grade.objects.create(enrollment=Enrollment.objects.create(student=student, subject=subject))
+        # Student name plus subject name, as the old search_fields allowed
+        for url in ('/admin/students/enrollment/?q=maria math', '/admin/students/grade/?q=maria math'):
+            response = self.client.get(url)
+            self.assertEqual(response.context['cl'].result_count, 1, url)
+        response = self.client.get('/admin/students/enrollment/?q=mar sci')
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get('/admin/students/enrollment/?q=maria nothing')
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+
+class FieldSelectionTests(StudentsAPITestCase):
+    """
+    ?fields= and ?expand= trim both the output and the queries, and the values() fast
+    path renders exactly what the serializers render.
+    """
+
+    def setUp(self):
+        super().setUp()
+        create_students(3, [Subject.objects.create(name=f"Subject {i}", code=f"SUB{i}") for i in range(2)])
+        Student.objects.filter(student_id='S00001').update(date_of_birth='2001-02-03')
+        Grade.objects.update(activity_grade='91.50', quiz_grade='80.25', exam_grade='70.00')
+
+    def test_fields(self):
+        with self.assertNumQueries(2): # The scope versions and one query for the page
+            response = self.client.get('/api/students/?fields=name,student_id')
+        self.assertEqual(response.data[0], {'name': 'Student 00000', 'student_id': 'S00000'})
+
+        response = self.client.get('/api/students/?fields=id,enrollments.subject_details.code&page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['enrollments'][0], {'subject_details': {'code': 'SUB0'}})
+
+    def test_expand(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/enrollments/?expand=')
+        self.assertEqual(set(response.data[0]), {'id', 'student', 'subject', 'enrollment_date'})
+        response = self.client.get('/api/students/?expand=enrollments.grades')
+        enrollment = response.data[0]['enrollments'][0]
+        self.assertEqual(set(enrollment), {'id', 'student', 'subject', 'enrollment_date', 'grades'})
+        self.assertEqual(enrollment['grades']['activity_grade'], '91.50')
+
+    def test_detail(self):
+        student = Student.objects.get(student_id='S00001')
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/students/{student.pk}/?fields=email,date_of_birth')
+        self.assertEqual(response.data, {'email': 's1@example.com', 'date_of_birth': '2001-02-03'})
+
+    def test_unknown_field(self):
+        for url in ('/api/students/?fields=name,nope', '/api/students/?fields=name.first', '/api/grades/?expand=id'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_writes_ignore_selection(self):
+        response = self.client.post(
+            '/api/subjects/?fields=id', {'name': 'Physics', 'code': 'PHY101'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.data), {'id', 'name', 'code'})
+
+    def test_fast_path_matches_serializers(self):
+        urls = [
+            '/api/students/', '/api/students/?page_size=2', '/api/students/?fields=id,enrollments.grades',
+            '/api/enrollments/', '/api/grades/?page_size=4', '/api/subjects/',
+        ]
+        for url in urls:
+            cache.clear()
+            fast = self.client.get(url)
+            cache.clear()
+            with mock.patch.object(FieldSelectionMixin, 'get_row_plan', return_value=None):
+                slow = self.client.get(url)
+            self.assertEqual(fast.content, slow.content, url)
+
+
+class FormatTests(StudentsAPITestCase):
+    """
+    MessagePack and columnar responses carry the same values as JSON, the bulk endpoints
+    accept them as input, and large /api/ responses are compressed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(3, [self.math])
+
+    def test_fast_json_matches_drf(self):
+        Student.objects.filter(student_id='S00000').update(name='Line\u2028separator')
+        data = self.client.get('/api/students/').data
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({'indented': [1]}, 'application/json; indent=2'), b'{\n  "indented": [\n    1\n  ]\n}')
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        expected = json.loads(self.client.get('/api/students/?page_size=2').content)
+        response = self.client.get('/api/students/?page_size=2', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+
+        science = Subject.objects.create(name="Science", code="SCI")
+        body = msgpack.packb({'subject': science.id, 'students': list(Student.objects.values_list('id', flat=True))})
+        response = self.client.post(
+            '/api/enrollments/bulk/', body, content_type='application/msgpack', HTTP_ACCEPT='application/msgpack',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['created'], 3)
+        response = self.client.post('/api/enrollments/bulk/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+    def test_columnar(self):
+        rows = json.loads(self.client.get('/api/grades/').content)
+        response = self.client.get('/api/grades/', HTTP_ACCEPT=ColumnarRenderer.media_type)
+        body = json.loads(response.content)
+        self.assertEqual(body['count'], 3)
+        self.assertEqual(body['columns']['id'], [row['id'] for row in rows])
+        self.assertEqual(from_columns(body['columns']), rows)
+        page = json.loads(self.client.get('/api/grades/?page_size=2&format=columnar').content)
+        self.assertEqual(page['results']['columns']['id'], [row['id'] for row in rows[:2]])
+        grade = json.loads(self.client.get(f'/api/grades/{rows[0]["id"]}/?format=columnar').content)
+        self.assertEqual(grade, rows[0]) # Not a list: plain JSON
+
+        columns = {
+            'student_id': ['S00000', 'S00001', 'S99999'], 'code': ['MATH'] * 3,
+            'activity_grade': [60, 90, 1], 'quiz_grade': [70, 90, 1], 'exam_grade': [80, 90, 1],
+        }
+        response = self.client.post(
+            '/api/grades/import/', json.dumps({'columns': columns}), content_type=ColumnarParser.media_type,
+        )
+        self.assertEqual((response.data['imported'], response.data['error_count']), (2, 1))
+        self.assertEqual(Grade.objects.get(enrollment__student__student_id='S00000').total_grade, 70)
+        columns['code'] = ['MATH']
+        response = self.client.post(
+            '/api/grades/import/', json.dumps({'columns': columns}), content_type=ColumnarParser.media_type,
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(API_COMPRESS_MIN_SIZE=100)
+    def test_compression(self):
+        plain = self.client.get('/api/students/')
+        encodings = [('gzip', gzip.decompress)] + ([('br', brotli.decompress)] if brotli else [])
+        for encoding, decompress in encodings:
+            for _ in range(2): # Compressed, then from the response cache
+                response = self.client.get('/api/students/', HTTP_ACCEPT_ENCODING=f'{encoding}, deflate')
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertEqual(decompress(response.content), plain.content)
+            self.assertEqual(response['ETag'], f'W/{plain["ETag"]}')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            response = self.client.get(
+                '/api/students/', HTTP_ACCEPT_ENCODING=encoding, HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+            self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/api/students/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode().count('\n'), 4)
+        self.assertFalse(self.client.get('/api/subjects/', HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+        self.assertFalse(self.client.get('/api/students/').has_header('Content-Encoding'))
+        response = self.client.get('/api/students/', HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertContains(response, 'csrf')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class BenchmarkTests(StudentsAPITestCase):
+    """
+    The seeded dataset is reproducible and every benchmarked endpoint answers it.
+    """
+
+    def seed(self, **options):
+        call_command('seed_benchmark', students=40, subjects=6, clear=True, stdout=io.StringIO(), **options)
+        return list(Grade.objects.order_by('enrollment__student__student_id', 'enrollment__subject__code').values_list(
+            'enrollment__student__student_id', 'enrollment__subject__code', 'total_grade',
+        ))
+
+    def test_seed_is_reproducible(self):
+        first = self.seed()
+        self.assertEqual(Student.objects.count(), 40)
+        self.assertTrue(160 <= len(first) <= 240) # 4..6 subjects each
+        self.assertEqual(self.seed(), first)
+        self.assertNotEqual(self.seed(seed=1), first)
+        call_command('rebuild_summaries', verify=True, stdout=io.StringIO())
+
+    def test_suite_runs_every_case(self):
+        self.seed()
+        results = run_suite(iterations=2, full=True, client=self.client)
+        self.assertEqual(results['meta']['rows']['students'], 40)
+        for result in results['results']:
+            self.assertLess(result['status'], 400, result['name'])
+            self.assertGreater(result['latency_ms']['p50'], 0)
+        # Write cases are rolled back
+        self.assertEqual(Student.objects.count(), 40)
+        self.assertEqual(Enrollment.objects.count(), results['meta']['rows']['enrollments'])
+
+    def test_write_mix(self):
+        self.seed()
+        mix = add_writes(read_mix(size=10), write_share=0.2)
+        writes = [request for request in mix if request[0] == 'PATCH']
+        self.assertAlmostEqual(len(writes) / len(mix), 0.2, places=1)
+        for method, url, body in writes[:10]:
+            self.assertEqual(self.client.patch(url, body, format='json').status_code, 200, url)
+
+
+class ConnectionProfileTests(StudentsAPITestCase):
+    """
+    The SQLite tuning of settings.DATABASES runs on every new connection.
+    """
+
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite profile")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1) # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        self.assertEqual(connection.settings_dict['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+
+class QueryPlanTests(StudentsAPITestCase):
+    """
+    Every audited viewset and admin statement is answered from indexes, without table
+    scans or sorts, on a dataset large enough for the planner to prefer them.
+    """
+
+    def test_no_scans_or_sorts(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite query plans")
+        call_command('seed_benchmark', students=2000, subjects=20, clear=True, stdout=io.StringIO())
+        reports = audit()
+        self.assertTrue(any(report.source.startswith('/admin/students/grade/') for report in reports))
+        self.assertEqual({report.source: report.problems for report in reports if report.problems}, {})
+        self.assertFalse(User.objects.exists()) # The audit's own writes are rolled back
+
+    def test_flags_scans_and_sorts(self):
+        sql = 'SELECT * FROM t WHERE a = 1 ORDER BY b'
+        self.assertEqual(
+            plan_problems(sql, [(0, 'SCAN t'), (0, 'USE TEMP B-TREE FOR ORDER BY')]),
+            ['SCAN t', 'USE TEMP B-TREE FOR ORDER BY'],
+        )
+        self.assertEqual(plan_problems('SELECT * FROM t ORDER BY a LIMIT 10', [(0, 'SCAN t USING INDEX t_a')]), [])
+        self.assertEqual(plan_problems('SELECT * FROM t, u', [(0, 'SCAN t'), (0, 'SCAN u')]), ['SCAN u'])
+
+
+class JobTests(StudentsAPITestCase):
+    """
+    Background jobs are queued over the API, run by run_workers and can be cancelled and retried.
+    """
+
+    def setUp(self):
+        super().setUp()
+        files = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, files)
+        settings = override_settings(JOB_FILES_DIR=files)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.math = Subject.objects.create(name="Math", code="MATH")
+        create_students(3, [self.math])
+
+    def work(self):
+        call_command('run_workers', processes=0, burst=True, stdout=io.StringIO())
+
+    def job(self, pk):
+        response = self.client.get(f'/api/jobs/{pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_import(self):
+        content = b"student_id,code,activity_grade,quiz_grade,exam_grade\nS00000,MATH,90,80,70\nS99999,MATH,1,2,3\n"
+        upload = SimpleUploadedFile('grades.csv', content, content_type='text/csv')
+        response = self.client.post('/api/jobs/', {'kind': 'import_grades', 'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertTrue(response['Location'].endswith(f"/api/jobs/{response.data['id']}/"))
+        self.work()
+        job = self.job(response.data['id'])
+        self.assertEqual((job['status'], job['percent'], job['attempts']), ('succeeded', 100.0, 1))
+        self.assertEqual((job['result']['imported'], job['result']['error_count']), (1, 1))
+        self.assertEqual(Grade.objects.get(enrollment__student__student_id='S00000').total_grade, 80)
+        self.assertEqual(Job.objects.get().input_file, '') # Removed once it succeeded
+
+    def test_export(self):
+        response = self.client.post('/api/jobs/', {'kind': 'export', 'export': 'gradebook', 'subject': self.math.pk}, format='json')
+        self.work()
+        job = self.job(response.data['id'])
+        self.assertEqual((job['status'], job['progress'], job['total']), ('succeeded', 3, 3))
+        download = self.client.get(job['download'])
+        self.assertEqual(download['Content-Disposition'], 'attachment; filename="gradebook-MATH.csv"')
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(self.client.delete(f"/api/jobs/{job['id']}/").status_code, 204)
+        self.assertEqual(os.listdir(settings.JOB_FILES_DIR), [])
+
+    def test_invalid_requests(self):
+        for payload in ({'kind': 'nope'}, {'kind': 'import_grades'}, {'kind': 'export', 'export': 'gradebook'}):
+            self.assertEqual(self.client.post('/api/jobs/', payload, format='json').status_code, 400, payload)
+
+    def test_recompute_cancel_and_retry(self):
+        Subject.objects.filter(pk=self.math.pk).update(exam_weight=2) # Bypasses the recompute signal
+        response = self.client.post('/api/jobs/', {'kind': 'recompute_totals', 'subject': self.math.pk}, format='json')
+        pk = response.data['id']
+        self.assertEqual(self.client.post(f'/api/jobs/{pk}/cancel/').data['status'], 'cancelled')
+        self.assertEqual(self.client.post(f'/api/jobs/{pk}/cancel/').status_code, 409)
+        self.work()
+        self.assertEqual(Grade.objects.filter(total_grade=Decimal('86.25')).count(), 0)
+        self.assertEqual(self.client.post(f'/api/jobs/{pk}/retry/').data['status'], 'queued')
+        self.work()
+        self.assertEqual(self.job(pk)['result'], {'updated': 3})
+        self.assertEqual(Grade.objects.filter(total_grade=Decimal('86.25')).count(), 3) # (80 + 85 + 2 * 90) / 4
+        self.assertEqual(self.client.post(f'/api/jobs/{pk}/retry/').status_code, 409)
+
+    def test_cancel_running(self):
+        job = jobs.enqueue('recompute_totals')
+        claimed = jobs.claim('test')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(jobs.claim('other')) # Nothing else queued
+        self.assertEqual(self.client.post(f'/api/jobs/{job.pk}/cancel/').data['status'], 'running')
+        self.assertEqual(jobs.run_job(claimed), Job.CANCELLED)
+
+    def test_failure_and_stale_workers(self):
+        upload = SimpleUploadedFile('grades.csv', b"student_id,code\nS00000,MATH\n", content_type='text/csv')
+        pk = self.client.post('/api/jobs/', {'kind': 'import_grades', 'file': upload}, format='multipart').data['id']
+        with self.assertLogs('students.jobs', 'ERROR'):
+            self.work()
+        job = self.job(pk)
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('CSV header is missing columns', job['error'])
+
+        # Retried, then its worker dies each time: requeued until MAX_ATTEMPTS runs, then failed
+        self.assertEqual(self.client.post(f'/api/jobs/{pk}/retry/').status_code, 202)
+        for status in ('queued', 'failed'):
+            jobs.claim('dead')
+            Job.objects.filter(pk=pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(jobs.release_stale(), 1)
+            self.assertEqual(self.job(pk)['status'], status)
+        self.assertEqual(self.job(pk)['attempts'], jobs.MAX_ATTEMPTS)
+
+
+@override_settings(PERF_MONITORING=True, PERF_SLOW_REQUEST_MS=10000, PERF_SLOW_QUERY_MS=10000, PERF_REPEATED_QUERY_THRESHOLD=3)
+class PerformanceTests(StudentsAPITestCase):
+    """
+    The performance middleware times requests, flags repeated queries and feeds the report.
+    """
+
+    def setUp(self):
+        super().setUp()
+        performance_stats.reset()
+        create_students(3, [Subject.objects.create(name="Mathematics", code="MATH101")])
+
+    def test_server_timing(self):
+        response = self.client.get('/api/students/')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="3 queries"', timing) # The scope versions, the page and its grades
+        self.assertIn('total;dur=', timing)
+
+    def test_disabled(self):
+        with override_settings(PERF_MONITORING=False):
+            response = APIClient().get('/api/students/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_sql_shape(self):
+        self.assertEqual(
+            sql_shape('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            sql_shape('SELECT "a" FROM "t" WHERE "id" IN (%s, %s) LIMIT 5'),
+        )
+        self.assertEqual(
+            sql_shape('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s)'),
+            sql_shape('INSERT INTO "t" ("a", "b") VALUES (%s, %s)'),
+        )
+
+    def test_repeated_queries_and_slow_requests(self):
+        def view(request):
+            for student in Student.objects.all():
+                student.enrollments.count() # One query per student
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/api/students/')
+        request.resolver_match = resolve('/api/students/')
+        with override_settings(PERF_SLOW_REQUEST_MS=0), self.assertLogs('students.performance', 'WARNING') as logs:
+            PerformanceMiddleware(view)(request)
+        output = '\n'.join(logs.output)
+        self.assertIn('Repeated query on GET student-list (3 times', output)
+        self.assertIn('Slow request: GET /api/students/', output)
+
+    def test_report(self):
+        self.client.get('/api/students/')
+        self.client.get('/api/students/')
+        self.assertEqual(self.client.get('/api/performance/').status_code, 403)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        report = self.client.get('/api/performance/').data
+        endpoint = next(row for row in report['endpoints'] if row['endpoint'] == 'GET student-list')
+        self.assertEqual(endpoint['requests'], 2)
+        self.assertEqual(endpoint['queries'], 4) # The second response came from the cache: only its versions were read
+        self.assertTrue(any('students_student' in row['sql'] for row in report['queries']))
+
+        self.assertEqual(self.client.post('/api/performance/reset/').status_code, 204)
+        endpoints = [row['endpoint'] for row in performance_stats.snapshot()['endpoints']]
+        self.assertEqual(endpoints, ['POST performance-reset']) # Only the reset request itself
+
+
+# URLconf for AsyncReadTests: the project URLs with the async read views mounted, as with ASYNC_READ_VIEWS
+urlpatterns = [path('api/', include('students.async_urls')), *project_urls.urlpatterns]
+
+
+class AsyncReadTests(APITransactionTestCase):
+    """
+    The async read views return exactly what the sync viewsets return, and hand everything else to them.
+    Their queries run on other threads' connections, which a TestCase transaction would hide the data from.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.math = Subject.objects.create(name="Mathematics", code="MATH101")
+        create_students(3, [self.math, Subject.objects.create(name="Biology", code="BIO101")])
+
+    def async_get(self, url, **headers):
+        with override_settings(ROOT_URLCONF=__name__):
+            return async_to_sync(self.async_client.get)(url, headers=headers)
+
+    def test_matches_sync_views(self):
+        student, enrollment, grade = Student.objects.first(), Enrollment.objects.first(), Grade.objects.first()
+        page = self.client.get('/api/students/?page_size=2').data
+        urls = [
+            '/api/students/', '/api/students/?page_size=2', page['next'].replace('http://testserver', ''),
+            f'/api/students/{student.pk}/', '/api/subjects/', f'/api/subjects/{self.math.pk}/',
+            '/api/enrollments/', f'/api/enrollments/{enrollment.pk}/', '/api/grades/', f'/api/grades/{grade.pk}/',
+            '/api/students/999999/', '/api/students/?fields=name,enrollments.grades&page_size=2',
+        ]
+        for url in urls:
+            cache.clear()
+            expected = self.client.get(url)
+            cache.clear()
+            response = self.async_get(url)
+            self.assertNotIn('Allow', response) # Served by the async view, not DRF
+            self.assertEqual(response.status_code, expected.status_code, url)
+            self.assertEqual(json.loads(response.content), json.loads(expected.content), url)
+
+    def test_shares_response_cache(self):
+        response = self.async_get('/api/subjects/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/subjects/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.async_get('/api/subjects/', if_none_match=response['ETag']).status_code, 304)
+        self.client.patch(f'/api/subjects/{self.math.pk}/', {'name': 'Algebra'}, format='json')
+        response = self.async_get('/api/subjects/', if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Algebra', [row['name'] for row in json.loads(response.content)])
+
+    def test_runs_on_read_executor(self):
+        threads = []
+        with mock.patch.object(async_views, 'close_old_connections', lambda: threads.append(threading.current_thread().name)):
+            self.assertEqual(self.async_get('/api/subjects/').status_code, 200)
+        self.assertEqual(len(threads), 2) # Before and after the read
+        self.assertTrue(all(name.startswith('async-read') for name in threads), threads)
+        self.assertEqual(async_views.read_executor()._max_workers, settings.ASYNC_READ_THREADS)
+
+    def test_falls_back_to_viewsets(self):
+        with override_settings(ROOT_URLCONF=__name__):
+            response = async_to_sync(self.async_client.post)(
+                '/api/subjects/', {'name': 'Physics', 'code': 'PHY101'}, content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.async_get('/api/students/search/?q=student').status_code, 200)
+        response = self.async_get('/api/subjects/', accept='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text/html', response['Content-Type']) # Browsable API
@@ -1,10 +1,43 @@
-from rest_framework import viewsets, status
+import codecs
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import FileResponse
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from .models import Student, Subject, Enrollment, Grade
-from .serializers import StudentSerializer, SubjectSerializer, EnrollmentSerializer, GradeSerializer
+from rest_framework.reverse import reverse
+from . import jobs
+from .analytics import subject_stats, grade_distribution, subject_rankings, student_ranking
+from .bulk import bulk_enroll, update_grades
+from .caching import CachedResponseMixin
+from .changes import CursorExpired, changes_since, latest_cursor
+from .exporters import EXPORT_FORMATS, export_response, student_rows, enrollment_rows, gradebook_rows
+from .fieldsets import FieldSelectionMixin
+from .importers import ImportFormatError, detect_format, import_grades
+from .models import Student, Subject, Enrollment, Grade, StudentSummary, SubjectSummary, Job
+from .performance import stats as performance_stats
+from .search import search as search_index
+from .serializers import (
+    StudentSerializer, SubjectSerializer, EnrollmentSerializer, GradeSerializer, BulkEnrollmentSerializer, GradeBatchSerializer,
+    AnalyticsQuerySerializer, SummarySerializer, ChangeFeedQuerySerializer, SearchQuerySerializer,
+    PerformanceQuerySerializer, GradingPolicySerializer, JobSerializer, JobRequestSerializer,
+)
+
+
+# Shared by the search actions of StudentViewSet and SubjectViewSet
+def search_response(request, model):
+    """
+    Validates ?q=&limit= and returns the indexed search results for `model`.
+    """
+    params = SearchQuerySerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    return Response(search_index(model, params.validated_data['q'], params.validated_data['limit']))
+
 
 # ViewSet for Student model - provides CRUD for students
-class StudentViewSet(viewsets.ModelViewSet):
+class StudentViewSet(CachedResponseMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows students to be viewed or edited.
     Supports GET, POST, PUT, PATCH, DELETE operations.
@@ -12,29 +45,186 @@ class StudentViewSet(viewsets.ModelViewSet):
     """
     queryset = Student.objects.all().order_by('name') # Order students by name
     serializer_class = StudentSerializer
+    cache_scope, detail_scope = 'students', 'student' # Response cache scopes, see caching.py
+
+    def get_queryset(self):
+        """
+        Loads the nested enrollments -> subject/grades graph in a fixed number of queries.
+        Deleting a student never serializes it, so no related rows are fetched then;
+        neither are the parts of the graph left out by ?fields= or ?expand=.
+        """
+        queryset = super().get_queryset()
+        if self.action == 'destroy' or not self.selects('enrollments'):
+            return queryset
+        # One extra query for all enrollments, joined to their subject and grade rows
+        related = [
+            relation for relation, field in (('subject', 'subject_details'), ('grades', 'grades'))
+            if self.selects('enrollments', field)
+        ]
+        return queryset.prefetch_related(
+            # Ordered by id within each student; student_id first lets its index supply that order
+            Prefetch('enrollments', queryset=Enrollment.objects.select_related(*related).order_by('student_id', 'pk'))
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Streams every student as CSV (default) or NDJSON (?file_format=ndjson).
+        """
+        columns, rows = student_rows()
+        return export_response('students', columns, rows, request.query_params.get('file_format'))
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Prefix search over name, student_id and email: /api/students/search/?q=jo&limit=10
+        """
+        return search_response(request, Student)
+
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """
+        Enrollment count and grade averages (GPA) for the student, read from StudentSummary.
+        """
+        summary = StudentSummary.objects.filter(student_id=pk).first()
+        if summary is None:
+            self.get_object() # 404 for unknown ids; otherwise nothing has been recorded yet
+            summary = StudentSummary()
+        return Response(SummarySerializer(summary).data)
 
 # ViewSet for Subject model - provides CRUD for subjects
-class SubjectViewSet(viewsets.ModelViewSet):
+class SubjectViewSet(CachedResponseMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows subjects to be viewed or edited.
     Supports GET, POST, PUT, PATCH, DELETE operations.
     """
     queryset = Subject.objects.all().order_by('name') # Order subjects by name
     serializer_class = SubjectSerializer
+    cache_scope, detail_scope = 'subjects', 'subject' # Response cache scopes, see caching.py
+
+    @action(detail=True, methods=['get'])
+    def gradebook(self, request, pk=None):
+        """
+        Streams the subject's gradebook (one row per enrolled student) as CSV or NDJSON.
+        """
+        subject = self.get_object()
+        columns, rows = gradebook_rows(subject)
+        return export_response(f'gradebook-{subject.code}', columns, rows, request.query_params.get('file_format'))
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Prefix search over subject name and code: /api/subjects/search/?q=mat
+        """
+        return search_response(request, Subject)
+
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """
+        Enrollment count and grade averages for the subject, read from SubjectSummary.
+        """
+        summary = SubjectSummary.objects.filter(subject_id=pk).first()
+        if summary is None:
+            self.get_object() # 404 for unknown ids; otherwise nothing has been recorded yet
+            summary = SubjectSummary()
+        return Response(SummarySerializer(summary).data)
+
+    @action(detail=True, methods=['get', 'put', 'patch'])
+    def policy(self, request, pk=None):
+        """
+        The subject's grading policy: component weights, rounding of totals and passing grade.
+        Changing the weights or rounding recomputes every total_grade of the subject in SQL.
+        """
+        subject = self.get_object()
+        if request.method == 'GET':
+            return Response(GradingPolicySerializer(subject).data)
+        serializer = GradingPolicySerializer(subject, data=request.data, partial=request.method == 'PATCH')
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    def get_analytics_params(self):
+        """
+        Validates the query parameters shared by the analytics actions.
+        """
+        params = AnalyticsQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data
+
+    @action(detail=False, methods=['get'], url_path='stats')
+    def stats_list(self, request):
+        """
+        Per-subject grade statistics (mean/median/min/max/stddev, pass rate) for every subject.
+        Pass rates use each subject's passing grade unless ?passing_grade= is given.
+        """
+        params = self.get_analytics_params()
+        return Response(subject_stats(passing_grade=params.get('passing_grade')))
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Grade statistics for a single subject.
+        """
+        subject = self.get_object()
+        params = self.get_analytics_params()
+        results = subject_stats([subject.pk], passing_grade=params.get('passing_grade'))
+        return Response(results[0] if results else {'subject': subject.pk, 'count': 0})
+
+    @action(detail=True, methods=['get'])
+    def distribution(self, request, pk=None):
+        """
+        Histogram of one grade component (?field=, default total_grade) in ?bucket_size= wide buckets.
+        """
+        subject = self.get_object()
+        params = self.get_analytics_params()
+        return Response(grade_distribution(subject.pk, params['field'], params['bucket_size']))
+
+    @action(detail=True, methods=['get'])
+    def rankings(self, request, pk=None):
+        """
+        Students ranked by total grade with their percentile. Use ?limit= for the top N,
+        or ?student=<id> for one student's position.
+        """
+        subject = self.get_object()
+        params = self.get_analytics_params()
+        if 'student' in params:
+            ranking = student_ranking(subject.pk, params['student'])
+            if ranking is None:
+                return Response({'detail': 'Student is not enrolled in this subject.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(ranking)
+        return Response(subject_rankings(subject.pk, limit=params.get('limit')))
 
 # ViewSet for Enrollment model - provides CRUD for student-subject enrollments
-class EnrollmentViewSet(viewsets.ModelViewSet):
+class EnrollmentViewSet(CachedResponseMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows enrollments to be viewed or edited.
     Supports GET, POST, PUT, PATCH, DELETE operations.
     When creating an enrollment, ensure student_id and subject_id exist.
     """
-    queryset = Enrollment.objects.all().order_by('student__name') # Order enrollments by student name
+    # Ordered by student name; the student number and subject make the order total, so the
+    # database can walk students by name and each one's enrollments by index, without sorting.
+    queryset = Enrollment.objects.all().order_by('student__name', 'student__student_id', 'subject_id')
     serializer_class = EnrollmentSerializer
+    cache_scope, detail_scope = 'enrollments', 'enrollment' # Response cache scopes, see caching.py
+
+    def get_queryset(self):
+        """
+        Joins the subject and grade rows that EnrollmentSerializer renders for each enrollment,
+        unless ?fields= or ?expand= leaves them out.
+        """
+        queryset = super().get_queryset()
+        if self.action == 'destroy':
+            return queryset
+        return queryset.select_related(*[
+            relation for relation, field in (('subject', 'subject_details'), ('grades', 'grades'))
+            if self.selects(field)
+        ])
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
         """
         Custom create method to handle creating a Grade object along with the Enrollment.
+        Both rows are written in one transaction.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -47,12 +237,208 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Streams all enrollments with their student, subject and grades as CSV or NDJSON.
+        """
+        columns, rows = enrollment_rows()
+        return export_response('enrollments', columns, rows, request.query_params.get('file_format'))
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Creates many enrollments (and their zeroed grades) in one transaction.
+        Accepts a list of {student, subject} pairs, or a subject with a list of students.
+        Pairs that fail validation are returned in 'conflicts' without aborting the batch.
+        """
+        data = {'enrollments': request.data} if isinstance(request.data, list) else request.data
+        serializer = BulkEnrollmentSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        created, conflicts = bulk_enroll(serializer.validated_data['pairs'])
+        return Response({
+            'created': len(created),
+            'enrollments': [
+                {'id': e.id, 'student': e.student_id, 'subject': e.subject_id} for e in created
+            ],
+            'conflicts': conflicts,
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
 # ViewSet for Grade model - provides CRUD for grades
-class GradeViewSet(viewsets.ModelViewSet):
+class GradeViewSet(CachedResponseMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows grades to be viewed or edited.
     Supports GET, POST, PUT, PATCH, DELETE operations.
     Note: Grades are typically tied to an Enrollment.
     """
-    queryset = Grade.objects.all().order_by('enrollment__student__name') # Order grades by student name
-    serializer_class = GradeSerializer
\ No newline at end of file
+    # Ordered like the enrollments: by student name, student number and subject
+    queryset = Grade.objects.all().order_by(
+        'enrollment__student__name', 'enrollment__student__student_id', 'enrollment__subject_id',
+    )
+    serializer_class = GradeSerializer
+    cache_scope, detail_scope = 'grades', 'grade' # Response cache scopes, see caching.py
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Changes many grades in one transaction: each entry gives a grade id, the version
+        the client last saw and new component grades. Returns the updated grades with
+        their new total_grade and version. If any grade was changed meanwhile (or deleted),
+        nothing is saved and 409 lists the conflicts with the grades' current values.
+        The changes can also be sent as a bare list.
+        """
+        data = {'grades': request.data} if isinstance(request.data, list) else request.data
+        serializer = GradeBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        updated, conflicts = update_grades(serializer.validated_data['grades'])
+        if conflicts:
+            for conflict in conflicts:
+                if conflict['current'] is not None:
+                    conflict['current'] = GradeSerializer(conflict['current']).data
+            return Response({
+                'detail': "Some grades were changed by someone else; nothing was saved.", 'conflicts': conflicts,
+            }, status=status.HTTP_409_CONFLICT)
+        return Response({'updated': len(updated), 'grades': GradeSerializer(updated, many=True).data})
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_file(self, request):
+        """
+        Imports grades from an uploaded CSV or NDJSON file (multipart field 'file').
+        The format is taken from the 'file_format' field or guessed from the file name.
+        The upload is decoded and parsed line by line, then upserted in batches.
+        The rows can also be sent as the body itself: a list of row objects in JSON or
+        MessagePack, or columns in the columnar format.
+        """
+        if isinstance(request.data, list):
+            return Response(import_grades(request.data, 'records'))
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': "Upload the grades as a 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('file_format') or detect_format(upload.name)
+        try:
+            result = import_grades(codecs.iterdecode(upload, 'utf-8-sig'), file_format)
+        except (ImportFormatError, UnicodeDecodeError) as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+# ViewSet for the change feed - read-only delta sync for the four models above
+class ChangeFeedViewSet(viewsets.ViewSet):
+    """
+    API endpoint returning the rows created, updated or deleted after a cursor.
+    GET /api/changes/?since=<cursor>&limit=<n> returns the new cursor, whether more
+    changes are pending and one entry per changed row (its current data, or a delete).
+    Start with GET /api/changes/latest/ right after downloading the full lists.
+    """
+
+    def list(self, request):
+        params = ChangeFeedQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        try:
+            feed = changes_since(params.validated_data['since'], params.validated_data['limit'])
+        except CursorExpired:
+            return Response(
+                {'detail': 'Changes after this cursor were pruned; download the full lists again.',
+                 'cursor': latest_cursor()},
+                status=status.HTTP_410_GONE,
+            )
+        return Response(feed)
+
+    @action(detail=False, methods=['get'])
+    def latest(self, request):
+        """
+        Returns the newest cursor.
+        """
+        return Response({'cursor': latest_cursor()})
+
+
+# ViewSet for the performance report - staff only, since it exposes SQL
+class PerformanceViewSet(viewsets.ViewSet):
+    """
+    API endpoint reporting the slowest endpoints and SQL shapes by cumulative time,
+    as collected by PerformanceMiddleware (PERF_MONITORING) in this worker process.
+    GET /api/performance/?limit=<n> returns the report; POST /api/performance/reset/ clears it.
+    """
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        params = PerformanceQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(performance_stats.snapshot(params.validated_data['limit']))
+
+    @action(detail=False, methods=['post'])
+    def reset(self, request):
+        performance_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# ViewSet for background jobs - long imports, exports and recomputations run by `manage.py run_workers`
+class JobViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    API endpoint for queueing background jobs and following them.
+    POST /api/jobs/ queues one and answers 202 with the job; GET /api/jobs/<id>/ reports
+    its status and progress. Jobs can be cancelled, retried once failed or cancelled,
+    and deleted with their files once finished. A finished export is downloaded from
+    /api/jobs/<id>/download/.
+    """
+    queryset = Job.objects.all().order_by('-id') # Newest first
+    serializer_class = JobSerializer
+
+    def create(self, request, *args, **kwargs):
+        """
+        Queues a job: kind=import_grades with a 'file' upload (and optional file_format),
+        kind=export with export=students|enrollments|gradebook (a gradebook needs a subject)
+        and file_format=csv|ndjson, or kind=recompute_totals for one subject or all grades.
+        """
+        serializer = JobRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        upload = data['file']
+        job = jobs.enqueue(data['kind'], data['params'], jobs.save_input(upload) if upload else '')
+        data = self.get_serializer(job).data
+        headers = {'Location': reverse('job-detail', args=[job.pk], request=request)}
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+    def destroy(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status not in Job.FINISHED:
+            return Response({'detail': 'Cancel the job before deleting it.'}, status=status.HTTP_409_CONFLICT)
+        jobs.remove_files(job.input_file, job.output_file)
+        job.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """
+        Cancels a queued job; a running job stops at its next progress report.
+        """
+        job = self.get_object()
+        if not jobs.cancel(job.pk):
+            return Response({'detail': 'The job has already finished.'}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['post'])
+    def retry(self, request, pk=None):
+        """
+        Queues a failed or cancelled job again with the same parameters and upload.
+        """
+        job = self.get_object()
+        if not jobs.retry(job.pk):
+            return Response({'detail': 'Only failed or cancelled jobs can be retried.'}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Sends the file written by a finished export job.
+        """
+        job = self.get_object()
+        if not job.output_file:
+            return Response({'detail': 'This job has no file to download.'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            open(jobs.job_path(job.output_file), 'rb'), as_attachment=True, filename=job.result['filename'],
+            content_type=EXPORT_FORMATS[job.result['file_format']],
+        )